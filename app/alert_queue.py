@@ -0,0 +1,324 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Optional
+
+from app.alerts import (
+    ActiveAlert,
+    alert_coordinator,
+    resolve_alert_devices,
+    schedule_alert,
+    schedule_alert_pattern,
+    schedule_alert_rainbow,
+)
+from app.colors import hex_to_yandex_rgb
+from app.config import (
+    get_alert_color_hex,
+    get_alert_color_hex_2,
+    get_alert_duration_sec,
+    get_alert_queue_full_policy,
+    get_alert_queue_max_depth,
+    get_alert_queue_workers,
+)
+from app.events import event_bus
+from app.metrics import ALERT_QUEUE_BUSY, ALERT_QUEUE_DEPTH
+from app.patterns import Pattern
+
+logger = logging.getLogger("iot-alert")
+
+
+class AlertQueueFull(Exception):
+    """Raised when the queue is full and the policy is to drop new alerts."""
+
+
+def validate_alert_params(kind: str, params: dict) -> None:
+    """
+    Raise ValueError for parameters the worker would fail on, so a bad
+    request is rejected up front whether or not its lamps are busy.
+    Missing colors are checked as the configured defaults they become.
+    """
+    if kind == "pattern":
+        pattern = params.get("pattern")
+        if not isinstance(pattern, Pattern) or not pattern.frames:
+            raise ValueError("pattern alert needs a non-empty Pattern")
+        colors = [frame.color_hex for frame in pattern.frames if frame.color_hex is not None]
+    elif kind == "rainbow":
+        colors = [
+            params.get("color_hex") or get_alert_color_hex(),
+            params.get("color_hex_2") or get_alert_color_hex_2(),
+        ]
+    elif kind == "single":
+        colors = [params.get("color_hex") or get_alert_color_hex()]
+    else:
+        raise ValueError(f"Unknown alert kind: {kind}")
+    for color in colors:
+        hex_to_yandex_rgb(color)
+
+
+@dataclass
+class AlertJob:
+    """Alert request waiting for a worker."""
+    kind: str
+    device_ids: list[str]
+    duration_sec: float
+    params: dict
+    alert_id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+    enqueued_at: float = field(default_factory=time.monotonic)
+    merged_count: int = 0
+    cancelled: bool = False
+    source: str = "direct"
+
+    def extend(self, duration_sec: float, device_ids: Optional[list[str]] = None) -> None:
+        self.duration_sec = max(self.duration_sec, duration_sec)
+        for device_id in device_ids or ():
+            if device_id not in self.device_ids:
+                self.device_ids.append(device_id)
+        self.merged_count += 1
+
+    def to_dict(self) -> dict:
+        return {
+            "alert_id": self.alert_id,
+            "kind": self.kind,
+            "device_ids": self.device_ids,
+            "duration_sec": self.duration_sec,
+            "merged_count": self.merged_count,
+            "source": self.source,
+            "waiting_sec": round(time.monotonic() - self.enqueued_at, 3),
+        }
+
+
+@dataclass
+class QueueStats:
+    enqueued: int = 0
+    merged: int = 0
+    dropped: int = 0
+    started: int = 0
+    failed: int = 0
+    wait_total_sec: float = 0.0
+    wait_max_sec: float = 0.0
+    wait_last_sec: float = 0.0
+
+    def record_wait(self, wait_sec: float) -> None:
+        self.started += 1
+        self.wait_total_sec += wait_sec
+        self.wait_max_sec = max(self.wait_max_sec, wait_sec)
+        self.wait_last_sec = wait_sec
+
+
+class AlertQueue:
+    """
+    Bounded in-process queue in front of the alert coordinator.
+    A fixed pool of workers runs alerts, so a burst of requests waits
+    (or merges) instead of starting unlimited lamp loops. A request for
+    lamps that are already alerting or already queued merges into that
+    alert; when the queue is full the policy decides between merging into
+    the newest queued job (its lamps become the union of both) and raising
+    AlertQueueFull.
+    """
+
+    def __init__(
+        self,
+        max_depth: Optional[int] = None,
+        workers: Optional[int] = None,
+        full_policy: Optional[str] = None,
+    ) -> None:
+        self._max_depth = max_depth
+        self._workers_count = workers
+        self._full_policy = full_policy
+        self._pending: deque[AlertJob] = deque()
+        self._wakeup: Optional[asyncio.Condition] = None
+        self._workers: list[asyncio.Task] = []
+        self._stopping = False
+        self.busy_workers = 0
+        self.stats = QueueStats()
+
+    @property
+    def max_depth(self) -> int:
+        return self._max_depth or get_alert_queue_max_depth()
+
+    @property
+    def full_policy(self) -> str:
+        return self._full_policy or get_alert_queue_full_policy()
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    async def start(self) -> None:
+        self._wakeup = asyncio.Condition()
+        self._stopping = False
+        count = self._workers_count or get_alert_queue_workers()
+        self._workers = [
+            asyncio.create_task(self._worker(index)) for index in range(count)
+        ]
+        logger.info("alert queue: %d workers, max depth %d", count, self.max_depth)
+
+    async def stop(self) -> None:
+        self._stopping = True
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def submit(
+        self,
+        kind: str,
+        duration_sec: Optional[int] = None,
+        device_ids: Optional[list[str]] = None,
+        group: Optional[str] = None,
+        source: str = "direct",
+        **params,
+    ) -> tuple[str, str]:
+        """
+        Enqueue an alert. Returns (status, alert_id) where status is
+        "queued" or "merged". `source` names the trigger (api, telegram)
+        for the alert history. Raises AlertQueueFull (drop policy),
+        ValueError for bad parameters (see validate_alert_params) and
+        ValueError/KeyError for bad targets.
+        """
+        if self._wakeup is None:
+            raise RuntimeError("alert queue is not started")
+        validate_alert_params(kind, params)
+        targets = await resolve_alert_devices(device_ids, group)
+        duration = duration_sec or get_alert_duration_sec()
+
+        # No await between the check and the merge: an alert that finishes
+        # in between would otherwise be started here, past the workers.
+        alert = alert_coordinator.try_merge(kind, duration, targets)
+        if alert is not None:
+            self.stats.merged += 1
+            return "merged", alert.alert_id
+
+        for job in self._pending:
+            if set(targets) <= set(job.device_ids):
+                job.extend(duration)
+                self.stats.merged += 1
+                return "merged", job.alert_id
+
+        if self.depth >= self.max_depth:
+            if self.full_policy == "merge" and self._pending:
+                job = self._pending[-1]
+                job.extend(duration, targets)
+                self.stats.merged += 1
+                logger.warning("alert queue full, merged into %s", job.alert_id)
+                return "merged", job.alert_id
+            self.stats.dropped += 1
+            logger.warning("alert queue full (%d), dropping %s alert", self.depth, kind)
+            raise AlertQueueFull(f"alert queue is full ({self.depth})")
+
+        job = AlertJob(
+            kind=kind, device_ids=targets, duration_sec=duration, params=params, source=source
+        )
+        self._pending.append(job)
+        self.stats.enqueued += 1
+        event_bus.publish("alert.queued", job.to_dict())
+        async with self._wakeup:
+            self._wakeup.notify()
+        return "queued", job.alert_id
+
+    def cancel(self, alert_id: str) -> Optional[AlertJob]:
+        """Drop a job that is still waiting; returns None if not queued."""
+        for job in self._pending:
+            if job.alert_id == alert_id:
+                job.cancelled = True
+                self._pending.remove(job)
+                event_bus.publish("alert.cancelled", job.to_dict())
+                return job
+        return None
+
+    def extend(self, alert_id: str, duration_sec: Optional[float] = None) -> bool:
+        """
+        Make a queued or running alert last at least duration_sec (from now
+        once it runs) without submitting a new request. Returns False when
+        the alert is no longer queued or running.
+        """
+        duration = duration_sec or get_alert_duration_sec()
+        for job in self._pending:
+            if job.alert_id == alert_id:
+                job.extend(duration)
+                self.stats.merged += 1
+                return True
+        alert = alert_coordinator.find(alert_id)
+        if alert is None or alert.finishing:
+            return False
+        alert.extend(duration)
+        self.stats.merged += 1
+        event_bus.publish("alert.merged", alert.to_dict())
+        return True
+
+    def snapshot(self) -> dict:
+        stats = self.stats
+        return {
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "full_policy": self.full_policy,
+            "workers": len(self._workers),
+            "busy_workers": self.busy_workers,
+            "enqueued": stats.enqueued,
+            "merged": stats.merged,
+            "dropped": stats.dropped,
+            "started": stats.started,
+            "failed": stats.failed,
+            "wait_avg_sec": (
+                round(stats.wait_total_sec / stats.started, 3) if stats.started else 0.0
+            ),
+            "wait_max_sec": round(stats.wait_max_sec, 3),
+            "wait_last_sec": round(stats.wait_last_sec, 3),
+            "pending": [job.to_dict() for job in self._pending],
+        }
+
+    async def _schedule(
+        self,
+        kind: str,
+        device_ids: list[str],
+        duration: float,
+        params: dict,
+        alert_id: Optional[str] = None,
+        source: str = "direct",
+    ) -> tuple[ActiveAlert, bool]:
+        if kind == "rainbow":
+            return await schedule_alert_rainbow(
+                params.get("color_hex"), params.get("color_hex_2"), duration,
+                device_ids, alert_id=alert_id, source=source,
+            )
+        if kind == "pattern":
+            return await schedule_alert_pattern(
+                params["pattern"], duration, device_ids, alert_id=alert_id, source=source,
+            )
+        return await schedule_alert(
+            params.get("color_hex"), duration, device_ids, alert_id=alert_id, source=source,
+        )
+
+    async def _worker(self, index: int) -> None:
+        # Not just `while True`: a cancellation that races with the alert
+        # finishing can be swallowed (asyncio.wait_for on 3.11), and the
+        # worker must not go back to waiting once stop() was called.
+        while not self._stopping:
+            async with self._wakeup:
+                await self._wakeup.wait_for(lambda: bool(self._pending))
+                job = self._pending.popleft()
+
+            self.stats.record_wait(time.monotonic() - job.enqueued_at)
+            self.busy_workers += 1
+            try:
+                alert, merged = await self._schedule(
+                    job.kind, job.device_ids, job.duration_sec, job.params, job.alert_id,
+                    source=job.source,
+                )
+                if not merged:
+                    await alert.task
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.stats.failed += 1
+                logger.exception("alert %s failed in worker %d", job.alert_id, index)
+            finally:
+                self.busy_workers -= 1
+
+
+alert_queue = AlertQueue()
+ALERT_QUEUE_DEPTH.set_function(lambda: alert_queue.depth)
+ALERT_QUEUE_BUSY.set_function(lambda: alert_queue.busy_workers)
@@ -1,179 +1,924 @@
+import asyncio
 import logging
 import time
-from dataclasses import dataclass
+import uuid
+from collections import deque
+from dataclasses import dataclass, field, replace
 from typing import Optional
 
+import httpx
+
+from app.colors import hex_to_yandex_rgb
 from app.config import (
     get_alert_blink_interval_sec,
-    get_alert_color_hex,
-    get_alert_color_hex_2,
-    get_alert_duration_sec,
+    get_alert_device_group,
+    get_alert_device_ids,
+    get_iot_device_id,
+    get_settings,
 )
+from app.events import event_bus
+from app.history import alert_history
+from app.inventory import load_inventory
 from app.iot_client import (
-    get_brightness_value,
-    get_device_status,
-    get_color_model,
-    get_color_state,
-    hex_to_yandex_rgb,
-    is_device_available,
-    is_device_on,
-    restore_color_state,
-    set_color_rgb_int,
-    set_brightness,
-    turn_off,
-    turn_on,
+    NO_RETRY,
+    RETRY_STATUSES,
+    DeviceSnapshot,
+    color_action,
+    device_state_actions,
+    device_state_cache,
+    get_restore_retry_policy,
+    snapshot_from_status,
+)
+from app.iot_client_async import (
+    ApiCallStats,
+    apply_device_states,
+    get_device_status_by_id,
+    run_blocking,
+    send_device_actions,
+    track_api_calls,
 )
+from app.metrics import ALERT_BLINK_RATE, ALERT_SECONDS, ALERTS, ALERTS_ACTIVE
+from app.patterns import CompiledPattern, Pattern, blink, compile_pattern
+from app.rate_limit import RateLimited
+from app.tracing import trace_id_for, tracer
 
 logger = logging.getLogger("iot-alert")
 
+# Upper bound for the adaptive blink slowdown (multiples of the interval).
+MAX_TICK_STRIDE = 8
+
 
 @dataclass
-class DeviceSnapshot:
-    available: bool
-    was_on: bool
-    color_state: Optional[dict]
-    color_model: Optional[str]
-    brightness: Optional[int]
+class BlinkStats:
+    """Requested vs achieved blink rate of one alert."""
+    requested_interval_sec: float
+    ticks_sent: int = 0
+    ticks_skipped: int = 0
+    ticks_throttled: int = 0
+    elapsed_sec: float = 0.0
+    # When the first and the last delivered tick completed, from the start.
+    first_tick_sec: float = 0.0
+    last_tick_sec: float = 0.0
+
+    @property
+    def requested_rate_hz(self) -> float:
+        return 1.0 / self.requested_interval_sec
+
+    @property
+    def achieved_rate_hz(self) -> float:
+        """
+        Delivered ticks per second between the first and the last one:
+        n ticks make n - 1 intervals, and the time after the last tick
+        (the alert tail) is not a blink.
+        """
+        span = self.last_tick_sec - self.first_tick_sec
+        if self.ticks_sent < 2 or span <= 0:
+            return 0.0
+        return (self.ticks_sent - 1) / span
+
+    def to_dict(self) -> dict:
+        return {
+            "requested_interval_sec": self.requested_interval_sec,
+            "requested_rate_hz": round(self.requested_rate_hz, 3),
+            "achieved_rate_hz": round(self.achieved_rate_hz, 3),
+            "ticks_sent": self.ticks_sent,
+            "ticks_skipped": self.ticks_skipped,
+            "ticks_throttled": self.ticks_throttled,
+            "elapsed_sec": round(self.elapsed_sec, 3),
+        }
 
 
-def remember_device_state() -> DeviceSnapshot:
+@dataclass
+class AlertResult:
+    """Outcome of a finished alert."""
+    alert_id: str
+    device_ids: list[str]
+    kind: str
+    status: str
+    duration_sec: float
+    elapsed_sec: float
+    offline_device_ids: list[str] = field(default_factory=list)
+    blink: Optional[BlinkStats] = None
+    source: str = "direct"
+    started_at: float = 0.0
+    ended_at: float = 0.0
+    merged_count: int = 0
+    api_calls: Optional[ApiCallStats] = None
+
+    def to_dict(self) -> dict:
+        api_calls = self.api_calls or ApiCallStats()
+        return {
+            "alert_id": self.alert_id,
+            "device_ids": self.device_ids,
+            "offline_device_ids": self.offline_device_ids,
+            "kind": self.kind,
+            "source": self.source,
+            "status": self.status,
+            "duration_sec": self.duration_sec,
+            "elapsed_sec": round(self.elapsed_sec, 3),
+            "started_at": self.started_at,
+            "ended_at": self.ended_at,
+            "merged_count": self.merged_count,
+            "api_calls": api_calls.calls,
+            "api_errors": api_calls.errors,
+            "api_latency_ms": round(api_calls.latency_sec * 1000, 1),
+            "blink": self.blink.to_dict() if self.blink else None,
+        }
+
+    def to_record(self) -> dict:
+        """Row for the alert history store."""
+        data = self.to_dict()
+        data["details"] = {
+            key: data.pop(key)
+            for key in ("offline_device_ids", "elapsed_sec", "merged_count", "blink")
+        }
+        return data
+
+
+async def remember_device_states_async(device_ids: list[str]) -> dict[str, DeviceSnapshot]:
     """
-    Capture device state:
-    - availability (online)
-    - whether it was on
-    - original color
-    """
-    status = get_device_status()
-    available = is_device_available(status)
-    was_on = is_device_on(status)
-    color_state = get_color_state(status)
-    color_model = get_color_model(status)
-    brightness = get_brightness_value(status)
-
-    snapshot = DeviceSnapshot(
-        available=available,
-        was_on=was_on,
-        color_state=color_state,
-        color_model=color_model,
-        brightness=brightness,
-    )
+    Snapshot several devices with as few API calls as possible:
+    fresh cached statuses first, then one /user/info inventory read when
+    more than one device is missing, then per-device reads for the rest.
+    """
+    statuses = {device_id: device_state_cache.get(device_id) for device_id in device_ids}
+    missing = [device_id for device_id, status in statuses.items() if status is None]
+
+    if len(missing) > 1:
+        # Never the cached inventory: it may have been read in the middle
+        # of an earlier alert, with the lamps in the alert colors.
+        inventory = await load_inventory(use_cache=False)
+        for device_id in missing:
+            device = inventory.get(device_id)
+            status = device.to_status() if device else None
+            if status is not None:
+                device_state_cache.put(device_id, status)
+            statuses[device_id] = status
+        missing = [device_id for device_id, status in statuses.items() if status is None]
+
+    if missing:
+        fetched = await asyncio.gather(*(get_device_status_by_id(d) for d in missing))
+        statuses.update(zip(missing, fetched))
+
+    snapshots = {}
+    for device_id in device_ids:
+        snapshots[device_id] = snapshot_from_status(statuses[device_id])
+        logger.info("snapshot %s: %s", device_id, snapshots[device_id])
+    return snapshots
+
+
+async def remember_device_state_async() -> DeviceSnapshot:
+    """Snapshot the configured device."""
+    device_id = get_iot_device_id()
+    return (await remember_device_states_async([device_id]))[device_id]
+
+
+async def resolve_alert_devices(
+    device_ids: Optional[list[str]] = None,
+    group: Optional[str] = None,
+) -> list[str]:
+    """
+    Lamps an alert targets: explicit IDs, else a device group (ID or name,
+    resolved through the inventory), else the configured defaults.
+    """
+    if device_ids:
+        return list(dict.fromkeys(device_ids))
+
+    group = group or get_alert_device_group()
+    if group:
+        inventory = await load_inventory()
+        group_id = group if group in inventory.by_group else next(
+            (gid for gid, name in inventory.group_names.items() if name == group),
+            None,
+        )
+        if group_id is None or not inventory.by_group.get(group_id):
+            raise ValueError(f"Unknown or empty device group: {group}")
+        return list(inventory.by_group[group_id])
 
-    logger.info("snapshot: %s", snapshot)
-    return snapshot
+    return get_alert_device_ids()
 
 
-def run_alert(
-    color_hex: Optional[str] = None,
-    duration_sec: Optional[int] = None,
-) -> None:
+def _alert_state(snapshot: DeviceSnapshot, rgb_value: Optional[int]) -> DeviceSnapshot:
+    """Target state of a lamp during an alert: on, optionally with the alert color."""
+    color_state = None
+    if rgb_value is not None:
+        color_state = color_action(rgb_value, snapshot.color_model)["state"]
+    return replace(snapshot, was_on=True, color_state=color_state, brightness=None)
+
+
+def _known_state(snapshot: DeviceSnapshot, touches: frozenset) -> Optional[DeviceSnapshot]:
     """
-    Flow:
-      1. Remember state.
-      2. If offline -> log and exit.
-      3. If lamp was off -> turn on.
-      4. Set alert color, wait.
-      5. Restore original color.
-      6. If it was off -> turn off again.
+    What a lamp is known to look like while the alert body runs: on, color
+    unknown, and brightness/power unknown too if the body changes them.
+    """
+    if "on" in touches:
+        return None
+    brightness = None if "brightness" in touches else snapshot.brightness
+    return replace(snapshot, was_on=True, color_state=None, brightness=brightness)
+
+
+async def _restore_device_states(
+    snapshots: dict[str, DeviceSnapshot],
+    current: Optional[dict[str, Optional[DeviceSnapshot]]] = None,
+) -> bool:
+    """
+    Put lamps back into their snapshot state with one multi-capability
+    request (only what differs from `current`), using the restore retry
+    budget. If that request still fails, every action is retried on its
+    own, so one rejected capability does not leave the rest of the lamp
+    in the alert state. The whole restore, step-by-step retries included,
+    shares one IOT_RESTORE_RETRY_DEADLINE_SEC budget. Returns False if
+    anything could not be restored.
+    """
+    retry = get_restore_retry_policy()
+    deadline = time.monotonic() + retry.deadline_sec
+    device_actions = device_state_actions(snapshots, current)
+    if not device_actions:
+        return True
+    logger.info("Restoring original state: %s", device_actions)
+    try:
+        await send_device_actions(device_actions, priority=True, retry=retry)
+        return True
+    except Exception:
+        logger.exception("Restoring lamps in one request failed, restoring step by step")
+
+    ok = True
+    for device_id, actions in device_actions.items():
+        for action in actions:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.error(
+                    "Restore budget spent, not restoring %s for %s", action.get("type"), device_id
+                )
+                ok = False
+                continue
+            try:
+                await send_device_actions(
+                    {device_id: [action]},
+                    priority=True,
+                    retry=replace(retry, deadline_sec=remaining),
+                )
+            except Exception:
+                ok = False
+                logger.exception("Restoring %s failed for %s", action.get("type"), device_id)
+    return ok
+
+
+@dataclass
+class ActiveAlert:
+    """In-flight alert on a set of devices, owned by AlertCoordinator."""
+    device_ids: list[str]
+    kind: str
+    duration_sec: float
+    alert_id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    merged_count: int = 0
+    source: str = "direct"
+    api_calls: Optional[ApiCallStats] = None
+    task: Optional[asyncio.Task] = None
+    blink_stats: Optional[BlinkStats] = None
+    restoring: bool = False
+    stop_event: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+    def begin(self) -> None:
+        """Start the alert clock (after the lamps show the alert)."""
+        self.started_at = time.monotonic()
+
+    def remaining(self) -> float:
+        if self.started_at is None:
+            return self.duration_sec
+        return self.started_at + self.duration_sec - time.monotonic()
+
+    def extend(self, duration_sec: float) -> None:
+        """Make the alert last at least duration_sec from now."""
+        if self.started_at is not None:
+            duration_sec += time.monotonic() - self.started_at
+        self.duration_sec = max(self.duration_sec, duration_sec)
+        self.merged_count += 1
+
+    @property
+    def stopped(self) -> bool:
+        return self.stop_event.is_set()
+
+    @property
+    def finishing(self) -> bool:
+        """
+        Stopped, or done and putting the lamps back: it takes no more
+        merges, a new alert on its lamps waits for it instead.
+        """
+        return self.restoring or self.stopped
+
+    def stop(self) -> None:
+        """Ask the alert to restore the lamps and finish early."""
+        self.stop_event.set()
+
+    async def wait(self, timeout: float) -> bool:
+        """Sleep up to timeout; wake early and return True if stopped."""
+        if timeout > 0:
+            try:
+                await asyncio.wait_for(self.stop_event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.stopped
+
+    def to_dict(self) -> dict:
+        return {
+            "alert_id": self.alert_id,
+            "device_ids": self.device_ids,
+            "kind": self.kind,
+            "source": self.source,
+            "created_at": self.created_at,
+            "duration_sec": self.duration_sec,
+            "remaining_sec": max(0.0, self.remaining()),
+            "merged_count": self.merged_count,
+            "blink": self.blink_stats.to_dict() if self.blink_stats else None,
+            "status": "restoring" if self.restoring else "stopping" if self.stopped else (
+                "running" if self.started_at is not None else "starting"
+            ),
+        }
+
+
+class AlertCoordinator:
     """
-    alert_color_hex = color_hex or get_alert_color_hex()
-    alert_duration = duration_sec or get_alert_duration_sec()
+    Owns at most one active alert per device.
+    An alert for busy devices extends the running ones instead of starting
+    a second loop, so each snapshot is taken and restored exactly once.
+    """
+
+    def __init__(self, recent_size: int = 20) -> None:
+        self._active: dict[str, ActiveAlert] = {}
+        # IDs of requests merged into a running alert -> that alert.
+        self._aliases: dict[str, ActiveAlert] = {}
+        self.recent: deque[AlertResult] = deque(maxlen=recent_size)
+
+    def get(self, device_id: str) -> Optional[ActiveAlert]:
+        return self._active.get(device_id)
+
+    def is_busy(self, device_ids: list[str]) -> bool:
+        """True if every device already has a running (not finishing) alert."""
+        for device_id in device_ids:
+            alert = self._active.get(device_id)
+            if alert is None or alert.finishing:
+                return False
+        return True
+
+    def find(self, alert_id: str) -> Optional[ActiveAlert]:
+        for alert in self._active.values():
+            if alert.alert_id == alert_id:
+                return alert
+        return self._aliases.get(alert_id)
+
+    def list_active(self) -> list[ActiveAlert]:
+        return list({id(alert): alert for alert in self._active.values()}.values())
+
+    def stop(self, alert_id: str) -> Optional[ActiveAlert]:
+        """Stop an active alert by ID; returns None if it is not running."""
+        alert = self.find(alert_id)
+        if alert is not None:
+            logger.info("Stopping %s alert %s", alert.kind, alert_id)
+            alert.stop()
+            event_bus.publish("alert.stopping", alert.to_dict())
+        return alert
+
+    def try_merge(
+        self,
+        kind: str,
+        duration_sec: float,
+        device_ids: list[str],
+    ) -> Optional[ActiveAlert]:
+        """
+        Extend the running alerts if every device has one (see is_busy) and
+        return the first of them; otherwise change nothing and return None.
+        Does not await, so no alert can finish between check and merge.
+        """
+        if not device_ids or not self.is_busy(device_ids):
+            return None
+        busy = list({id(alert): alert for alert in map(self._active.get, device_ids)}.values())
+        for active in busy:
+            self._merge(active, kind, duration_sec)
+        return busy[0]
+
+    @staticmethod
+    def _merge(active: ActiveAlert, kind: str, duration_sec: float) -> None:
+        active.extend(duration_sec)
+        logger.info(
+            "Merged %s alert into active %s alert %s, remaining=%.1fs",
+            kind, active.kind, active.alert_id, active.remaining(),
+        )
+        event_bus.publish("alert.merged", active.to_dict())
+
+    def start(
+        self,
+        kind: str,
+        duration_sec: float,
+        body,
+        device_ids: list[str],
+        alert_id: Optional[str] = None,
+        start_rgb: Optional[int] = None,
+        source: str = "direct",
+        touches: frozenset = frozenset(),
+    ) -> tuple[ActiveAlert, bool]:
+        """
+        Start an alert on the free devices and extend the alerts already
+        running on busy ones. `body(alert, snapshots)` is the
+        scenario-specific part; `start_rgb` is sent together with turning
+        the lamps on; `touches` names what the body changes besides color
+        ("brightness", "on"), so the restore sends it back unconditionally;
+        `source` (api, telegram, ...) goes to the alert history.
+        Returns (alert, merged); when every device is busy, alert is the
+        (first) extended one and merged is True.
+        Must be called from the event loop.
+        """
+        busy = []
+        free = []
+        for device_id in device_ids:
+            active = self._active.get(device_id)
+            if active is not None and not active.finishing:
+                if active not in busy:
+                    busy.append(active)
+            else:
+                free.append(device_id)
+
+        for active in busy:
+            self._merge(active, kind, duration_sec)
+        if not free:
+            if alert_id is not None:
+                self._aliases[alert_id] = busy[0]
+            return busy[0], True
+
+        previous = {
+            self._active[device_id].task
+            for device_id in free
+            if device_id in self._active
+        }
+        alert = ActiveAlert(
+            device_ids=free, kind=kind, duration_sec=duration_sec, source=source
+        )
+        if alert_id is not None:
+            alert.alert_id = alert_id
+        for device_id in free:
+            self._active[device_id] = alert
+        alert.task = asyncio.create_task(self._run(alert, body, previous, start_rgb, touches))
+        return alert, False
+
+    async def _run(
+        self,
+        alert: ActiveAlert,
+        body,
+        previous: Optional[set] = None,
+        start_rgb: Optional[int] = None,
+        touches: frozenset = frozenset(),
+    ) -> AlertResult:
+        with tracer.span(
+            "alert",
+            trace_id_for(alert.alert_id),
+            alert_id=alert.alert_id,
+            kind=alert.kind,
+            source=alert.source,
+            devices=len(alert.device_ids),
+        ) as span:
+            result = await self._run_alert(alert, body, previous, start_rgb, touches)
+            span.set_attribute("status", result.status)
+            return result
+
+    async def _run_alert(
+        self,
+        alert: ActiveAlert,
+        body,
+        previous: Optional[set],
+        start_rgb: Optional[int],
+        touches: frozenset,
+    ) -> AlertResult:
+        started = time.monotonic()
+        # The task runs in its own context, so this counts only this alert.
+        alert.api_calls = track_api_calls()
+        try:
+            try:
+                if previous:
+                    # Finishing alerts are still restoring; snapshot after them.
+                    await asyncio.wait(previous)
+
+                with tracer.span("alert.snapshot", devices=len(alert.device_ids)):
+                    snapshots = await remember_device_states_async(alert.device_ids)
+            except asyncio.CancelledError:
+                # The lamps were not touched yet: nothing to restore.
+                self._finish(alert, "cancelled", started, [])
+                raise
+            except Exception:
+                logger.exception(
+                    "Snapshot for %s alert %s failed", alert.kind, alert.alert_id
+                )
+                return self._finish(alert, "failed", started, [])
+            offline = [d for d, snapshot in snapshots.items() if not snapshot.available]
+            snapshots = {d: s for d, s in snapshots.items() if s.available}
+
+            if offline:
+                logger.warning(
+                    "Devices are not available (offline), skipping in %s alert: %s",
+                    alert.kind, offline,
+                )
+            event_bus.publish("alert.started", {**alert.to_dict(), "offline_device_ids": offline})
+            if not snapshots:
+                return self._finish(alert, "offline", started, offline)
+
+            status = "stopped"
+            cancelled = False
+            # What the lamps are known to look like, for a minimal restore.
+            # None = unknown (the start request may have partly applied).
+            current: dict[str, Optional[DeviceSnapshot]] = dict.fromkeys(snapshots)
+            try:
+                targets = {
+                    device_id: _alert_state(snapshot, start_rgb)
+                    for device_id, snapshot in snapshots.items()
+                }
+                turned_on = [d for d, snapshot in snapshots.items() if not snapshot.was_on]
+                if turned_on:
+                    logger.info(
+                        "Lamps were OFF, turning ON for %s alert: %s", alert.kind, turned_on
+                    )
+                # Turn on and set the first color in one request.
+                with tracer.span("alert.apply", turned_on=len(turned_on)):
+                    await apply_device_states(targets, snapshots)
+                current = {
+                    device_id: _known_state(snapshot, touches)
+                    for device_id, snapshot in snapshots.items()
+                }
+                if turned_on:
+                    await alert.wait(0.5)
+
+                if not alert.stopped:
+                    with tracer.span("alert.body", kind=alert.kind):
+                        await body(alert, snapshots)
+                    status = "stopped" if alert.stopped else "finished"
+            except asyncio.CancelledError:
+                # Shutdown: restore and record the alert, then re-raise.
+                status = "cancelled"
+                cancelled = True
+            except Exception:
+                # The lamps may be half-way into the alert: restore them anyway.
+                logger.exception("%s alert %s failed", alert.kind.capitalize(), alert.alert_id)
+                status = "failed"
+            finally:
+                # From here on new requests for these lamps start a new
+                # alert after this one.
+                alert.restoring = True
+                with tracer.span("alert.restore") as span:
+                    restored = await _restore_device_states(snapshots, current)
+                    span.set_attribute("restored", restored)
+
+            if not restored:
+                status = "restore_failed"
+            result = self._finish(alert, status, started, offline)
+            if cancelled:
+                raise asyncio.CancelledError()
+            return result
+        finally:
+            for device_id in alert.device_ids:
+                if self._active.get(device_id) is alert:
+                    del self._active[device_id]
+            for alias in [key for key, value in self._aliases.items() if value is alert]:
+                del self._aliases[alias]
+
+    def _finish(
+        self,
+        alert: ActiveAlert,
+        status: str,
+        started: float,
+        offline: list[str],
+    ) -> AlertResult:
+        elapsed_sec = time.monotonic() - started
+        ended_at = time.time()
+        result = AlertResult(
+            alert_id=alert.alert_id,
+            device_ids=alert.device_ids,
+            kind=alert.kind,
+            status=status,
+            duration_sec=alert.duration_sec,
+            elapsed_sec=elapsed_sec,
+            offline_device_ids=offline,
+            blink=alert.blink_stats,
+            source=alert.source,
+            started_at=ended_at - elapsed_sec,
+            ended_at=ended_at,
+            merged_count=alert.merged_count,
+            api_calls=alert.api_calls,
+        )
+        self.recent.append(result)
+        alert_history.record(result.to_record())
+        ALERTS.labels(alert.kind, status, alert.source).inc()
+        ALERT_SECONDS.labels(alert.kind).observe(elapsed_sec)
+        if alert.blink_stats is not None and alert.blink_stats.elapsed_sec > 0:
+            ALERT_BLINK_RATE.observe(alert.blink_stats.achieved_rate_hz)
+        event_bus.publish("alert.finished", result.to_dict())
+        logger.info(
+            "%s alert %s %s: %s",
+            alert.kind.capitalize(), alert.alert_id, status, result.to_dict(),
+        )
+        return result
+
+
+alert_coordinator = AlertCoordinator()
+ALERTS_ACTIVE.set_function(lambda: len(alert_coordinator.list_active()))
+
 
-    logger.info("Starting alert: color=%s, duration=%s",
-                alert_color_hex, alert_duration)
+async def _hold_color(alert: ActiveAlert) -> None:
+    # The alert color was already set together with turning the lamps on.
+    alert.begin()
+    while alert.remaining() > 0 and not await alert.wait(alert.remaining()):
+        pass
 
-    snapshot = remember_device_state()
 
-    if not snapshot.available:
-        logger.warning("Device is not available (offline), aborting alert.")
-        return
+async def run_ticks(alert: ActiveAlert, interval_sec: float, on_tick) -> BlinkStats:
+    """
+    Call `on_tick(tick)` on an absolute grid start + tick * interval_sec.
+    Slow ticks do not shift the grid: ticks that already passed are skipped,
+    not queued. The last request is cut off at the alert deadline.
+    When on_tick returns False (throttled) the stride between ticks doubles
+    up to MAX_TICK_STRIDE and shrinks back after each successful tick, so
+    the blink rate adapts to the API instead of failing the alert.
+    """
+    stats = BlinkStats(requested_interval_sec=interval_sec)
+    alert.blink_stats = stats
+    alert.begin()
+    start = alert.started_at
+    tick = 0
+    stride = 1
+    while not alert.stopped:
+        remaining = alert.remaining()
+        if remaining <= 0:
+            break
+        try:
+            with tracer.span("alert.tick", tick=tick, stride=stride) as span:
+                sent = await asyncio.wait_for(on_tick(tick), remaining)
+                span.set_attribute("throttled", sent is False)
+        except asyncio.TimeoutError:
+            logger.info("Tick %d cut off at alert deadline.", tick)
+            break
+        now = time.monotonic()
+        if sent is False:
+            stats.ticks_throttled += 1
+            stride = min(stride * 2, MAX_TICK_STRIDE)
+        else:
+            if not stats.ticks_sent:
+                stats.first_tick_sec = now - start
+            stats.last_tick_sec = now - start
+            stats.ticks_sent += 1
+            stride = max(1, stride // 2)
+
+        next_tick = max(tick + stride, int((now - start) / interval_sec) + 1)
+        stats.ticks_skipped += next_tick - tick - 1
+        tick = next_tick
+        await alert.wait(min(start + tick * interval_sec - now, alert.remaining()))
+    stats.elapsed_sec = time.monotonic() - start
+    return stats
+
+
+async def _play_pattern(alert: ActiveAlert, compiled: CompiledPattern, interval_sec: float) -> None:
+    """
+    Play a compiled pattern on the run_ticks() grid. Each tick sends the
+    prepared request of the next frame (one batched request for all lamps,
+    so they change in sync); a frame held for several ticks is sent once.
+    """
+    timeline = compiled.timeline
+    shown = compiled.start_frame
+    position = 0
+
+    async def on_tick(tick: int) -> bool:
+        # Advance per delivered frame: throttled ticks must not skip frames
+        # or make the lamps show the same color twice in a row. A held
+        # frame is already on the lamps, so it counts as delivered.
+        nonlocal shown, position
+        frame = timeline[position % len(timeline)]
+        if frame != shown and compiled.frames[frame] is not None:
+            try:
+                # A failed tick is not retried: the next one supersedes it.
+                await send_device_actions(
+                    compiled.frames[frame], block=False, retry=NO_RETRY
+                )
+            except (RateLimited, httpx.TransportError):
+                return False
+            except httpx.HTTPStatusError as exc:
+                if exc.response.status_code not in RETRY_STATUSES:
+                    raise
+                return False
+        shown = frame
+        position += 1
+        return True
+
+    await run_ticks(alert, interval_sec, on_tick)
+
+
+def _start_pattern(
+    kind: str,
+    pattern: Pattern,
+    duration_sec: float,
+    targets: list[str],
+    alert_id: Optional[str],
+    source: str,
+) -> tuple[ActiveAlert, bool]:
+    interval_sec = pattern.interval_sec or get_alert_blink_interval_sec()
+
+    async def body(alert: ActiveAlert, snapshots: dict[str, DeviceSnapshot]) -> None:
+        # Compiled per alert: payloads depend on the lamps' color models.
+        await _play_pattern(alert, compile_pattern(pattern, snapshots), interval_sec)
+
+    start_color_hex = pattern.start_color_hex
+    return alert_coordinator.start(
+        kind, duration_sec, body, targets, alert_id,
+        start_rgb=hex_to_yandex_rgb(start_color_hex) if start_color_hex else None,
+        source=source,
+        touches=pattern.touches,
+    )
+
+
+async def schedule_alert(
+    color_hex: Optional[str] = None,
+    duration_sec: Optional[int] = None,
+    device_ids: Optional[list[str]] = None,
+    group: Optional[str] = None,
+    alert_id: Optional[str] = None,
+    source: str = "direct",
+) -> tuple[ActiveAlert, bool]:
+    """
+    Schedule a single-color alert on the running loop.
+    Devices that already have an alert get that one extended instead.
+    """
+    settings = get_settings()
+    alert_color_hex = color_hex or settings.alert_color_hex
+    alert_duration = duration_sec or settings.alert_duration_sec
+    targets = await resolve_alert_devices(device_ids, group)
 
-    if not snapshot.was_on:
-        logger.info("Lamp was OFF, turning ON for alert...")
-        turn_on()
-        time.sleep(0.5)
+    logger.info("Starting alert: color=%s, duration=%s, devices=%s",
+                alert_color_hex, alert_duration, targets)
 
     rgb_value = hex_to_yandex_rgb(alert_color_hex)
     logger.info("Set alert color: %s -> %d", alert_color_hex, rgb_value)
-    set_color_rgb_int(rgb_value, snapshot.color_model)
 
-    time.sleep(alert_duration)
+    async def body(alert: ActiveAlert, snapshots: dict[str, DeviceSnapshot]) -> None:
+        await _hold_color(alert)
+
+    return alert_coordinator.start(
+        "single", alert_duration, body, targets, alert_id,
+        start_rgb=rgb_value, source=source,
+    )
 
-    if snapshot.color_state is not None:
-        logger.info("Restoring original color: %s", snapshot.color_state)
-        restore_color_state(snapshot.color_state)
-        time.sleep(0.3)
 
-    if snapshot.brightness is not None:
-        logger.info("Restoring original brightness: %s", snapshot.brightness)
-        set_brightness(snapshot.brightness)
-        time.sleep(0.2)
+async def schedule_alert_rainbow(
+    color_hex: Optional[str] = None,
+    color_hex_2: Optional[str] = None,
+    duration_sec: Optional[int] = None,
+    device_ids: Optional[list[str]] = None,
+    group: Optional[str] = None,
+    alert_id: Optional[str] = None,
+    source: str = "direct",
+) -> tuple[ActiveAlert, bool]:
+    """
+    Schedule a blinking alert between two colors on the running loop.
+    Devices that already have an alert get that one extended instead.
+    """
+    settings = get_settings()
+    alert_color_hex_1 = color_hex or settings.alert_color_hex
+    alert_color_hex_2 = color_hex_2 or settings.alert_color_hex_2
+    alert_duration = duration_sec or settings.alert_duration_sec
+    targets = await resolve_alert_devices(device_ids, group)
 
-    if not snapshot.was_on:
-        logger.info("Lamp was initially OFF, turning OFF again.")
-        turn_off()
+    logger.info(
+        "Starting rainbow alert: color1=%s, color2=%s, duration=%s, devices=%s",
+        alert_color_hex_1, alert_color_hex_2, alert_duration, targets
+    )
 
-    logger.info("Alert finished.")
+    # Lamps light up in color 1 and switch to color 2 one interval later.
+    pattern = blink([alert_color_hex_1, alert_color_hex_2])
+    return _start_pattern("rainbow", pattern, alert_duration, targets, alert_id, source)
 
 
-def run_alert_rainbow(
+async def schedule_alert_pattern(
+    pattern: Pattern,
+    duration_sec: Optional[int] = None,
+    device_ids: Optional[list[str]] = None,
+    group: Optional[str] = None,
+    alert_id: Optional[str] = None,
+    source: str = "direct",
+) -> tuple[ActiveAlert, bool]:
+    """
+    Schedule an alert playing `pattern` (see app.patterns) on the running
+    loop. Devices that already have an alert get that one extended instead.
+    """
+    alert_duration = duration_sec or get_settings().alert_duration_sec
+    targets = await resolve_alert_devices(device_ids, group)
+
+    logger.info(
+        "Starting pattern alert: pattern=%s, frames=%d, duration=%s, devices=%s",
+        pattern.name, len(pattern.frames), alert_duration, targets
+    )
+    return _start_pattern("pattern", pattern, alert_duration, targets, alert_id, source)
+
+
+async def run_alert_async(
+    color_hex: Optional[str] = None,
+    duration_sec: Optional[int] = None,
+    device_ids: Optional[list[str]] = None,
+    group: Optional[str] = None,
+) -> Optional[AlertResult]:
+    """
+    Flow:
+      1. Remember state.
+      2. If offline -> log and exit.
+      3. Turn on (if it was off) and set alert color in one request.
+      4. Wait.
+      5. Restore original color and, if it was off, turn off in one request.
+    Returns None right away when merged into an already running alert.
+    """
+    alert, merged = await schedule_alert(color_hex, duration_sec, device_ids, group)
+    if not merged:
+        return await alert.task
+    return None
+
+
+async def run_alert_rainbow_async(
     color_hex: Optional[str] = None,
     color_hex_2: Optional[str] = None,
     duration_sec: Optional[int] = None,
-) -> None:
+    device_ids: Optional[list[str]] = None,
+    group: Optional[str] = None,
+) -> Optional[AlertResult]:
     """
     Flow:
       1. Remember state.
       2. If offline -> exit.
-      3. If lamp was off -> turn on.
+      3. Turn on (if it was off) with the first color in one request.
       4. Blink between two colors.
-      5. Restore original color.
-      6. If it was off -> turn off again.
+      5. Restore original color and, if it was off, turn off in one request.
+    Returns None right away when merged into an already running alert.
     """
-    alert_color_hex_1 = color_hex or get_alert_color_hex()
-    alert_color_hex_2 = color_hex_2 or get_alert_color_hex_2()
-    alert_duration = duration_sec or get_alert_duration_sec()
-
-    logger.info(
-        "Starting rainbow alert: color1=%s, color2=%s, duration=%s",
-        alert_color_hex_1, alert_color_hex_2, alert_duration
+    alert, merged = await schedule_alert_rainbow(
+        color_hex, color_hex_2, duration_sec, device_ids, group
     )
+    if not merged:
+        return await alert.task
+    return None
 
-    snapshot = remember_device_state()
 
-    if not snapshot.available:
-        logger.warning("Device is not available (offline), aborting rainbow alert.")
-        return
+async def run_alert_pattern_async(
+    pattern: Pattern,
+    duration_sec: Optional[int] = None,
+    device_ids: Optional[list[str]] = None,
+    group: Optional[str] = None,
+) -> Optional[AlertResult]:
+    """
+    Like run_alert_rainbow_async(), but the lamps play `pattern`.
+    Returns None right away when merged into an already running alert.
+    """
+    alert, merged = await schedule_alert_pattern(pattern, duration_sec, device_ids, group)
+    if not merged:
+        return await alert.task
+    return None
 
-    if not snapshot.was_on:
-        logger.info("Lamp was OFF, turning ON for rainbow alert...")
-        turn_on()
-        time.sleep(0.5)
 
-    rgb_value_1 = hex_to_yandex_rgb(alert_color_hex_1)
-    rgb_value_2 = hex_to_yandex_rgb(alert_color_hex_2)
+def _run_blocking(coro):
+    """Run a coroutine on a private loop, then flush what it recorded."""
+    try:
+        return run_blocking(coro)
+    finally:
+        # Callers are often one-shot scripts: flush the history before exit.
+        alert_history.close()
+        tracer.shutdown()
 
-    start_ts = time.time()
-    toggle = False
-    while time.time() - start_ts < alert_duration:
-        set_color_rgb_int(
-            rgb_value_1 if toggle else rgb_value_2,
-            snapshot.color_model,
-        )
-        toggle = not toggle
-        time.sleep(get_alert_blink_interval_sec())
 
-    if snapshot.color_state is not None:
-        logger.info("Restoring original color: %s", snapshot.color_state)
-        restore_color_state(snapshot.color_state)
-        time.sleep(0.3)
+def remember_device_state() -> DeviceSnapshot:
+    """Blocking wrapper around remember_device_state_async()."""
+    return _run_blocking(remember_device_state_async())
 
-    if snapshot.brightness is not None:
-        logger.info("Restoring original brightness: %s", snapshot.brightness)
-        set_brightness(snapshot.brightness)
-        time.sleep(0.2)
 
-    if not snapshot.was_on:
-        logger.info("Lamp was initially OFF, turning OFF again.")
-        turn_off()
+def run_alert(
+    color_hex: Optional[str] = None,
+    duration_sec: Optional[int] = None,
+    device_ids: Optional[list[str]] = None,
+    group: Optional[str] = None,
+) -> Optional[AlertResult]:
+    """Blocking wrapper around run_alert_async()."""
+    return _run_blocking(run_alert_async(color_hex, duration_sec, device_ids, group))
+
 
-    logger.info("Rainbow alert finished.")
+def run_alert_rainbow(
+    color_hex: Optional[str] = None,
+    color_hex_2: Optional[str] = None,
+    duration_sec: Optional[int] = None,
+    device_ids: Optional[list[str]] = None,
+    group: Optional[str] = None,
+) -> Optional[AlertResult]:
+    """Blocking wrapper around run_alert_rainbow_async()."""
+    return _run_blocking(
+        run_alert_rainbow_async(color_hex, color_hex_2, duration_sec, device_ids, group)
+    )
+
+
+def run_alert_pattern(
+    pattern: Pattern,
+    duration_sec: Optional[int] = None,
+    device_ids: Optional[list[str]] = None,
+    group: Optional[str] = None,
+) -> Optional[AlertResult]:
+    """Blocking wrapper around run_alert_pattern_async()."""
+    return _run_blocking(run_alert_pattern_async(pattern, duration_sec, device_ids, group))
@@ -1,27 +1,62 @@
+import asyncio
 import os
+from contextlib import asynccontextmanager
+from typing import Optional
 
-from fastapi import BackgroundTasks, FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Query, Request
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import ValidationError
 import requests
 
-from app.alerts import run_alert, run_alert_rainbow
+from app.alert_queue import AlertQueueFull, alert_queue
+from app.alerts import alert_coordinator
 from app.config import (
     get_alert_color_hex,
     get_alert_color_hex_2,
     get_alert_duration_sec,
+    get_events_heartbeat_sec,
+    get_telegram_mode,
     update_yaml_config,
 )
-from app.iot_client import get_device_status_by_id, get_user_devices
+from app.events import event_bus, format_sse
+from app.history import alert_history
+from app.inventory import invalidate_inventory, load_inventory
+from app.iot_client import invalidate_device_state
+from app.iot_client_async import close_async_client, get_device_statuses, get_user_devices
+from app.metrics import registry
+from app.patterns import build_pattern
 from app.schemas import (
+    AlertPatternRequest,
     AlertRainbowRequest,
     AlertRequest,
     AlertSettingsRequest,
     CredentialsRequest,
     CredentialsVerifyRequest,
     DeviceSelectionRequest,
+    TelegramUpdate,
 )
-
-app = FastAPI(title="Yandex IoT Alert Service")
+from app.telegram import dispatch_update, telegram_poller
+from app.tracing import trace_id_for, tracer
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    alert_history.start()
+    await alert_queue.start()
+    if get_telegram_mode() == "polling":
+        await telegram_poller.start()
+    yield
+    await telegram_poller.stop()
+    await alert_queue.stop()
+    await close_async_client()
+    # Alerts restored on shutdown are recorded too; flush them last.
+    await asyncio.to_thread(alert_history.close)
+    tracer.shutdown()
+
+
+app = FastAPI(title="Yandex IoT Alert Service", lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -38,45 +73,201 @@ def _set_env_vars(values: dict) -> None:
         os.environ[key] = str(value)
 
 
+async def _submit_alert(
+    kind: str,
+    duration_sec: Optional[int],
+    device_ids: Optional[list[str]] = None,
+    group: Optional[str] = None,
+    source: str = "api",
+    **params,
+) -> tuple[str, str]:
+    """Enqueue an alert; 429 when the queue is full, 400 for bad targets."""
+    try:
+        return await alert_queue.submit(
+            kind, duration_sec, device_ids, group, source=source, **params
+        )
+    except AlertQueueFull as exc:
+        raise HTTPException(status_code=429, detail=str(exc)) from exc
+    except (KeyError, ValueError) as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+def _trace_id(alert_id: str) -> Optional[str]:
+    """Trace ID to look the alert up in the tracing output; None when off."""
+    return trace_id_for(alert_id) if tracer.enabled else None
+
+
 @app.post("/startAlert")
-async def start_alert(req: AlertRequest, background_tasks: BackgroundTasks):
+async def start_alert(req: AlertRequest):
     """
     Single-color alert.
     """
-    background_tasks.add_task(
-        run_alert,
-        req.color_hex,
+    status, alert_id = await _submit_alert(
+        "single",
         req.duration_sec,
+        req.device_ids,
+        req.group,
+        color_hex=req.color_hex,
     )
     return {
-        "status": "scheduled",
+        "status": status,
+        "alert_id": alert_id,
+        "trace_id": _trace_id(alert_id),
         "color_hex": req.color_hex or get_alert_color_hex(),
         "duration_sec": req.duration_sec or get_alert_duration_sec(),
     }
 
 
 @app.post("/startAlertRainbow")
-async def start_alert_rainbow_endpoint(
-    req: AlertRainbowRequest,
-    background_tasks: BackgroundTasks,
-):
+async def start_alert_rainbow_endpoint(req: AlertRainbowRequest):
     """
     Blinking alert between two colors.
     """
-    background_tasks.add_task(
-        run_alert_rainbow,
-        req.color_hex,
-        req.color_hex_2,
+    status, alert_id = await _submit_alert(
+        "rainbow",
         req.duration_sec,
+        req.device_ids,
+        req.group,
+        color_hex=req.color_hex,
+        color_hex_2=req.color_hex_2,
     )
     return {
-        "status": "scheduled",
+        "status": status,
+        "alert_id": alert_id,
+        "trace_id": _trace_id(alert_id),
         "color_hex": req.color_hex or get_alert_color_hex(),
         "color_hex_2": req.color_hex_2 or get_alert_color_hex_2(),
         "duration_sec": req.duration_sec or get_alert_duration_sec(),
     }
 
 
+@app.post("/startAlertPattern")
+async def start_alert_pattern_endpoint(req: AlertPatternRequest):
+    """
+    Alert playing a built-in light pattern (blink, cycle, fade, breathe, sos).
+    """
+    colors = req.colors or [get_alert_color_hex(), get_alert_color_hex_2()]
+    try:
+        pattern = build_pattern(req.pattern, colors, req.interval_sec)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    status, alert_id = await _submit_alert(
+        "pattern",
+        req.duration_sec,
+        req.device_ids,
+        req.group,
+        pattern=pattern,
+    )
+    return {
+        "status": status,
+        "alert_id": alert_id,
+        "trace_id": _trace_id(alert_id),
+        "pattern": pattern.name,
+        "colors": colors,
+        "frames": len(pattern.frames),
+        "duration_sec": req.duration_sec or get_alert_duration_sec(),
+    }
+
+
+@app.post("/stopAlert/{alert_id}")
+async def stop_alert(alert_id: str):
+    """
+    Stop an active alert; the lamp is restored within one blink interval.
+    """
+    if alert_queue.cancel(alert_id) is not None:
+        return {"ok": True, "alert_id": alert_id, "status": "cancelled"}
+    alert = alert_coordinator.stop(alert_id)
+    if alert is None:
+        raise HTTPException(status_code=404, detail="alert not found")
+    return {"ok": True, "alert_id": alert_id, "status": "stopping"}
+
+
+@app.get("/alerts")
+async def list_alerts():
+    return {
+        "alerts": [alert.to_dict() for alert in alert_coordinator.list_active()],
+        "recent": [result.to_dict() for result in alert_coordinator.recent],
+    }
+
+
+@app.get("/alerts/history")
+async def alert_history_page(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    device_id: Optional[str] = None,
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+):
+    """
+    Finished alerts, newest first. Pass next_cursor back as `cursor` for
+    the next page; since/until are unix timestamps.
+    """
+    try:
+        return await asyncio.to_thread(
+            alert_history.query, limit, cursor, device_id, since, until
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=f"invalid cursor: {cursor}") from exc
+
+
+@app.get("/alerts/queue")
+async def alert_queue_stats():
+    """Queue depth, worker usage and wait times, for sizing the queue."""
+    return alert_queue.snapshot()
+
+
+@app.get("/events")
+async def events(
+    types: Optional[str] = None,
+    last_event_id: Optional[str] = Header(None),
+):
+    """
+    Server-sent events: alert.* and device.* as they happen.
+    `types` is a comma-separated filter by type or prefix (e.g. "alert").
+    Served from the in-process bus, so watchers add no IoT API calls.
+    """
+    wanted = {item.strip() for item in types.split(",") if item.strip()} if types else None
+    try:
+        last_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_id = None
+    subscription = event_bus.subscribe(wanted, last_id)
+    heartbeat_sec = get_events_heartbeat_sec()
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                event = await subscription.get(timeout=heartbeat_sec)
+                if event is None:
+                    if subscription.closed:
+                        break
+                    yield ": ping\n\n"
+                    continue
+                yield format_sse(event)
+        finally:
+            subscription.close()
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Prometheus text exposition: IoT API request counts and latency
+    histograms, throttling, alert outcomes, queue and webhook counters.
+    Rendered on the event loop: the gauge callbacks read coordinator and
+    queue state that only the loop may touch.
+    """
+    return PlainTextResponse(
+        registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 @app.post("/setup/credentials")
 async def setup_credentials(req: CredentialsRequest):
     values = {
@@ -86,6 +277,9 @@ async def setup_credentials(req: CredentialsRequest):
     }
     update_yaml_config(values)
     _set_env_vars(values)
+    # Cached statuses were read with the old token/account.
+    invalidate_device_state()
+    invalidate_inventory()
     return {"ok": True}
 
 
@@ -103,10 +297,8 @@ async def verify_credentials(req: CredentialsVerifyRequest):
 
     if yandex_token:
         try:
-            devices = get_user_devices(yandex_token)
+            devices = await get_user_devices(yandex_token)
             results["yandex"] = {"ok": True, "message": f"devices: {len(devices)}"}
-        except requests.RequestException as exc:
-            results["yandex"] = {"ok": False, "message": str(exc)}
         except Exception as exc:
             results["yandex"] = {"ok": False, "message": str(exc)}
 
@@ -152,32 +344,37 @@ async def verify_credentials(req: CredentialsVerifyRequest):
 @app.get("/setup/devices")
 async def list_light_devices():
     try:
-        devices = get_user_devices()
+        inventory = await load_inventory()
     except KeyError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
 
-    lights = []
-    for device in devices:
-        device_type = device.get("type", "")
-        if not str(device_type).startswith("devices.types.light"):
-            continue
-
-        device_id = device.get("id")
-        if not device_id:
-            continue
-
-        status = get_device_status_by_id(device_id)
-        if status.get("status") != "ok":
-            continue
-
-        lights.append({
-            "id": device_id,
-            "name": device.get("name") or "",
-            "state": status.get("state") or "unknown",
-            "type": device_type,
+    lights = inventory.lights()
+    # /user/info usually carries everything; read devices individually only
+    # when it lacks the online state.
+    missing = [device.id for device in lights if device.state is None]
+    statuses = await get_device_statuses(missing) if missing else {}
+
+    result = []
+    partial = False
+    for device in lights:
+        state = device.state
+        if state is None:
+            status = statuses[device.id]
+            if status is None:
+                partial = True
+                continue
+            if status.get("status") != "ok":
+                continue
+            state = status.get("state")
+
+        result.append({
+            "id": device.id,
+            "name": device.name,
+            "state": state or "unknown",
+            "type": device.type,
         })
 
-    return {"devices": lights}
+    return {"devices": result, "partial": partial}
 
 
 @app.post("/setup/device")
@@ -210,27 +407,24 @@ async def setup_alert_settings(req: AlertSettingsRequest):
 
 
 @app.post("/telegram/webhook")
-async def telegram_webhook(update: dict, background_tasks: BackgroundTasks):
+async def telegram_webhook(request: Request):
     """
     Telegram webhook: trigger rainbow alert on any incoming message.
+    Telegram backs off slow webhooks, so the raw body goes straight into
+    TelegramUpdate (only update_id, the message kind and chat are read)
+    and the answer is sent as soon as the alert is queued.
     """
-    message = (
-        update.get("message")
-        or update.get("edited_message")
-        or update.get("channel_post")
-        or update.get("edited_channel_post")
-    )
-    if message is None:
-        return {"ok": True, "ignored": True}
-    chat = message.get("chat") or {}
-    chat_type = chat.get("type")
-    if chat_type not in ("private", "group", "supergroup"):
-        return {"ok": True, "ignored": True, "reason": "unsupported_chat_type"}
-
-    background_tasks.add_task(
-        run_alert_rainbow,
-        None,
-        None,
-        None,
-    )
-    return {"ok": True}
+    try:
+        update = TelegramUpdate.model_validate_json(await request.body())
+    except ValidationError as exc:
+        raise RequestValidationError(exc.errors()) from exc
+    try:
+        result = await dispatch_update(update, mode="webhook")
+    except AlertQueueFull as exc:
+        raise HTTPException(status_code=429, detail=str(exc)) from exc
+    except (KeyError, ValueError) as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    if "alert_id" in result:
+        result["trace_id"] = _trace_id(result["alert_id"])
+    # Plain JSON types only: skip FastAPI's generic response encoding.
+    return JSONResponse(result)
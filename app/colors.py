@@ -0,0 +1,220 @@
+import colorsys
+from functools import lru_cache
+from typing import Sequence
+
+try:
+    # Optional: vectorized bulk color conversion (palettes, gradients).
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def hex_to_yandex_rgb(color: str) -> int:
+    """
+    Convert '#RRGGBB' or 'RRGGBB' to a 24-bit integer for Yandex.
+    Examples:
+      '#FF0000' -> 0xFF0000 -> 16711680
+      '00FF00'  -> 0x00FF00 -> 65280
+    """
+    return int(_hex_digits(color), 16)
+
+
+def _hex_digits(color: str) -> str:
+    s = color.strip().lower()
+    if s.startswith("#"):
+        s = s[1:]
+    if s.startswith("0x"):
+        s = s[2:]
+
+    if len(s) != 6:
+        raise ValueError(f"Invalid hex color: {color}")
+    return s
+
+
+@lru_cache(maxsize=4096)
+def _rgb_int_to_hsv(rgb_value: int) -> tuple[int, int, int]:
+    r = (rgb_value >> 16) & 0xFF
+    g = (rgb_value >> 8) & 0xFF
+    b = rgb_value & 0xFF
+
+    h, s, v = colorsys.rgb_to_hsv(r / 255.0, g / 255.0, b / 255.0)
+    h_val = int(round(h * 360))
+    if h_val >= 360:
+        h_val = 0
+    return h_val, int(round(s * 100)), int(round(v * 100))
+
+
+def rgb_int_to_yandex_hsv(rgb_value: int) -> dict:
+    """
+    Convert a 24-bit integer (0xRRGGBB) to Yandex HSV payload.
+    Yandex expects h=0..360, s=0..100, v=0..100.
+    Alerts use a handful of colors, so conversions are memoized.
+    """
+    if rgb_value < 0 or rgb_value > 0xFFFFFF:
+        raise ValueError(f"Invalid RGB value: {rgb_value}")
+
+    h, s, v = _rgb_int_to_hsv(rgb_value)
+    return {"h": h, "s": s, "v": v}
+
+
+# Bulk conversions for palettes and gradients (fade pattern, TUI preview).
+# They return plain lists equal to calling the scalar functions one by one;
+# with NumPy installed the work is done on whole arrays, otherwise in a loop.
+
+COLOR_SPACES = ("rgb", "hsv")
+
+
+def _check_rgb(rgb_value: int) -> None:
+    if rgb_value < 0 or rgb_value > 0xFFFFFF:
+        raise ValueError(f"Invalid RGB value: {rgb_value}")
+
+
+def hex_colors_to_rgb(colors: Sequence[str]) -> list[int]:
+    """hex_to_yandex_rgb() for many colors."""
+    if np is None or not colors:
+        return [hex_to_yandex_rgb(color) for color in colors]
+    try:
+        data = bytes.fromhex("".join(_hex_digits(color) for color in colors))
+    except ValueError:
+        data = b""
+    if len(data) != 3 * len(colors):
+        # Digits fromhex() rejects (or int() reads differently): scalar path.
+        return [hex_to_yandex_rgb(color) for color in colors]
+    rgb = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3).astype(np.int64)
+    return ((rgb[:, 0] << 16) | (rgb[:, 1] << 8) | rgb[:, 2]).tolist()
+
+
+def _hsv_arrays(r, g, b) -> tuple:
+    """colorsys.rgb_to_hsv() over arrays, same operations in the same order."""
+    maxc = np.maximum(np.maximum(r, g), b)
+    minc = np.minimum(np.minimum(r, g), b)
+    rangec = maxc - minc
+    gray = rangec == 0
+    safe_range = np.where(gray, 1.0, rangec)
+    s = np.where(gray, 0.0, rangec / np.where(gray, 1.0, maxc))
+    rc = (maxc - r) / safe_range
+    gc = (maxc - g) / safe_range
+    bc = (maxc - b) / safe_range
+    h = np.where(r == maxc, bc - gc, np.where(g == maxc, 2.0 + rc - bc, 4.0 + gc - rc))
+    h = np.where(gray, 0.0, (h / 6.0) % 1.0)
+    return h, s, maxc
+
+
+def rgb_ints_to_yandex_hsv(values: Sequence[int]) -> list[dict]:
+    """rgb_int_to_yandex_hsv() for many colors (not memoized)."""
+    if np is None or not len(values):
+        result = []
+        for rgb_value in values:
+            _check_rgb(rgb_value)
+            h, s, v = _rgb_int_to_hsv.__wrapped__(rgb_value)
+            result.append({"h": h, "s": s, "v": v})
+        return result
+    rgb = np.asarray(values, dtype=np.int64)
+    invalid = (rgb < 0) | (rgb > 0xFFFFFF)
+    if invalid.any():
+        raise ValueError(f"Invalid RGB value: {rgb[invalid][0]}")
+    h, s, v = _hsv_arrays(
+        ((rgb >> 16) & 0xFF) / 255.0, ((rgb >> 8) & 0xFF) / 255.0, (rgb & 0xFF) / 255.0
+    )
+    h_val = np.rint(h * 360).astype(np.int64)
+    h_val[h_val >= 360] = 0
+    return [
+        {"h": h, "s": s, "v": v}
+        for h, s, v in zip(
+            h_val.tolist(),
+            np.rint(s * 100).astype(np.int64).tolist(),
+            np.rint(v * 100).astype(np.int64).tolist(),
+        )
+    ]
+
+
+def _rgb_bytes(rgb_value: int) -> tuple[int, int, int]:
+    return (rgb_value >> 16) & 0xFF, (rgb_value >> 8) & 0xFF, rgb_value & 0xFF
+
+
+def _unit_rgb(rgb_value: int) -> tuple[float, float, float]:
+    return (
+        ((rgb_value >> 16) & 0xFF) / 255.0,
+        ((rgb_value >> 8) & 0xFF) / 255.0,
+        (rgb_value & 0xFF) / 255.0,
+    )
+
+
+def _hsv_path(start: int, end: int) -> tuple:
+    """
+    Start HSV and the deltas to the end one: the hue goes the short way
+    round, and a gray end takes the hue of the other one (no detour via red).
+    """
+    h0, s0, v0 = colorsys.rgb_to_hsv(*_unit_rgb(start))
+    h1, s1, v1 = colorsys.rgb_to_hsv(*_unit_rgb(end))
+    if s0 == 0.0:
+        h0 = h1
+    if s1 == 0.0:
+        h1 = h0
+    dh = h1 - h0
+    if dh > 0.5:
+        dh -= 1.0
+    elif dh < -0.5:
+        dh += 1.0
+    return h0, s0, v0, dh, s1 - s0, v1 - v0
+
+
+def mix_colors(start: int, end: int, t: float, space: str = "rgb") -> int:
+    """Color between start (t=0) and end (t=1), interpolated in RGB or HSV space."""
+    _check_rgb(start)
+    _check_rgb(end)
+    if not 0.0 <= t <= 1.0:
+        raise ValueError(f"t must be within 0..1: {t}")
+    if space == "rgb":
+        channels = [
+            int(round(a + (b - a) * t))
+            for a, b in zip(_rgb_bytes(start), _rgb_bytes(end))
+        ]
+    elif space == "hsv":
+        h0, s0, v0, dh, ds, dv = _hsv_path(start, end)
+        r, g, b = colorsys.hsv_to_rgb((h0 + dh * t) % 1.0, s0 + ds * t, v0 + dv * t)
+        channels = [int(round(r * 255)), int(round(g * 255)), int(round(b * 255))]
+    else:
+        raise ValueError(f"Unknown color space: {space} (known: {', '.join(COLOR_SPACES)})")
+    return (channels[0] << 16) | (channels[1] << 8) | channels[2]
+
+
+def _rgb_arrays_from_hsv(h, s, v) -> tuple:
+    """colorsys.hsv_to_rgb() over arrays, same operations in the same order."""
+    i = (h * 6.0).astype(np.int64)
+    f = (h * 6.0) - i
+    p = v * (1.0 - s)
+    q = v * (1.0 - s * f)
+    t = v * (1.0 - s * (1.0 - f))
+    i = i % 6
+    gray = s == 0.0
+    r = np.where(gray, v, np.choose(i, [v, q, p, p, t, v]))
+    g = np.where(gray, v, np.choose(i, [t, v, v, q, p, p]))
+    b = np.where(gray, v, np.choose(i, [p, p, t, v, v, q]))
+    return r, g, b
+
+
+def interpolate_colors(start: int, end: int, steps: int, space: str = "rgb") -> list[int]:
+    """
+    `steps` colors from start to end inclusive: mix_colors() at
+    t = i / (steps - 1).
+    """
+    if steps < 2:
+        raise ValueError("steps must be at least 2")
+    if np is None or space not in COLOR_SPACES:
+        return [mix_colors(start, end, i / (steps - 1), space) for i in range(steps)]
+    _check_rgb(start)
+    _check_rgb(end)
+    t = np.arange(steps) / (steps - 1)
+    if space == "rgb":
+        channels = [
+            np.rint(a + (b - a) * t).astype(np.int64)
+            for a, b in zip(_rgb_bytes(start), _rgb_bytes(end))
+        ]
+    else:
+        h0, s0, v0, dh, ds, dv = _hsv_path(start, end)
+        channels = [
+            np.rint(c * 255).astype(np.int64)
+            for c in _rgb_arrays_from_hsv((h0 + dh * t) % 1.0, s0 + ds * t, v0 + dv * t)
+        ]
+    return ((channels[0] << 16) | (channels[1] << 8) | channels[2]).tolist()
@@ -1,8 +1,12 @@
 import os
+import threading
+from dataclasses import dataclass
 from typing import Any, Optional
 
 import yaml
 
+from app.metrics import CONFIG_RELOADS
+
 try:
     # Optional: load env vars from .env if python-dotenv is installed.
     from dotenv import load_dotenv
@@ -27,6 +31,7 @@ def save_yaml_config(config: dict, path: Optional[str] = None) -> None:
     config_path = path or DEFAULT_CONFIG_PATH
     with open(config_path, "w", encoding="utf-8") as handle:
         yaml.safe_dump(config, handle, allow_unicode=False, sort_keys=True)
+    invalidate_config_cache()
 
 
 def update_yaml_config(values: dict, path: Optional[str] = None) -> dict:
@@ -36,11 +41,47 @@ def update_yaml_config(values: dict, path: Optional[str] = None) -> dict:
     return config
 
 
+_cache_lock = threading.Lock()
+_cached_config: dict = {}
+_cached_signature: Optional[tuple] = None
+
+
+def _config_signature(path: str) -> tuple:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return (path, None, None)
+    return (path, stat.st_mtime_ns, stat.st_size)
+
+
+def _get_cached_config() -> dict:
+    """
+    In-memory snapshot of config.yaml.
+    The file is re-parsed only when its mtime or size changes
+    (or after update_yaml_config); otherwise it costs one stat().
+    Callers must not mutate the returned dict.
+    """
+    global _cached_config, _cached_signature
+    signature = _config_signature(DEFAULT_CONFIG_PATH)
+    if signature != _cached_signature:
+        with _cache_lock:
+            if signature != _cached_signature:
+                _cached_config = _load_yaml_config(DEFAULT_CONFIG_PATH)
+                _cached_signature = signature
+                CONFIG_RELOADS.inc()
+    return _cached_config
+
+
+def invalidate_config_cache() -> None:
+    global _cached_signature
+    with _cache_lock:
+        _cached_signature = None
+
+
 def _get_value(key: str, default: Optional[Any] = None) -> Any:
     if key in os.environ:
         return os.environ[key]
-    config = _load_yaml_config()
-    return config.get(key, default)
+    return _get_cached_config().get(key, default)
 
 
 def _get_required_value(key: str) -> str:
@@ -63,6 +104,77 @@ def get_iot_device_id() -> str:
     return _get_required_value("IOT_DEVICE_ID")
 
 
+def get_iot_rate_limit_per_sec() -> float:
+    """Global IoT API request rate (token bucket refill); 0 disables limiting."""
+    return float(_get_value("IOT_RATE_LIMIT_PER_SEC", "10"))
+
+
+def get_iot_rate_limit_burst() -> float:
+    return float(_get_value("IOT_RATE_LIMIT_BURST", "20"))
+
+
+def get_iot_device_rate_limit_per_sec() -> float:
+    """Requests per second touching one device; 0 disables the per-device limit."""
+    return float(_get_value("IOT_DEVICE_RATE_LIMIT_PER_SEC", "3"))
+
+
+def get_iot_device_rate_limit_burst() -> float:
+    return float(_get_value("IOT_DEVICE_RATE_LIMIT_BURST", "6"))
+
+
+def get_iot_rate_limit_reserve() -> float:
+    """Tokens in every bucket that only priority (restore) requests may use."""
+    return float(_get_value("IOT_RATE_LIMIT_RESERVE", "2"))
+
+
+def get_iot_retry_attempts() -> int:
+    """Attempts per IoT API call, including the first one."""
+    return int(_get_value("IOT_RETRY_ATTEMPTS", "3"))
+
+
+def get_iot_retry_base_delay_sec() -> float:
+    """First backoff step; doubles on every retry (with full jitter)."""
+    return float(_get_value("IOT_RETRY_BASE_DELAY_SEC", "0.2"))
+
+
+def get_iot_retry_max_delay_sec() -> float:
+    return float(_get_value("IOT_RETRY_MAX_DELAY_SEC", "2"))
+
+
+def get_iot_retry_deadline_sec() -> float:
+    """Total time budget of one call including all retries."""
+    return float(_get_value("IOT_RETRY_DEADLINE_SEC", "5"))
+
+
+def get_iot_restore_retry_attempts() -> int:
+    """Attempts per restore step; restoring the lamp gets a bigger budget."""
+    return int(_get_value("IOT_RESTORE_RETRY_ATTEMPTS", "6"))
+
+
+def get_iot_restore_retry_deadline_sec() -> float:
+    return float(_get_value("IOT_RESTORE_RETRY_DEADLINE_SEC", "20"))
+
+
+def get_alert_device_ids() -> list[str]:
+    """
+    Lamps an alert targets by default: IOT_DEVICE_IDS (comma-separated)
+    or the single IOT_DEVICE_ID.
+    """
+    value = _get_value("IOT_DEVICE_IDS")
+    if isinstance(value, list):
+        device_ids = [str(item).strip() for item in value]
+    else:
+        device_ids = [item.strip() for item in str(value or "").split(",")]
+    device_ids = [device_id for device_id in device_ids if device_id]
+    return device_ids or [get_iot_device_id()]
+
+
+def get_alert_device_group() -> Optional[str]:
+    """Device group (ID or name) alerts target instead of the device list."""
+    value = _get_value("IOT_DEVICE_GROUP")
+    return str(value) if value else None
+
+
 def get_alert_color_hex() -> str:
     return str(_get_value("ALERT_COLOR_HEX", "#FF0000"))
 
@@ -79,14 +191,155 @@ def get_alert_blink_interval_sec() -> float:
     return float(_get_value("ALERT_BLINK_INTERVAL", "0.5"))
 
 
+def get_iot_pool_maxsize() -> int:
+    """Max keep-alive connections per host for the IoT HTTP client."""
+    return int(_get_value("IOT_POOL_MAXSIZE", "10"))
+
+
+def get_iot_state_cache_ttl_sec() -> float:
+    """How long a device status read is reused; 0 disables the cache."""
+    return float(_get_value("IOT_STATE_CACHE_TTL_SEC", "10"))
+
+
+def get_iot_status_concurrency() -> int:
+    """Max device status requests in flight when listing devices."""
+    return int(_get_value("IOT_STATUS_CONCURRENCY", "8"))
+
+
+def get_iot_status_timeout_sec() -> float:
+    """Per-device time budget for status reads when listing devices."""
+    return float(_get_value("IOT_STATUS_TIMEOUT_SEC", "3"))
+
+
+def get_alert_queue_max_depth() -> int:
+    """Alerts that may wait for a worker before new ones are dropped/merged."""
+    return int(_get_value("ALERT_QUEUE_MAX_DEPTH", "32"))
+
+
+def get_alert_queue_workers() -> int:
+    """Alerts that may run at the same time."""
+    return int(_get_value("ALERT_QUEUE_WORKERS", "4"))
+
+
+def get_alert_queue_full_policy() -> str:
+    """What to do with a new alert when the queue is full: merge or drop."""
+    return str(_get_value("ALERT_QUEUE_FULL_POLICY", "merge")).lower()
+
+
+def get_alert_history_path() -> str:
+    """SQLite file with the alert history; empty string disables it."""
+    return str(_get_value("ALERT_HISTORY_PATH", "alert_history.sqlite3") or "")
+
+
+def get_alert_history_batch_size() -> int:
+    """Max alert history rows written in one transaction."""
+    return int(_get_value("ALERT_HISTORY_BATCH_SIZE", "100"))
+
+
+def get_alert_history_flush_sec() -> float:
+    """How long the history writer waits to fill a batch."""
+    return float(_get_value("ALERT_HISTORY_FLUSH_SEC", "1"))
+
+
+def get_events_buffer_size() -> int:
+    """Events buffered per /events subscriber before the oldest are dropped."""
+    return int(_get_value("EVENTS_BUFFER_SIZE", "256"))
+
+
+def get_events_heartbeat_sec() -> float:
+    """Idle time after which /events sends a keep-alive comment."""
+    return float(_get_value("EVENTS_HEARTBEAT_SEC", "15"))
+
+
+def get_tracing_exporter() -> str:
+    """Where tracing spans go: none (default), jsonl or otel."""
+    return str(_get_value("TRACING_EXPORTER", "none") or "none").lower()
+
+
+def get_tracing_path() -> str:
+    """JSON-lines file of the jsonl tracing exporter."""
+    return str(_get_value("TRACING_PATH", "traces.jsonl"))
+
+
 def get_telegram_bot_token() -> Optional[str]:
     value = _get_value("TELEGRAM_BOT_TOKEN")
     return str(value) if value else None
 
 
+def get_telegram_mode() -> str:
+    """How Telegram updates arrive: webhook (default) or polling (getUpdates)."""
+    return str(_get_value("TELEGRAM_MODE", "webhook")).lower()
+
+
+def get_telegram_api_url() -> str:
+    return str(_get_value("TELEGRAM_API_URL", "https://api.telegram.org")).rstrip("/")
+
+
+def get_telegram_poll_timeout_sec() -> float:
+    """Server-side long-poll timeout of getUpdates."""
+    return float(_get_value("TELEGRAM_POLL_TIMEOUT_SEC", "25"))
+
+
+def get_telegram_offset_path() -> str:
+    """File with the next getUpdates offset; empty string disables it."""
+    return str(_get_value("TELEGRAM_OFFSET_PATH", "telegram_offset.txt") or "")
+
+
+def get_telegram_dedup_size() -> int:
+    """How many recent update_ids are remembered to drop redelivered updates."""
+    return int(_get_value("TELEGRAM_DEDUP_SIZE", "1000"))
+
+
+def get_telegram_debounce_sec() -> float:
+    """Messages from one chat within this window share one alert; 0 disables."""
+    return float(_get_value("TELEGRAM_DEBOUNCE_SEC", "5"))
+
+
+def get_telegram_debounce_extend() -> bool:
+    """Whether a collapsed message extends the alert it was collapsed into."""
+    return str(_get_value("TELEGRAM_DEBOUNCE_EXTEND", "true")).lower() in ("1", "true", "yes")
+
+
 def get_ngrok_authtoken() -> Optional[str]:
     value = _get_value("NGROK_AUTHTOKEN")
     if value:
         return str(value)
     value = _get_value("NGROK_TOKEN")
     return str(value) if value else None
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Typed view of the whole config, read in one call."""
+    iot_token: Optional[str]
+    iot_host: str
+    iot_device_id: Optional[str]
+    alert_color_hex: str
+    alert_color_hex_2: str
+    alert_duration_sec: int
+    alert_blink_interval_sec: float
+    telegram_bot_token: Optional[str]
+    ngrok_authtoken: Optional[str]
+
+
+def _get_optional_value(key: str) -> Optional[str]:
+    value = _get_value(key)
+    return str(value) if value else None
+
+
+def get_settings() -> Settings:
+    """
+    Snapshot of all settings. Unlike get_iot_token()/get_iot_device_id(),
+    missing required values are None here instead of KeyError.
+    """
+    return Settings(
+        iot_token=_get_optional_value("IOT_TOKEN"),
+        iot_host=get_iot_host(),
+        iot_device_id=_get_optional_value("IOT_DEVICE_ID"),
+        alert_color_hex=get_alert_color_hex(),
+        alert_color_hex_2=get_alert_color_hex_2(),
+        alert_duration_sec=get_alert_duration_sec(),
+        alert_blink_interval_sec=get_alert_blink_interval_sec(),
+        telegram_bot_token=get_telegram_bot_token(),
+        ngrok_authtoken=get_ngrok_authtoken(),
+    )
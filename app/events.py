@@ -0,0 +1,162 @@
+import asyncio
+import itertools
+import json
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from app.config import get_events_buffer_size
+
+# Events kept for clients that reconnect with Last-Event-ID.
+REPLAY_SIZE = 256
+
+
+class Subscription:
+    """
+    One consumer of the event bus with its own bounded buffer.
+    When the consumer falls behind, the oldest events are dropped and the
+    next get() first returns an "events.dropped" event with the count, so
+    a dashboard knows to re-read state instead of stalling the publishers.
+    """
+
+    def __init__(self, bus: "EventBus", max_buffer: int, types: Optional[set] = None) -> None:
+        self._bus = bus
+        self._buffer: deque[dict] = deque()
+        self._max_buffer = max_buffer
+        self._types = types
+        self._lock = threading.Lock()
+        self._ready = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self.dropped = 0
+        self._unreported_drops = 0
+        self.closed = False
+
+    def wants(self, event_type: str) -> bool:
+        if self._types is None:
+            return True
+        return event_type in self._types or event_type.split(".", 1)[0] in self._types
+
+    def _push(self, event: dict) -> None:
+        with self._lock:
+            if len(self._buffer) >= self._max_buffer:
+                self._buffer.popleft()
+                self.dropped += 1
+                self._unreported_drops += 1
+            self._buffer.append(event)
+        self._wake()
+
+    def _wake(self) -> None:
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._ready.set()
+        elif not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._ready.set)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[dict]:
+        """Next event, or None on timeout / after close()."""
+        while True:
+            with self._lock:
+                if self._unreported_drops:
+                    count, self._unreported_drops = self._unreported_drops, 0
+                    # No id: a reconnect must not skip the events still buffered.
+                    return {
+                        "id": None,
+                        "type": "events.dropped",
+                        "ts": time.time(),
+                        "data": {"count": count},
+                    }
+                if self._buffer:
+                    return self._buffer.popleft()
+                self._ready.clear()
+            if self.closed:
+                return None
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+
+    def close(self) -> None:
+        self.closed = True
+        self._bus._unsubscribe(self)
+        self._wake()
+
+
+class EventBus:
+    """
+    In-process pub/sub for alert and device events.
+    publish() never blocks and may be called from any thread: each
+    subscriber gets the event in its own buffer. The last REPLAY_SIZE
+    events are kept, so a reconnecting client (Last-Event-ID) misses none.
+    """
+
+    def __init__(self, max_buffer: Optional[int] = None, replay_size: int = REPLAY_SIZE) -> None:
+        self._max_buffer = max_buffer
+        self._subscribers: list[Subscription] = []
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._recent: deque[dict] = deque(maxlen=replay_size)
+        self.published = 0
+
+    def make_event(self, event_type: str, data: dict) -> dict:
+        return {"id": next(self._ids), "type": event_type, "ts": time.time(), "data": data}
+
+    def publish(self, event_type: str, data: dict) -> None:
+        with self._lock:
+            # Ids are taken under the lock so the replay buffer stays ordered.
+            event = self.make_event(event_type, data)
+            self._recent.append(event)
+            subscribers = list(self._subscribers)
+        self.published += 1
+        for subscriber in subscribers:
+            if subscriber.wants(event_type):
+                subscriber._push(event)
+
+    def subscribe(
+        self,
+        types: Optional[set] = None,
+        last_event_id: Optional[int] = None,
+        max_buffer: Optional[int] = None,
+    ) -> Subscription:
+        """
+        Register a consumer on the running loop. `types` filters by event
+        type or prefix ("alert" matches "alert.started"). Events newer than
+        `last_event_id` that are still kept for replay are queued first.
+        """
+        subscription = Subscription(
+            self, max_buffer or self._max_buffer or get_events_buffer_size(), types
+        )
+        with self._lock:
+            if last_event_id is not None:
+                for event in self._recent:
+                    if event["id"] > last_event_id and subscription.wants(event["type"]):
+                        subscription._push(event)
+            self._subscribers.append(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+
+    def stats(self) -> dict:
+        with self._lock:
+            subscribers = list(self._subscribers)
+        return {
+            "subscribers": len(subscribers),
+            "published": self.published,
+            "dropped": sum(subscriber.dropped for subscriber in subscribers),
+        }
+
+
+def format_sse(event: dict) -> str:
+    """Serialize an event as one text/event-stream message."""
+    data = json.dumps({"ts": event["ts"], **event["data"]}, separators=(",", ":"))
+    event_id = f"id: {event['id']}\n" if event["id"] is not None else ""
+    return f"{event_id}event: {event['type']}\ndata: {data}\n\n"
+
+
+event_bus = EventBus()
@@ -0,0 +1,271 @@
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from app.config import (
+    get_alert_history_batch_size,
+    get_alert_history_flush_sec,
+    get_alert_history_path,
+)
+
+logger = logging.getLogger("iot-alert")
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS alerts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        alert_id TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        source TEXT NOT NULL,
+        status TEXT NOT NULL,
+        started_at REAL NOT NULL,
+        ended_at REAL NOT NULL,
+        duration_sec REAL,
+        device_ids TEXT NOT NULL,
+        api_calls INTEGER NOT NULL,
+        api_errors INTEGER NOT NULL,
+        api_latency_ms REAL NOT NULL,
+        details TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS alerts_by_time ON alerts (started_at, id)",
+    "CREATE INDEX IF NOT EXISTS alerts_by_alert_id ON alerts (alert_id)",
+    """
+    CREATE TABLE IF NOT EXISTS alert_devices (
+        device_id TEXT NOT NULL,
+        started_at REAL NOT NULL,
+        alert_row INTEGER NOT NULL REFERENCES alerts (id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS alert_devices_by_time "
+    "ON alert_devices (device_id, started_at, alert_row)",
+)
+
+# Sentinel that makes the writer flush and exit.
+_STOP = object()
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    connection = sqlite3.connect(path, timeout=10)
+    # WAL lets /alerts/history read while the writer appends.
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+
+def encode_cursor(started_at: float, row_id: int) -> str:
+    return f"{started_at!r}:{row_id}"
+
+
+def decode_cursor(cursor: str) -> tuple[float, int]:
+    """Parse a cursor from encode_cursor(); ValueError if malformed."""
+    started_at, _, row_id = cursor.rpartition(":")
+    return float(started_at), int(row_id)
+
+
+class AlertHistory:
+    """
+    Append-only alert history in SQLite.
+    record() only puts the result on an in-memory queue; a background
+    thread writes whatever has accumulated in one transaction, so the
+    alert path never waits for the disk. Rows are indexed by start time
+    and by device, and query() pages with a keyset cursor, so a page
+    costs the same at row 10 and at row 10 million.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        batch_size: Optional[int] = None,
+        flush_sec: Optional[float] = None,
+        max_pending: int = 10000,
+    ) -> None:
+        self._path = path
+        self._batch_size = batch_size
+        self._flush_sec = flush_sec
+        self._pending: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._schema_ready = False
+        self.written = 0
+        self.dropped = 0
+
+    @property
+    def path(self) -> str:
+        return self._path or get_alert_history_path()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def _ensure_schema(self, connection: sqlite3.Connection) -> None:
+        if self._schema_ready:
+            return
+        with connection:
+            for statement in _SCHEMA:
+                connection.execute(statement)
+        self._schema_ready = True
+
+    def start(self) -> None:
+        """Start the writer thread (record() also starts it on first use)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._writer, name="alert-history", daemon=True
+                )
+                self._thread.start()
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Flush pending rows and stop the writer."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._pending.put(_STOP)
+        thread.join(timeout)
+
+    def record(self, row: dict) -> None:
+        """Queue one finished alert (AlertResult.to_record()); never blocks."""
+        if not self.enabled:
+            return
+        self.start()
+        try:
+            self._pending.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+            logger.warning("alert history queue is full, dropping %s", row.get("alert_id"))
+
+    def _writer(self) -> None:
+        batch_size = self._batch_size or get_alert_history_batch_size()
+        flush_sec = self._flush_sec or get_alert_history_flush_sec()
+        connection = _connect(self.path)
+        try:
+            self._ensure_schema(connection)
+            stopping = False
+            while not stopping:
+                item = self._pending.get()
+                batch = []
+                deadline = time.monotonic() + flush_sec
+                # Collect a batch: up to batch_size rows or flush_sec of waiting.
+                while True:
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    batch.append(item)
+                    if len(batch) >= batch_size:
+                        break
+                    try:
+                        item = self._pending.get(timeout=max(0.0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                if batch:
+                    try:
+                        self._write(connection, batch)
+                    except sqlite3.Error:
+                        logger.exception("writing %d alert history rows failed", len(batch))
+        finally:
+            connection.close()
+
+    def _write(self, connection: sqlite3.Connection, rows: list[dict]) -> None:
+        with connection:
+            for row in rows:
+                cursor = connection.execute(
+                    "INSERT INTO alerts (alert_id, kind, source, status, started_at, "
+                    "ended_at, duration_sec, device_ids, api_calls, api_errors, "
+                    "api_latency_ms, details) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        row["alert_id"],
+                        row["kind"],
+                        row["source"],
+                        row["status"],
+                        row["started_at"],
+                        row["ended_at"],
+                        row.get("duration_sec"),
+                        json.dumps(row["device_ids"]),
+                        row.get("api_calls", 0),
+                        row.get("api_errors", 0),
+                        row.get("api_latency_ms", 0.0),
+                        json.dumps(row.get("details")) if row.get("details") else None,
+                    ),
+                )
+                connection.executemany(
+                    "INSERT INTO alert_devices (device_id, started_at, alert_row) "
+                    "VALUES (?, ?, ?)",
+                    [
+                        (device_id, row["started_at"], cursor.lastrowid)
+                        for device_id in row["device_ids"]
+                    ],
+                )
+        self.written += len(rows)
+
+    def query(
+        self,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        device_id: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+    ) -> dict:
+        """
+        Newest alerts first. `cursor` is next_cursor of the previous page;
+        since/until are unix timestamps on the start time.
+        Returns {"items": [...], "next_cursor": str or None}.
+        """
+        if not self.enabled:
+            return {"items": [], "next_cursor": None}
+        conditions, params = [], []
+        table, time_col, id_col = "alerts", "a.started_at", "a.id"
+        if device_id is not None:
+            # Walk the per-device index instead of filtering all alerts.
+            table, time_col, id_col = "alert_devices", "d.started_at", "d.alert_row"
+            conditions.append("d.device_id = ?")
+            params.append(device_id)
+        if cursor:
+            started_at, row_id = decode_cursor(cursor)
+            conditions.append(f"({time_col} < ? OR ({time_col} = ? AND {id_col} < ?))")
+            params.extend([started_at, started_at, row_id])
+        if since is not None:
+            conditions.append(f"{time_col} >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append(f"{time_col} < ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        if table == "alerts":
+            sql = f"SELECT a.* FROM alerts a {where}"
+        else:
+            sql = f"SELECT a.* FROM alert_devices d JOIN alerts a ON a.id = d.alert_row {where}"
+        sql += f" ORDER BY {time_col} DESC, {id_col} DESC LIMIT ?"
+        params.append(limit + 1)
+
+        connection = _connect(self.path)
+        try:
+            self._ensure_schema(connection)
+            connection.row_factory = sqlite3.Row
+            rows = connection.execute(sql, params).fetchall()
+        finally:
+            connection.close()
+
+        items = [self._to_item(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = encode_cursor(last["started_at"], last["id"])
+        return {"items": items, "next_cursor": next_cursor}
+
+    @staticmethod
+    def _to_item(row: sqlite3.Row) -> dict:
+        item = dict(row)
+        item["device_ids"] = json.loads(item["device_ids"])
+        item["details"] = json.loads(item["details"]) if item["details"] else None
+        del item["id"]
+        return item
+
+
+alert_history = AlertHistory()
@@ -0,0 +1,141 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+from app.config import get_iot_state_cache_ttl_sec
+from app.iot_client_async import get_user_info
+
+logger = logging.getLogger("iot-alert")
+
+
+@dataclass
+class DeviceInfo:
+    """One device from /user/info with its current capability states."""
+    id: str
+    name: str
+    type: str
+    room_id: Optional[str] = None
+    household_id: Optional[str] = None
+    group_ids: tuple = ()
+    state: Optional[str] = None
+    capabilities: list = field(default_factory=list)
+
+    @property
+    def is_light(self) -> bool:
+        return self.type.startswith("devices.types.light")
+
+    def to_status(self) -> Optional[dict]:
+        """
+        Same shape as GET /devices/{id}, or None when /user/info did not
+        carry enough data (online state or capability states) to trust it.
+        """
+        if self.state is None:
+            return None
+        if any("state" not in cap for cap in self.capabilities if cap.get("retrievable", True)):
+            return None
+        return {
+            "status": "ok",
+            "id": self.id,
+            "name": self.name,
+            "type": self.type,
+            "state": self.state,
+            "capabilities": self.capabilities,
+        }
+
+
+@dataclass
+class DeviceInventory:
+    """
+    Parsed /user/info, indexed by device ID, type, room, household and group.
+    Index values are lists of device IDs.
+    """
+    devices: dict[str, DeviceInfo] = field(default_factory=dict)
+    by_type: dict[str, list[str]] = field(default_factory=dict)
+    by_room: dict[str, list[str]] = field(default_factory=dict)
+    by_household: dict[str, list[str]] = field(default_factory=dict)
+    by_group: dict[str, list[str]] = field(default_factory=dict)
+    room_names: dict[str, str] = field(default_factory=dict)
+    group_names: dict[str, str] = field(default_factory=dict)
+
+    @classmethod
+    def from_user_info(cls, data: dict) -> "DeviceInventory":
+        inventory = cls()
+        for room in data.get("rooms") or []:
+            if room.get("id"):
+                inventory.room_names[room["id"]] = room.get("name") or ""
+        for group in data.get("groups") or []:
+            if group.get("id"):
+                inventory.group_names[group["id"]] = group.get("name") or ""
+                inventory.by_group[group["id"]] = list(group.get("devices") or [])
+
+        for raw in data.get("devices") or []:
+            device_id = raw.get("id")
+            if not device_id:
+                continue
+            device = DeviceInfo(
+                id=device_id,
+                name=raw.get("name") or "",
+                type=str(raw.get("type") or ""),
+                room_id=raw.get("room"),
+                household_id=raw.get("household_id"),
+                group_ids=tuple(raw.get("groups") or ()),
+                state=raw.get("state"),
+                capabilities=list(raw.get("capabilities") or []),
+            )
+            inventory.devices[device_id] = device
+            inventory.by_type.setdefault(device.type, []).append(device_id)
+            if device.room_id:
+                inventory.by_room.setdefault(device.room_id, []).append(device_id)
+            if device.household_id:
+                inventory.by_household.setdefault(device.household_id, []).append(device_id)
+            for group_id in device.group_ids:
+                members = inventory.by_group.setdefault(group_id, [])
+                if device_id not in members:
+                    members.append(device_id)
+        return inventory
+
+    def get(self, device_id: str) -> Optional[DeviceInfo]:
+        return self.devices.get(device_id)
+
+    def lights(self) -> list[DeviceInfo]:
+        return [device for device in self.devices.values() if device.is_light]
+
+
+_inventory: Optional[DeviceInventory] = None
+_inventory_loaded_at = 0.0
+_inventory_lock = threading.Lock()
+
+
+async def load_inventory(token: Optional[str] = None, use_cache: bool = True) -> DeviceInventory:
+    """
+    Fetch /user/info once and index it, reused for IOT_STATE_CACHE_TTL_SEC.
+    Capability states in it are not kept up to date by sent actions, so
+    it does not seed the device state cache: alert snapshots read it
+    with use_cache=False (see remember_device_states_async).
+    """
+    global _inventory, _inventory_loaded_at
+    ttl_sec = get_iot_state_cache_ttl_sec()
+    if (
+        use_cache
+        and token is None
+        and _inventory is not None
+        and time.monotonic() - _inventory_loaded_at < ttl_sec
+    ):
+        return _inventory
+
+    inventory = DeviceInventory.from_user_info(await get_user_info(token))
+    logger.info("inventory: %d devices", len(inventory.devices))
+
+    if token is None:
+        with _inventory_lock:
+            _inventory = inventory
+            _inventory_loaded_at = time.monotonic()
+    return inventory
+
+
+def invalidate_inventory() -> None:
+    global _inventory
+    with _inventory_lock:
+        _inventory = None
@@ -1,16 +1,109 @@
-import colorsys
+import copy
+import json
 import logging
-from typing import Optional
-
-import requests
-
-from app.config import get_iot_device_id, get_iot_host, get_iot_token
+import random
+import threading
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional, Union
+
+# The color helpers moved to app.colors; they stay importable from here.
+from app.colors import (  # noqa: F401
+    COLOR_SPACES,
+    hex_colors_to_rgb,
+    hex_to_yandex_rgb,
+    interpolate_colors,
+    mix_colors,
+    rgb_int_to_yandex_hsv,
+    rgb_ints_to_yandex_hsv,
+)
+from app.config import (
+    get_iot_device_id,
+    get_iot_restore_retry_attempts,
+    get_iot_restore_retry_deadline_sec,
+    get_iot_retry_attempts,
+    get_iot_retry_base_delay_sec,
+    get_iot_retry_deadline_sec,
+    get_iot_retry_max_delay_sec,
+    get_iot_state_cache_ttl_sec,
+    get_iot_token,
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("iot-alert")
 
 DEFAULT_TIMEOUT_SEC = 5
 
+# Worth retrying: throttling and transient server-side failures.
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter, bounded by the number of attempts
+    and by a total deadline for the whole call.
+    """
+    attempts: int = 3
+    base_delay_sec: float = 0.2
+    max_delay_sec: float = 2.0
+    deadline_sec: float = 5.0
+
+    def backoff(self, attempt: int) -> float:
+        """Random delay after failed attempt number `attempt` (0-based)."""
+        return random.uniform(0, min(self.max_delay_sec, self.base_delay_sec * 2 ** attempt))
+
+    def next_delay(
+        self,
+        attempt: int,
+        started: float,
+        retry_after: Optional[float] = None,
+    ) -> Optional[float]:
+        """Delay before the next attempt, or None when the budget is spent."""
+        if attempt + 1 >= self.attempts:
+            return None
+        delay = self.backoff(attempt)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        if time.monotonic() - started + delay > self.deadline_sec:
+            return None
+        return delay
+
+
+NO_RETRY = RetryPolicy(attempts=1)
+
+
+def get_retry_policy() -> RetryPolicy:
+    return RetryPolicy(
+        attempts=get_iot_retry_attempts(),
+        base_delay_sec=get_iot_retry_base_delay_sec(),
+        max_delay_sec=get_iot_retry_max_delay_sec(),
+        deadline_sec=get_iot_retry_deadline_sec(),
+    )
+
+
+def get_restore_retry_policy() -> RetryPolicy:
+    """Policy for putting lamps back: more attempts, longer deadline."""
+    return RetryPolicy(
+        attempts=get_iot_restore_retry_attempts(),
+        base_delay_sec=get_iot_retry_base_delay_sec(),
+        max_delay_sec=get_iot_retry_max_delay_sec(),
+        deadline_sec=get_iot_restore_retry_deadline_sec(),
+    )
+
+
+def is_idempotent_actions(device_actions: dict[str, list[dict]]) -> bool:
+    """
+    Absolute state changes can be sent twice safely; relative ones
+    (e.g. brightness +10) cannot.
+    """
+    return not any(
+        (action.get("state") or {}).get("relative")
+        for actions in device_actions.values()
+        for action in actions
+    )
+
 
 def _headers(token: Optional[str] = None) -> dict:
     auth_token = token or get_iot_token()
@@ -20,65 +113,108 @@ def _headers(token: Optional[str] = None) -> dict:
     }
 
 
-def hex_to_yandex_rgb(color: str) -> int:
+def _run_async(call):
     """
-    Convert '#RRGGBB' or 'RRGGBB' to a 24-bit integer for Yandex.
-    Examples:
-      '#FF0000' -> 0xFF0000 -> 16711680
-      '00FF00'  -> 0x00FF00 -> 65280
+    Run `call(iot_client_async)` on a private event loop. The blocking API
+    below wraps the async client, so retries, rate limiting, the state
+    cache and events work the same way in both. Must not be called from
+    a running event loop: use app.iot_client_async there.
     """
-    s = color.strip().lower()
-    if s.startswith("#"):
-        s = s[1:]
-    if s.startswith("0x"):
-        s = s[2:]
+    # Imported here: app.iot_client_async is built on top of this module.
+    from app import iot_client_async
+    return iot_client_async.run_blocking(call(iot_client_async))
 
-    if len(s) != 6:
-        raise ValueError(f"Invalid hex color: {color}")
 
-    return int(s, 16)
-
-
-def rgb_int_to_yandex_hsv(rgb_value: int) -> dict:
+class DeviceStateCache:
     """
-    Convert a 24-bit integer (0xRRGGBB) to Yandex HSV payload.
-    Yandex expects h=0..360, s=0..100, v=0..100.
+    Recent device status responses keyed by device ID.
+    Filled by status reads and updated write-through from confirmed
+    action results, so back-to-back alerts skip the extra GET.
     """
-    if rgb_value < 0 or rgb_value > 0xFFFFFF:
-        raise ValueError(f"Invalid RGB value: {rgb_value}")
-
-    r = (rgb_value >> 16) & 0xFF
-    g = (rgb_value >> 8) & 0xFF
-    b = rgb_value & 0xFF
 
-    h, s, v = colorsys.rgb_to_hsv(r / 255.0, g / 255.0, b / 255.0)
-    h_val = int(round(h * 360))
-    if h_val >= 360:
-        h_val = 0
-
-    return {
-        "h": h_val,
-        "s": int(round(s * 100)),
-        "v": int(round(v * 100)),
-    }
-
-
-def get_device_status() -> dict:
+    def __init__(self, ttl_sec: Optional[float] = None) -> None:
+        self._ttl_sec = ttl_sec
+        self._entries: dict[str, tuple[dict, float]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def ttl_sec(self) -> float:
+        return get_iot_state_cache_ttl_sec() if self._ttl_sec is None else self._ttl_sec
+
+    def get(self, device_id: str) -> Optional[dict]:
+        """Return a copy of the cached status if it is younger than the TTL."""
+        with self._lock:
+            entry = self._entries.get(device_id)
+            if entry is None:
+                return None
+            status, stored_at = entry
+            if time.monotonic() - stored_at >= self.ttl_sec:
+                del self._entries[device_id]
+                return None
+            return copy.deepcopy(status)
+
+    def put(self, device_id: str, status: dict) -> None:
+        if self.ttl_sec <= 0 or status.get("status", "ok") != "ok":
+            return
+        with self._lock:
+            self._entries[device_id] = (copy.deepcopy(status), time.monotonic())
+
+    def invalidate(self, device_id: Optional[str] = None) -> None:
+        with self._lock:
+            if device_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(device_id, None)
+
+    def apply_actions(self, device_id: str, actions: list[dict], response: dict) -> None:
+        """
+        Write-through: copy action states into the cached status when the API
+        confirmed them (action_result DONE). Anything unconfirmed or unknown
+        drops the entry, so the next read goes to the API.
+        """
+        confirmed = set()
+        for device in response.get("devices", []) if isinstance(response, dict) else []:
+            if device.get("id") != device_id:
+                continue
+            for cap in device.get("capabilities", []):
+                state = cap.get("state") or {}
+                if (state.get("action_result") or {}).get("status") == "DONE":
+                    confirmed.add((cap.get("type"), state.get("instance")))
+
+        with self._lock:
+            entry = self._entries.get(device_id)
+            if entry is None:
+                return
+            status = entry[0]
+            for action in actions:
+                state = action.get("state") or {}
+                cap = _find_action_capability(status.get("capabilities", []), action)
+                if cap is None or (action.get("type"), state.get("instance")) not in confirmed:
+                    del self._entries[device_id]
+                    return
+                cap["state"] = dict(state)
+
+
+device_state_cache = DeviceStateCache()
+
+
+def invalidate_device_state(device_id: Optional[str] = None) -> None:
+    """Forget cached status for one device (or all devices)."""
+    device_state_cache.invalidate(device_id)
+
+
+def get_device_status(use_cache: bool = True) -> dict:
     """Get current device state."""
-    url = f"{get_iot_host()}/v1.0/devices/{get_iot_device_id()}"
-    resp = requests.get(url, headers=_headers(), timeout=DEFAULT_TIMEOUT_SEC)
-    resp.raise_for_status()
-    data = resp.json()
-    logger.info("device status: %s", data)
-    return data
+    return get_device_status_by_id(get_iot_device_id(), use_cache=use_cache)
 
 
-def get_device_status_by_id(device_id: str, token: Optional[str] = None) -> dict:
-    """Get device state by ID."""
-    url = f"{get_iot_host()}/v1.0/devices/{device_id}"
-    resp = requests.get(url, headers=_headers(token), timeout=DEFAULT_TIMEOUT_SEC)
-    resp.raise_for_status()
-    return resp.json()
+def get_device_status_by_id(
+    device_id: str,
+    token: Optional[str] = None,
+    use_cache: bool = True,
+) -> dict:
+    """Get device state by ID (served from the state cache when fresh)."""
+    return _run_async(lambda aio: aio.get_device_status_by_id(device_id, token, use_cache))
 
 
 def find_capability(capabilities: list, cap_type: str) -> Optional[dict]:
@@ -88,6 +224,22 @@ def find_capability(capabilities: list, cap_type: str) -> Optional[dict]:
     return None
 
 
+def _find_action_capability(capabilities: list, action: dict) -> Optional[dict]:
+    """Capability an action targets; range/mode/toggle also match by instance."""
+    cap_type = action.get("type")
+    if cap_type in ("devices.capabilities.color_setting", "devices.capabilities.on_off"):
+        return find_capability(capabilities, cap_type)
+    instance = (action.get("state") or {}).get("instance")
+    for cap in capabilities:
+        if cap.get("type") != cap_type:
+            continue
+        params = cap.get("parameters") or {}
+        state = cap.get("state") or {}
+        if (params.get("instance") or state.get("instance")) == instance:
+            return cap
+    return None
+
+
 def is_device_available(status: dict) -> bool:
     """Check if device is online."""
     return status.get("state") == "online"
@@ -157,55 +309,71 @@ def get_color_model(status: dict) -> Optional[str]:
     return None
 
 
-def send_actions(actions: list[dict]) -> dict:
-    """Send actions to the device."""
-    url = f"{get_iot_host()}/v1.0/devices/actions"
-    payload = {
+def actions_payload(actions: list[dict], device_id: Optional[str] = None) -> dict:
+    """Build the /devices/actions body for a single device."""
+    return device_actions_payload({device_id or get_iot_device_id(): actions})
+
+
+def device_actions_payload(device_actions: dict[str, list[dict]]) -> dict:
+    """Build one /devices/actions body covering several devices."""
+    return {
         "devices": [
             {
-                "id": get_iot_device_id(),
+                "id": device_id,
                 "actions": actions,
             }
+            for device_id, actions in device_actions.items()
+            if actions
         ]
     }
-    resp = requests.post(url, headers=_headers(), json=payload, timeout=DEFAULT_TIMEOUT_SEC)
-    resp.raise_for_status()
-    data = resp.json()
-    logger.info("actions response: %s", data)
-    return data
 
 
-def get_user_devices(token: Optional[str] = None) -> list[dict]:
-    """Get all user devices from Yandex IoT."""
-    url = f"{get_iot_host()}/v1.0/user/info"
-    resp = requests.get(url, headers=_headers(token), timeout=DEFAULT_TIMEOUT_SEC)
-    resp.raise_for_status()
-    data = resp.json()
-    return data.get("devices", []) if isinstance(data, dict) else []
+def encode_payload(payload: dict) -> bytes:
+    """Serialize a request body the way httpx does (compact UTF-8 JSON)."""
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
 
 
-def turn_on() -> None:
-    """Turn the device on."""
-    send_actions([
-        {
-            "type": "devices.capabilities.on_off",
-            "state": {"instance": "on", "value": True},
-        }
-    ])
+@dataclass(frozen=True)
+class PreparedActions:
+    """
+    A /devices/actions request built once: the actions, the encoded body
+    and what sending would otherwise recompute. Blink ticks and repeated
+    colors send the same PreparedActions many times.
+    """
+    device_actions: dict[str, list[dict]]
+    body: bytes
+    device_ids: tuple[str, ...]
+    idempotent: bool
 
 
-def turn_off() -> None:
-    """Turn the device off."""
-    send_actions([
-        {
-            "type": "devices.capabilities.on_off",
-            "state": {"instance": "on", "value": False},
-        }
-    ])
+def prepare_actions(device_actions: dict[str, list[dict]]) -> PreparedActions:
+    return PreparedActions(
+        device_actions=device_actions,
+        body=encode_payload(device_actions_payload(device_actions)),
+        device_ids=tuple(device_actions),
+        idempotent=is_idempotent_actions(device_actions),
+    )
 
 
-def set_color_rgb_int(rgb_value: int, color_model: Optional[str] = None) -> None:
-    """Set color by 24-bit integer (0..16777215) using the device model."""
+@lru_cache(maxsize=256)
+def prepared_color_actions(
+    device_id: str,
+    rgb_value: int,
+    color_model: Optional[str] = None,
+) -> PreparedActions:
+    """Memoized request setting one device's color (set_color_rgb_int)."""
+    return prepare_actions({device_id: [color_action(rgb_value, color_model)]})
+
+
+def on_off_action(value: bool) -> dict:
+    return {
+        "type": "devices.capabilities.on_off",
+        "state": {"instance": "on", "value": value},
+    }
+
+
+def color_action(rgb_value: int, color_model: Optional[str] = None) -> dict:
+    """Color action for a 24-bit integer (0..16777215) using the device model."""
     if color_model == "rgb":
         instance = "rgb"
         value = rgb_value
@@ -217,37 +385,154 @@ def set_color_rgb_int(rgb_value: int, color_model: Optional[str] = None) -> None
         instance = "hsv"
         value = rgb_int_to_yandex_hsv(rgb_value)
 
-    send_actions([
-        {
-            "type": "devices.capabilities.color_setting",
-            "state": {
-                "instance": instance,
-                "value": value,
-            },
-        }
-    ])
+    return {
+        "type": "devices.capabilities.color_setting",
+        "state": {
+            "instance": instance,
+            "value": value,
+        },
+    }
+
+
+def brightness_action(value: int) -> dict:
+    return {
+        "type": "devices.capabilities.range",
+        "state": {
+            "instance": "brightness",
+            "value": value,
+        },
+    }
+
+
+def color_state_action(state: dict) -> dict:
+    return {
+        "type": "devices.capabilities.color_setting",
+        "state": state,
+    }
+
+
+@dataclass
+class DeviceSnapshot:
+    available: bool
+    was_on: bool
+    color_state: Optional[dict]
+    color_model: Optional[str]
+    brightness: Optional[int]
+
+
+def snapshot_from_status(status: dict) -> DeviceSnapshot:
+    """
+    Capture device state:
+    - availability (online)
+    - whether it was on
+    - original color
+    """
+    return DeviceSnapshot(
+        available=is_device_available(status),
+        was_on=is_device_on(status),
+        color_state=get_color_state(status),
+        color_model=get_color_model(status),
+        brightness=get_brightness_value(status),
+    )
+
+
+def state_actions(
+    target: DeviceSnapshot,
+    current: Optional[DeviceSnapshot] = None,
+) -> list[dict]:
+    """
+    Minimal actions that bring a device from `current` to `target`, for one
+    multi-capability request. Target fields that are None are left alone;
+    current fields that are None (or no current at all) count as unknown,
+    so the capability is always sent. Turning on goes first, turning off
+    last, so color and brightness are applied to a lit lamp.
+    """
+    turn_on = target.was_on and (current is None or not current.was_on)
+    turn_off = not target.was_on and (current is None or current.was_on)
+    actions = [on_off_action(True)] if turn_on else []
+    if target.color_state is not None and (
+        current is None or current.color_state != target.color_state
+    ):
+        actions.append(color_state_action(target.color_state))
+    if target.brightness is not None and (
+        current is None or current.brightness != target.brightness
+    ):
+        actions.append(brightness_action(target.brightness))
+    if turn_off:
+        actions.append(on_off_action(False))
+    return actions
+
+
+def device_state_actions(
+    targets: dict[str, DeviceSnapshot],
+    current: Optional[dict[str, Optional[DeviceSnapshot]]] = None,
+) -> dict[str, list[dict]]:
+    """state_actions() for several devices; devices with nothing to do are left out."""
+    current = current or {}
+    device_actions = {
+        device_id: state_actions(target, current.get(device_id))
+        for device_id, target in targets.items()
+    }
+    return {device_id: actions for device_id, actions in device_actions.items() if actions}
+
+
+def apply_device_states(
+    targets: dict[str, DeviceSnapshot],
+    current: Optional[dict[str, Optional[DeviceSnapshot]]] = None,
+    retry: Optional[RetryPolicy] = None,
+) -> Optional[dict]:
+    """Bring devices to the target states in one request (None if nothing to do)."""
+    device_actions = device_state_actions(targets, current)
+    if not device_actions:
+        return None
+    return send_device_actions(device_actions, retry=retry)
+
+
+def send_actions(actions: list[dict]) -> dict:
+    """Send actions to the device."""
+    return send_device_actions({get_iot_device_id(): actions})
+
+
+def send_device_actions(
+    device_actions: Union[dict[str, list[dict]], PreparedActions],
+    retry: Optional[RetryPolicy] = None,
+) -> dict:
+    """Send actions for several devices in one request."""
+    return _run_async(lambda aio: aio.send_device_actions(device_actions, retry=retry))
+
+
+def get_user_info(token: Optional[str] = None) -> dict:
+    """Get the raw /user/info response (devices, rooms, groups, households)."""
+    return _run_async(lambda aio: aio.get_user_info(token))
+
+
+def get_user_devices(token: Optional[str] = None) -> list[dict]:
+    """Get all user devices from Yandex IoT."""
+    return get_user_info(token).get("devices", [])
+
+
+def turn_on() -> None:
+    """Turn the device on."""
+    send_actions([on_off_action(True)])
+
+
+def turn_off() -> None:
+    """Turn the device off."""
+    send_actions([on_off_action(False)])
+
+
+def set_color_rgb_int(rgb_value: int, color_model: Optional[str] = None) -> None:
+    """Set color by 24-bit integer (0..16777215) using the device model."""
+    send_device_actions(prepared_color_actions(get_iot_device_id(), rgb_value, color_model))
 
 
 def set_brightness(value: int) -> None:
     """Set brightness (0..100)."""
-    send_actions([
-        {
-            "type": "devices.capabilities.range",
-            "state": {
-                "instance": "brightness",
-                "value": value,
-            },
-        }
-    ])
+    send_actions([brightness_action(value)])
 
 
 def restore_color_state(state: dict) -> None:
     """
     Restore original color state.
     """
-    send_actions([
-        {
-            "type": "devices.capabilities.color_setting",
-            "state": state,
-        }
-    ])
+    send_actions([color_state_action(state)])
@@ -0,0 +1,445 @@
+import asyncio
+import contextvars
+import logging
+import time
+import weakref
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional, TypeVar, Union
+
+import httpx
+
+from app.config import (
+    get_iot_device_id,
+    get_iot_host,
+    get_iot_pool_maxsize,
+    get_iot_status_concurrency,
+    get_iot_status_timeout_sec,
+)
+from app.events import event_bus
+from app.iot_client import (
+    DEFAULT_TIMEOUT_SEC,
+    RETRY_STATUSES,
+    DeviceSnapshot,
+    PreparedActions,
+    RetryPolicy,
+    _headers,
+    brightness_action,
+    color_state_action,
+    device_state_actions,
+    device_state_cache,
+    get_retry_policy,
+    on_off_action,
+    prepare_actions,
+    prepared_color_actions,
+    snapshot_from_status,
+)
+from app.metrics import iot_endpoint, record_iot_request
+from app.rate_limit import RateLimited, parse_retry_after, rate_limiter
+from app.tracing import tracer
+
+logger = logging.getLogger("iot-alert")
+# httpx logs every request at INFO; responses are already logged here.
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+# Statuses that mean "slow down"; they pause the rate limiter buckets.
+THROTTLE_STATUSES = (429, 503)
+
+T = TypeVar("T")
+
+
+@dataclass
+class ApiCallStats:
+    """IoT API requests made while tracking was on (see track_api_calls)."""
+    calls: int = 0
+    errors: int = 0
+    latency_sec: float = 0.0
+
+    def add(self, latency_sec: float, failed: bool) -> None:
+        self.calls += 1
+        self.errors += int(failed)
+        self.latency_sec += latency_sec
+
+
+_api_call_stats: contextvars.ContextVar[Optional[ApiCallStats]] = contextvars.ContextVar(
+    "iot_api_call_stats", default=None
+)
+
+
+def track_api_calls() -> ApiCallStats:
+    """
+    Count IoT API requests of the current task (and tasks it starts from
+    now on) into a fresh ApiCallStats. Rate limiter waits are not counted.
+    """
+    stats = ApiCallStats()
+    _api_call_stats.set(stats)
+    return stats
+
+
+async def _timed(
+    method: str,
+    path: str,
+    request: Awaitable[httpx.Response],
+) -> httpx.Response:
+    """Await one HTTP request, recording metrics and per-alert call stats."""
+    started = time.perf_counter()
+    status = "error"
+    with tracer.span("iot.request", method=method, endpoint=iot_endpoint(path)) as span:
+        try:
+            resp = await request
+            status = resp.status_code
+            return resp
+        finally:
+            duration_sec = time.perf_counter() - started
+            span.set_attribute("status", status)
+            record_iot_request(method, path, status, duration_sec)
+            stats = _api_call_stats.get()
+            if stats is not None:
+                stats.add(duration_sec, status == "error" or status >= 400)
+
+
+def _retry_after_for(exc: Exception, idempotent: bool) -> tuple[bool, Optional[float]]:
+    """
+    (retryable, Retry-After seconds) for a failed request.
+    Non-idempotent calls are retried only when the API surely did not
+    apply them: 429 or a connection that was never established.
+    """
+    if isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+        retryable = status == 429 or (idempotent and status in RETRY_STATUSES)
+        return retryable, parse_retry_after(exc.response.headers.get("Retry-After"))
+    if isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout)):
+        return True, None
+    if isinstance(exc, httpx.TransportError):
+        return idempotent, None
+    return False, None
+
+
+async def call_with_retry(
+    call: Callable[[], Awaitable[T]],
+    policy: Optional[RetryPolicy] = None,
+    idempotent: bool = True,
+    what: str = "IoT request",
+) -> T:
+    """Run an IoT call under a retry policy (see RetryPolicy)."""
+    policy = policy or get_retry_policy()
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        try:
+            return await call()
+        except httpx.HTTPError as exc:
+            retryable, retry_after = _retry_after_for(exc, idempotent)
+            delay = policy.next_delay(attempt, started, retry_after) if retryable else None
+            if delay is None:
+                raise
+            logger.warning(
+                "%s failed (%s), retry %d in %.2fs", what, exc, attempt + 1, delay
+            )
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+class AsyncIotClient:
+    """
+    HTTP client for Yandex IoT built on a pooled httpx.AsyncClient.
+    Keeps connections alive between calls, so blinks do not pay a new
+    TCP+TLS handshake each time, and waiting on the API costs a coroutine,
+    not a threadpool worker.
+    """
+
+    def __init__(
+        self,
+        max_connections: Optional[int] = None,
+        timeout: float = DEFAULT_TIMEOUT_SEC,
+    ) -> None:
+        pool_size = max_connections or get_iot_pool_maxsize()
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size,
+            ),
+            timeout=timeout,
+        )
+
+    async def get(
+        self,
+        path: str,
+        token: Optional[str] = None,
+        device_ids=(),
+        priority: bool = False,
+        retry: Optional[RetryPolicy] = None,
+    ) -> dict:
+        url = f"{get_iot_host()}{path}"
+
+        async def call() -> dict:
+            await rate_limiter.acquire(device_ids, priority=priority)
+            resp = await _timed("GET", path, self.client.get(url, headers=_headers(token)))
+            return self._check(resp, device_ids)
+
+        return await call_with_retry(call, retry, idempotent=True, what=f"GET {path}")
+
+    async def post(
+        self,
+        path: str,
+        payload: Union[dict, bytes],
+        token: Optional[str] = None,
+        device_ids=(),
+        priority: bool = False,
+        block: bool = True,
+        retry: Optional[RetryPolicy] = None,
+        idempotent: bool = False,
+    ) -> dict:
+        """
+        POST through the rate limiter. With block=False a request that
+        would have to wait raises RateLimited without touching the API.
+        Every retry attempt takes its own token. Bytes payloads are
+        already serialized JSON and are sent as is.
+        """
+        url = f"{get_iot_host()}{path}"
+        body = {"content": payload} if isinstance(payload, bytes) else {"json": payload}
+
+        async def call() -> dict:
+            await rate_limiter.acquire(device_ids, priority=priority, block=block)
+            resp = await _timed(
+                "POST", path, self.client.post(url, headers=_headers(token), **body)
+            )
+            return self._check(resp, device_ids)
+
+        return await call_with_retry(call, retry, idempotent=idempotent, what=f"POST {path}")
+
+    @staticmethod
+    def _check(resp: httpx.Response, device_ids) -> dict:
+        if resp.status_code in THROTTLE_STATUSES:
+            rate_limiter.penalize(
+                parse_retry_after(resp.headers.get("Retry-After")), device_ids
+            )
+        resp.raise_for_status()
+        return resp.json()
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+
+# One client per event loop: httpx connections cannot be shared across loops.
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncIotClient]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_async_client() -> AsyncIotClient:
+    """
+    Return the IoT client bound to the running event loop.
+    A new loop (e.g. asyncio.run in a sync wrapper) gets its own client.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = AsyncIotClient()
+        _async_clients[loop] = client
+    return client
+
+
+async def close_async_client() -> None:
+    """Close the client of the running loop (call on shutdown)."""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def run_blocking(coro: Awaitable[T]) -> T:
+    """
+    Run a coroutine on a private event loop and close that loop's client
+    afterwards (the blocking wrappers in app.iot_client and app.alerts).
+    """
+    async def runner():
+        try:
+            return await coro
+        finally:
+            await close_async_client()
+    return asyncio.run(runner())
+
+
+async def get_device_status(use_cache: bool = True) -> dict:
+    """Get current device state."""
+    return await get_device_status_by_id(get_iot_device_id(), use_cache=use_cache)
+
+
+async def get_device_status_by_id(
+    device_id: str,
+    token: Optional[str] = None,
+    use_cache: bool = True,
+) -> dict:
+    """Get device state by ID (served from the state cache when fresh)."""
+    if use_cache:
+        cached = device_state_cache.get(device_id)
+        if cached is not None:
+            logger.info("device status (cached): %s", cached)
+            return cached
+    data = await get_async_client().get(
+        f"/v1.0/devices/{device_id}", token, device_ids=(device_id,)
+    )
+    logger.info("device status: %s", data)
+    device_state_cache.put(device_id, data)
+    _publish_status(device_id, data)
+    return data
+
+
+def _publish_status(device_id: str, status: dict) -> None:
+    snapshot = snapshot_from_status(status)
+    event_bus.publish("device.status", {
+        "device_id": device_id,
+        "online": snapshot.available,
+        "on": snapshot.was_on,
+        "color": snapshot.color_state,
+        "brightness": snapshot.brightness,
+    })
+
+
+def _publish_actions(device_actions: dict[str, list[dict]], error: Optional[str] = None) -> None:
+    event_bus.publish("device.actions", {
+        "device_ids": list(device_actions),
+        "actions": {
+            device_id: [
+                {
+                    "type": action.get("type"),
+                    "instance": (action.get("state") or {}).get("instance"),
+                    "value": (action.get("state") or {}).get("value"),
+                }
+                for action in actions
+            ]
+            for device_id, actions in device_actions.items()
+        },
+        "ok": error is None,
+        "error": error,
+    })
+
+
+async def get_device_statuses(
+    device_ids: list[str],
+    concurrency: Optional[int] = None,
+    timeout_sec: Optional[float] = None,
+) -> dict[str, Optional[dict]]:
+    """
+    Read many device statuses concurrently.
+    At most `concurrency` requests are in flight; each gets `timeout_sec`.
+    Devices that time out or fail map to None instead of failing the batch.
+    """
+    limit = asyncio.Semaphore(concurrency or get_iot_status_concurrency())
+    budget = timeout_sec or get_iot_status_timeout_sec()
+
+    async def fetch(device_id: str) -> Optional[dict]:
+        async with limit:
+            try:
+                return await asyncio.wait_for(get_device_status_by_id(device_id), budget)
+            except asyncio.TimeoutError:
+                logger.warning("status of %s timed out after %.1fs", device_id, budget)
+            except httpx.HTTPError as exc:
+                logger.warning("status of %s failed: %s", device_id, exc)
+            return None
+
+    statuses = await asyncio.gather(*(fetch(device_id) for device_id in device_ids))
+    return dict(zip(device_ids, statuses))
+
+
+async def get_user_info(token: Optional[str] = None) -> dict:
+    """Get the raw /user/info response (devices, rooms, groups, households)."""
+    data = await get_async_client().get("/v1.0/user/info", token)
+    return data if isinstance(data, dict) else {}
+
+
+async def get_user_devices(token: Optional[str] = None) -> list[dict]:
+    """Get all user devices from Yandex IoT."""
+    return (await get_user_info(token)).get("devices", [])
+
+
+async def send_actions(actions: list[dict]) -> dict:
+    """Send actions to the device."""
+    return await send_device_actions({get_iot_device_id(): actions})
+
+
+async def send_device_actions(
+    device_actions: Union[dict[str, list[dict]], PreparedActions],
+    priority: bool = False,
+    block: bool = True,
+    retry: Optional[RetryPolicy] = None,
+) -> dict:
+    """
+    Send actions for several devices in one request.
+    priority=True lets the request use the rate limiter reserve (restore);
+    block=False raises RateLimited instead of waiting for capacity.
+    retry defaults to the configured policy; pass NO_RETRY for one attempt.
+    Requests sent repeatedly (blink ticks) pass a PreparedActions.
+    """
+    prepared = (
+        device_actions if isinstance(device_actions, PreparedActions)
+        else prepare_actions(device_actions)
+    )
+    device_actions = prepared.device_actions
+    with tracer.span(
+        "iot.send_actions", devices=len(device_actions), priority=priority, block=block
+    ):
+        try:
+            data = await get_async_client().post(
+                "/v1.0/devices/actions",
+                prepared.body,
+                device_ids=prepared.device_ids,
+                priority=priority,
+                block=block,
+                retry=retry,
+                idempotent=prepared.idempotent,
+            )
+        except RateLimited:
+            # Nothing was sent, the cached state is still accurate.
+            raise
+        except BaseException as exc:
+            # Covers cancellation at the alert deadline: the outcome is unknown.
+            for device_id in device_actions:
+                device_state_cache.invalidate(device_id)
+            if isinstance(exc, Exception):
+                _publish_actions(device_actions, str(exc))
+            raise
+        logger.info("actions response: %s", data)
+        for device_id, actions in device_actions.items():
+            device_state_cache.apply_actions(device_id, actions, data)
+        _publish_actions(device_actions)
+        return data
+
+
+async def apply_device_states(
+    targets: dict[str, DeviceSnapshot],
+    current: Optional[dict[str, Optional[DeviceSnapshot]]] = None,
+    priority: bool = False,
+    retry: Optional[RetryPolicy] = None,
+) -> Optional[dict]:
+    """Bring devices to the target states in one request (None if nothing to do)."""
+    device_actions = device_state_actions(targets, current)
+    if not device_actions:
+        return None
+    return await send_device_actions(device_actions, priority=priority, retry=retry)
+
+
+async def turn_on() -> None:
+    """Turn the device on."""
+    await send_actions([on_off_action(True)])
+
+
+async def turn_off() -> None:
+    """Turn the device off."""
+    await send_actions([on_off_action(False)])
+
+
+async def set_color_rgb_int(rgb_value: int, color_model: Optional[str] = None) -> None:
+    """Set color by 24-bit integer (0..16777215) using the device model."""
+    await send_device_actions(prepared_color_actions(get_iot_device_id(), rgb_value, color_model))
+
+
+async def set_brightness(value: int) -> None:
+    """Set brightness (0..100)."""
+    await send_actions([brightness_action(value)])
+
+
+async def restore_color_state(state: dict) -> None:
+    """
+    Restore original color state.
+    """
+    await send_actions([color_state_action(state)])
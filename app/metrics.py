@@ -0,0 +1,285 @@
+import bisect
+import math
+import threading
+from typing import Callable, Optional
+
+# Seconds; covers fast local stubs up to the client timeout.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+DURATION_BUCKETS = (1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+RATE_BUCKETS = (0.25, 0.5, 1.0, 2.0, 3.0, 4.0, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """
+        Child for one label combination. Children are created once and
+        cached, so hot paths can keep the returned object.
+        """
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self) -> None:
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def _samples(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+            for values, child in list(self._children.items())
+        ]
+
+
+class _GaugeChild:
+    __slots__ = ("value", "callback")
+
+    def __init__(self) -> None:
+        self.value = 0.0
+        self.callback: Optional[Callable[[], float]] = None
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def set_function(self, callback: Callable[[], float]) -> None:
+        """Read the value from `callback` at scrape time instead."""
+        self.callback = callback
+
+    def get(self) -> float:
+        return self.callback() if self.callback is not None else self.value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self) -> _GaugeChild:
+        return _GaugeChild()
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def set_function(self, callback: Callable[[], float]) -> None:
+        self.labels().set_function(callback)
+
+    def _samples(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.get())}"
+            for values, child in list(self._children.items())
+        ]
+
+
+class _HistogramChild:
+    __slots__ = ("upper_bounds", "counts", "sum", "_lock")
+
+    def __init__(self, upper_bounds: tuple) -> None:
+        self.upper_bounds = upper_bounds
+        # Per-bucket (not cumulative) counts; the last one is +Inf.
+        self.counts = [0] * (len(upper_bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.upper_bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple = (),
+        buckets: tuple = LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def _samples(self) -> list[str]:
+        lines = []
+        for values, child in list(self._children.items()):
+            with child._lock:
+                counts = list(child.counts)
+                total = child.sum
+            cumulative = 0
+            for upper, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = f'le="{_format_value(upper)}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}"
+                )
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Minimal in-process Prometheus registry (text exposition format 0.0.4).
+    Recording is a dict lookup plus an uncontended lock; all formatting
+    happens at scrape time.
+    """
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple = (),
+        buckets: tuple = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+registry = MetricsRegistry()
+
+IOT_REQUESTS = registry.counter(
+    "iot_api_requests_total",
+    "Yandex IoT API requests by endpoint, method and HTTP status (error = no response).",
+    ("endpoint", "method", "status"),
+)
+IOT_REQUEST_SECONDS = registry.histogram(
+    "iot_api_request_duration_seconds",
+    "Yandex IoT API request latency.",
+    ("endpoint", "method"),
+)
+IOT_RATE_LIMITED = registry.counter(
+    "iot_api_throttled_total",
+    "Times the IoT API answered 429/503 and the rate limiter paused.",
+)
+ALERTS = registry.counter(
+    "alerts_total",
+    "Finished alerts by kind, final status and trigger source.",
+    ("kind", "status", "source"),
+)
+ALERT_SECONDS = registry.histogram(
+    "alert_duration_seconds",
+    "Wall time of finished alerts, restore included.",
+    ("kind",),
+    DURATION_BUCKETS,
+)
+ALERT_BLINK_RATE = registry.histogram(
+    "alert_blink_rate_hz",
+    "Achieved blink rate of finished blinking alerts.",
+    (),
+    RATE_BUCKETS,
+)
+ALERTS_ACTIVE = registry.gauge("alerts_active", "Alerts currently running.")
+ALERT_QUEUE_DEPTH = registry.gauge("alert_queue_depth", "Alerts waiting for a worker.")
+ALERT_QUEUE_BUSY = registry.gauge("alert_queue_busy_workers", "Queue workers running an alert.")
+TELEGRAM_UPDATES = registry.counter(
+    "telegram_updates_total",
+    "Telegram updates by ingestion mode (webhook, polling) and outcome.",
+    ("mode", "result"),
+)
+CONFIG_RELOADS = registry.counter(
+    "config_reloads_total",
+    "Times config.yaml was re-read because it changed (or was invalidated).",
+)
+
+
+def iot_endpoint(path: str) -> str:
+    """Collapse device IDs so the endpoint label stays low-cardinality."""
+    if path.startswith("/v1.0/devices/") and path != "/v1.0/devices/actions":
+        return "/v1.0/devices/{id}"
+    return path
+
+
+def record_iot_request(method: str, path: str, status, duration_sec: float) -> None:
+    endpoint = iot_endpoint(path)
+    IOT_REQUESTS.labels(endpoint, method, str(status)).inc()
+    IOT_REQUEST_SECONDS.labels(endpoint, method).observe(duration_sec)
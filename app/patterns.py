@@ -0,0 +1,177 @@
+from array import array
+from dataclasses import dataclass, replace
+from typing import Optional
+
+from app.colors import hex_colors_to_rgb, hex_to_yandex_rgb, interpolate_colors
+from app.iot_client import (
+    DeviceSnapshot,
+    PreparedActions,
+    brightness_action,
+    color_action,
+    on_off_action,
+    prepare_actions,
+)
+
+
+@dataclass(frozen=True)
+class Frame:
+    """
+    One step of a light pattern: color, brightness and power. None fields
+    are left as they are; `ticks` is how many blink intervals it is shown.
+    """
+    color_hex: Optional[str] = None
+    brightness: Optional[int] = None
+    on: bool = True
+    ticks: int = 1
+
+
+@dataclass(frozen=True)
+class Pattern:
+    """A named loop of frames; interval_sec=None uses ALERT_BLINK_INTERVAL."""
+    name: str
+    frames: tuple[Frame, ...]
+    interval_sec: Optional[float] = None
+
+    @property
+    def start_color_hex(self) -> Optional[str]:
+        """Color the lamps light up in, together with turning them on."""
+        return next((f.color_hex for f in self.frames if f.color_hex is not None), None)
+
+    @property
+    def touches(self) -> frozenset:
+        """Capabilities besides color the pattern changes ("brightness", "on")."""
+        touched = set()
+        for frame in self.frames:
+            if frame.brightness is not None:
+                touched.add("brightness")
+            if not frame.on:
+                touched.add("on")
+        return frozenset(touched)
+
+
+def blink(colors: list[str]) -> Pattern:
+    """Two colors in turn (the rainbow alert)."""
+    return Pattern("blink", (Frame(colors[0]), Frame(colors[1])))
+
+
+def cycle(colors: list[str]) -> Pattern:
+    """Every color in turn."""
+    return Pattern("cycle", tuple(Frame(color) for color in colors))
+
+
+BREATHE_LEVELS = (100, 80, 60, 40, 20, 40, 60, 80)
+
+
+def breathe(colors: list[str]) -> Pattern:
+    """The first color, brightness going down and up again."""
+    frames = [Frame(colors[0], BREATHE_LEVELS[0])]
+    frames += [Frame(brightness=level) for level in BREATHE_LEVELS[1:]]
+    return Pattern("breathe", tuple(frames))
+
+
+def sos(colors: list[str]) -> Pattern:
+    """· · · — — — · · · in the first color; one tick is one Morse unit."""
+    def lit(ticks: int) -> Frame:
+        return Frame(colors[0], ticks=ticks)
+
+    def dark(ticks: int) -> Frame:
+        return Frame(on=False, ticks=ticks)
+
+    s = [lit(1), dark(1), lit(1), dark(1), lit(1)]
+    o = [lit(3), dark(1), lit(3), dark(1), lit(3)]
+    return Pattern("sos", tuple(s + [dark(3)] + o + [dark(3)] + s + [dark(7)]))
+
+
+FADE_STEPS = 8
+
+
+def fade(colors: list[str]) -> Pattern:
+    """Smooth transitions (through HSV) from color to color and back to the first."""
+    rgb = hex_colors_to_rgb(colors)
+    frames = []
+    for start, end in zip(rgb, rgb[1:] + rgb[:1]):
+        steps = interpolate_colors(start, end, FADE_STEPS + 1, space="hsv")[:-1]
+        frames += [Frame(f"#{value:06X}") for value in steps]
+    return Pattern("fade", tuple(frames))
+
+
+# Pattern name -> (builder, number of colors it needs).
+PATTERNS = {
+    "blink": (blink, 2),
+    "cycle": (cycle, 2),
+    "fade": (fade, 2),
+    "breathe": (breathe, 1),
+    "sos": (sos, 1),
+}
+
+
+def build_pattern(
+    name: str,
+    colors: list[str],
+    interval_sec: Optional[float] = None,
+) -> Pattern:
+    """Built-in pattern by name; ValueError for unknown names and bad colors."""
+    if name not in PATTERNS:
+        raise ValueError(f"Unknown pattern: {name} (known: {', '.join(PATTERNS)})")
+    builder, min_colors = PATTERNS[name]
+    if len(colors) < min_colors:
+        raise ValueError(f"Pattern {name} needs at least {min_colors} colors")
+    if interval_sec is not None and interval_sec <= 0:
+        raise ValueError("interval_sec must be positive")
+    for color in colors:
+        hex_to_yandex_rgb(color)
+    return replace(builder(list(colors)), interval_sec=interval_sec)
+
+
+@dataclass
+class CompiledPattern:
+    """
+    A pattern for a concrete set of lamps. Each distinct frame is compiled
+    once into a ready /devices/actions request; `timeline` holds one frame
+    index per tick. `frames[i]` is None when frame i needs no request.
+    `start_frame` is the frame the lamps already show after the alert
+    start (or None).
+    """
+    name: str
+    frames: list[Optional[PreparedActions]]
+    timeline: array
+    start_frame: Optional[int]
+
+
+def _frame_actions(frame: Frame, snapshot: DeviceSnapshot, switches_power: bool) -> list[dict]:
+    if not frame.on:
+        return [on_off_action(False)]
+    # After a dark frame the lamp has to be turned back on first.
+    actions = [on_off_action(True)] if switches_power else []
+    if frame.color_hex is not None:
+        actions.append(color_action(hex_to_yandex_rgb(frame.color_hex), snapshot.color_model))
+    if frame.brightness is not None:
+        actions.append(brightness_action(frame.brightness))
+    return actions
+
+
+def compile_pattern(pattern: Pattern, snapshots: dict[str, DeviceSnapshot]) -> CompiledPattern:
+    """Build every request of the pattern up front; playing it only picks them."""
+    switches_power = "on" in pattern.touches
+    index_of: dict[Frame, int] = {}
+    frames: list[Optional[PreparedActions]] = []
+    timeline = array("H")
+    for frame in pattern.frames:
+        key = replace(frame, ticks=1)
+        if key not in index_of:
+            index_of[key] = len(frames)
+            actions = {
+                device_id: _frame_actions(key, snapshot, switches_power)
+                for device_id, snapshot in snapshots.items()
+            }
+            actions = {device_id: a for device_id, a in actions.items() if a}
+            frames.append(prepare_actions(actions) if actions else None)
+        timeline.extend([index_of[key]] * max(1, frame.ticks))
+
+    # The alert start turns the lamps on in the start color, which is all
+    # of frame 0 unless it also sets brightness.
+    first = pattern.frames[0]
+    start_frame = None
+    if first.on and first.brightness is None and first.color_hex == pattern.start_color_hex:
+        start_frame = timeline[0]
+    return CompiledPattern(pattern.name, frames, timeline, start_frame)
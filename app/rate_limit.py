@@ -0,0 +1,183 @@
+import asyncio
+import email.utils
+import logging
+import threading
+import time
+import weakref
+from typing import Optional
+
+from app.config import (
+    get_iot_device_rate_limit_burst,
+    get_iot_device_rate_limit_per_sec,
+    get_iot_rate_limit_burst,
+    get_iot_rate_limit_per_sec,
+    get_iot_rate_limit_reserve,
+)
+from app.metrics import IOT_RATE_LIMITED
+
+logger = logging.getLogger("iot-alert")
+
+# Used when the API throttles us without a usable Retry-After header.
+DEFAULT_BACKOFF_SEC = 1.0
+
+
+class RateLimited(Exception):
+    """No capacity right now and the caller asked not to wait."""
+
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens per second, at most `capacity`.
+    The last `reserve` tokens are kept for priority takes, and the bucket
+    can be paused until a deadline (server Retry-After).
+    """
+
+    def __init__(self, rate: float, capacity: float, reserve: float = 0.0) -> None:
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self.reserve = min(reserve, self.capacity - 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, priority: bool = False, now: Optional[float] = None) -> float:
+        """Seconds until one token can be taken (0 if it can be taken now)."""
+        now = time.monotonic() if now is None else now
+        if now < self.paused_until:
+            return self.paused_until - now
+        self._refill(now)
+        floor = 1.0 if priority else 1.0 + self.reserve
+        if self.tokens >= floor:
+            return 0.0
+        return (floor - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1.0
+
+    def pause(self, seconds: float) -> None:
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class RateLimiter:
+    """
+    Global bucket plus one bucket per device in front of the IoT API.
+    A request must get a token from the global bucket and from every
+    device it touches. Priority requests (state restore) may dip into the
+    reserve, so a busy blink loop can never starve the restore.
+    The buckets are shared by every event loop (the blocking wrappers run
+    their own), so each loop queues its waiters on its own lock.
+    """
+
+    def __init__(self) -> None:
+        self._global: Optional[TokenBucket] = None
+        self._devices: dict[str, TokenBucket] = {}
+        # asyncio.Lock is bound to the loop that first waits on it.
+        self._queues: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._buckets_lock = threading.Lock()
+
+    def _queue(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        with self._buckets_lock:
+            lock = self._queues.get(loop)
+            if lock is None:
+                lock = asyncio.Lock()
+                self._queues[loop] = lock
+        return lock
+
+    def _try_take(self, buckets: list[TokenBucket], priority: bool) -> float:
+        """Take a token from every bucket, or return how long to wait."""
+        with self._buckets_lock:
+            # Tokens are taken all-or-nothing, so check every bucket first.
+            delay = max(bucket.delay(priority) for bucket in buckets)
+            if delay <= 0:
+                for bucket in buckets:
+                    bucket.take()
+            return delay
+
+    def _global_bucket(self) -> Optional[TokenBucket]:
+        rate = get_iot_rate_limit_per_sec()
+        if rate <= 0:
+            return None
+        if self._global is None or self._global.rate != rate:
+            self._global = TokenBucket(
+                rate, get_iot_rate_limit_burst(), get_iot_rate_limit_reserve()
+            )
+        return self._global
+
+    def _device_bucket(self, device_id: str) -> Optional[TokenBucket]:
+        rate = get_iot_device_rate_limit_per_sec()
+        if rate <= 0:
+            return None
+        bucket = self._devices.get(device_id)
+        if bucket is None or bucket.rate != rate:
+            bucket = TokenBucket(
+                rate, get_iot_device_rate_limit_burst(), get_iot_rate_limit_reserve()
+            )
+            self._devices[device_id] = bucket
+        return bucket
+
+    def _buckets(self, device_ids) -> list[TokenBucket]:
+        with self._buckets_lock:
+            buckets = [self._global_bucket()]
+            buckets.extend(self._device_bucket(device_id) for device_id in device_ids)
+        return [bucket for bucket in buckets if bucket is not None]
+
+    async def acquire(
+        self,
+        device_ids=(),
+        priority: bool = False,
+        block: bool = True,
+    ) -> None:
+        """
+        Take one token from the global bucket and each device bucket.
+        With block=False raise RateLimited instead of waiting.
+        """
+        buckets = self._buckets(device_ids)
+        if not buckets:
+            return
+        while True:
+            delay = self._try_take(buckets, priority)
+            if delay <= 0:
+                return
+            if not block:
+                raise RateLimited(f"IoT API rate limit, retry in {delay:.2f}s")
+            if not priority:
+                # Waiting normal requests queue up; priority ones skip the line.
+                async with self._queue():
+                    await asyncio.sleep(delay)
+            else:
+                await asyncio.sleep(delay)
+
+    def penalize(self, retry_after_sec: Optional[float], device_ids=()) -> None:
+        """Pause the buckets after the API answered 429/503."""
+        seconds = retry_after_sec if retry_after_sec is not None else DEFAULT_BACKOFF_SEC
+        logger.warning("IoT API throttled us, pausing requests for %.1fs", seconds)
+        IOT_RATE_LIMITED.inc()
+        buckets = self._buckets(device_ids)
+        with self._buckets_lock:
+            for bucket in buckets:
+                bucket.pause(seconds)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After as seconds; accepts delta-seconds or an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        parsed = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, parsed.timestamp() - time.time())
+
+
+rate_limiter = RateLimiter()
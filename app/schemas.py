@@ -6,12 +6,25 @@ from pydantic import BaseModel
 class AlertRequest(BaseModel):
     color_hex: Optional[str] = None
     duration_sec: Optional[int] = None
+    device_ids: Optional[list[str]] = None
+    group: Optional[str] = None
 
 
 class AlertRainbowRequest(BaseModel):
     color_hex: Optional[str] = None
     color_hex_2: Optional[str] = None
     duration_sec: Optional[int] = None
+    device_ids: Optional[list[str]] = None
+    group: Optional[str] = None
+
+
+class AlertPatternRequest(BaseModel):
+    pattern: str
+    colors: Optional[list[str]] = None
+    interval_sec: Optional[float] = None
+    duration_sec: Optional[int] = None
+    device_ids: Optional[list[str]] = None
+    group: Optional[str] = None
 
 
 class CredentialsRequest(BaseModel):
@@ -35,3 +48,25 @@ class AlertSettingsRequest(BaseModel):
     color_hex_2: str
     duration_sec: int
     blink_interval_sec: float
+
+
+class TelegramChat(BaseModel):
+    id: Optional[int] = None
+    type: Optional[str] = None
+
+
+class TelegramMessage(BaseModel):
+    chat: Optional[TelegramChat] = None
+
+
+class TelegramUpdate(BaseModel):
+    """
+    The few fields of a Telegram update the bot looks at. Unknown fields
+    (text, entities, senders, other update types) are skipped unparsed.
+    """
+
+    update_id: Optional[int] = None
+    message: Optional[TelegramMessage] = None
+    edited_message: Optional[TelegramMessage] = None
+    channel_post: Optional[TelegramMessage] = None
+    edited_channel_post: Optional[TelegramMessage] = None
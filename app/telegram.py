@@ -0,0 +1,312 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import httpx
+
+from app.alert_queue import AlertQueueFull, alert_queue
+from app.config import (
+    get_alert_device_group,
+    get_alert_device_ids,
+    get_telegram_api_url,
+    get_telegram_bot_token,
+    get_telegram_debounce_extend,
+    get_telegram_debounce_sec,
+    get_telegram_dedup_size,
+    get_telegram_offset_path,
+    get_telegram_poll_timeout_sec,
+)
+from app.metrics import TELEGRAM_UPDATES
+from app.schemas import TelegramChat, TelegramMessage, TelegramUpdate
+
+logger = logging.getLogger("iot-alert")
+
+SUPPORTED_CHAT_TYPES = ("private", "group", "supergroup")
+MESSAGE_KEYS = ("message", "edited_message", "channel_post", "edited_channel_post")
+
+# Reconnect delays of the poller: full jitter, 1s doubling up to 30s.
+RECONNECT_BASE_DELAY_SEC = 1.0
+RECONNECT_MAX_DELAY_SEC = 30.0
+
+
+def _reconnect_delay(failures: int) -> float:
+    """Random delay before the next getUpdates after `failures` failures in a row."""
+    ceiling = RECONNECT_BASE_DELAY_SEC * 2 ** min(failures, 10)
+    return random.uniform(0, min(RECONNECT_MAX_DELAY_SEC, ceiling))
+
+
+def update_message(update: TelegramUpdate) -> Optional[TelegramMessage]:
+    """The message-like part of an update, or None for other update types."""
+    for key in MESSAGE_KEYS:
+        message = getattr(update, key)
+        if message is not None:
+            return message
+    return None
+
+
+class UpdateFilter:
+    """
+    Drops redelivered updates and collapses bursts. Telegram redelivers a
+    webhook update when the answer is slow, and a busy group can send
+    dozens of messages a second. A bounded LRU of update_ids catches the
+    first; a debounce window per (chat, target lamps) turns the second
+    into one alert that later messages extend instead of re-triggering.
+    """
+
+    def __init__(
+        self,
+        max_updates: Optional[int] = None,
+        window_sec: Optional[float] = None,
+        max_keys: int = 1024,
+    ) -> None:
+        self._max_updates = max_updates
+        self._window_sec = window_sec
+        self._max_keys = max_keys
+        self._seen: OrderedDict[int, None] = OrderedDict()
+        # Burst key -> (last trigger/extension time, alert_id).
+        self._bursts: OrderedDict[tuple, tuple[float, str]] = OrderedDict()
+
+    @property
+    def window_sec(self) -> float:
+        return self._window_sec if self._window_sec is not None else get_telegram_debounce_sec()
+
+    def is_duplicate(self, update_id: int) -> bool:
+        """Remember update_id; True if it was already seen recently."""
+        if update_id in self._seen:
+            self._seen.move_to_end(update_id)
+            return True
+        self._seen[update_id] = None
+        limit = self._max_updates or get_telegram_dedup_size()
+        while len(self._seen) > limit:
+            self._seen.popitem(last=False)
+        return False
+
+    def forget(self, update_id: int) -> None:
+        """Let a redelivery of a rejected update through."""
+        self._seen.pop(update_id, None)
+
+    def collapsed_into(self, key: tuple) -> Optional[str]:
+        """alert_id of the burst `key` belongs to, or None to start a new one."""
+        entry = self._bursts.get(key)
+        if entry is None or time.monotonic() - entry[0] >= self.window_sec:
+            return None
+        return entry[1]
+
+    def remember(self, key: tuple, alert_id: str) -> None:
+        self._bursts[key] = (time.monotonic(), alert_id)
+        self._bursts.move_to_end(key)
+        while len(self._bursts) > self._max_keys:
+            self._bursts.popitem(last=False)
+
+
+update_filter = UpdateFilter()
+
+
+def _burst_key(chat: TelegramChat) -> tuple:
+    # Telegram alerts always target the configured lamps.
+    return (chat.id, get_alert_device_group() or tuple(get_alert_device_ids()))
+
+
+async def dispatch_update(update: TelegramUpdate, mode: str = "webhook") -> dict:
+    """
+    Trigger the rainbow alert for one Telegram update. Shared by the
+    webhook and the long-polling consumer; `mode` only labels metrics.
+    Redelivered updates are ignored, and messages arriving within
+    TELEGRAM_DEBOUNCE_SEC of the chat's alert extend it (or are dropped
+    with TELEGRAM_DEBOUNCE_EXTEND=false) instead of queueing another.
+    Returns the webhook response body. AlertQueueFull and
+    KeyError/ValueError (bad alert targets) propagate to the caller.
+    """
+    update_id = update.update_id
+    if update_id is not None and update_filter.is_duplicate(update_id):
+        TELEGRAM_UPDATES.labels(mode, "duplicate").inc()
+        return {"ok": True, "ignored": True, "reason": "duplicate"}
+    message = update_message(update)
+    if message is None:
+        TELEGRAM_UPDATES.labels(mode, "ignored").inc()
+        return {"ok": True, "ignored": True}
+    chat = message.chat
+    if chat is None or chat.type not in SUPPORTED_CHAT_TYPES:
+        TELEGRAM_UPDATES.labels(mode, "unsupported_chat_type").inc()
+        return {"ok": True, "ignored": True, "reason": "unsupported_chat_type"}
+
+    try:
+        key = _burst_key(chat)
+        alert_id = update_filter.collapsed_into(key)
+        if alert_id is not None:
+            if not get_telegram_debounce_extend():
+                TELEGRAM_UPDATES.labels(mode, "debounced").inc()
+                return {"ok": True, "status": "debounced", "alert_id": alert_id}
+            if alert_queue.extend(alert_id):
+                update_filter.remember(key, alert_id)
+                TELEGRAM_UPDATES.labels(mode, "extended").inc()
+                return {"ok": True, "status": "extended", "alert_id": alert_id}
+            # That alert has already finished: start a new one.
+        status, alert_id = await alert_queue.submit("rainbow", source="telegram")
+    except (AlertQueueFull, KeyError, ValueError):
+        if update_id is not None:
+            update_filter.forget(update_id)
+        TELEGRAM_UPDATES.labels(mode, "rejected").inc()
+        raise
+    update_filter.remember(key, alert_id)
+    TELEGRAM_UPDATES.labels(mode, status).inc()
+    return {"ok": True, "status": status, "alert_id": alert_id}
+
+
+class TelegramApiError(Exception):
+    """Telegram Bot API answered ok=false."""
+
+    def __init__(self, data: dict) -> None:
+        super().__init__(data.get("description") or "Telegram API error")
+        self.error_code = data.get("error_code")
+        self.retry_after = (data.get("parameters") or {}).get("retry_after")
+
+
+class TelegramPoller:
+    """
+    getUpdates long-polling consumer, an alternative to the webhook that
+    needs no public URL (no ngrok tunnel). Each response is a batch of
+    updates dispatched in order; the next offset is confirmed to Telegram
+    by the following getUpdates call and saved to TELEGRAM_OFFSET_PATH,
+    so a restart neither replays nor loses updates. Network and API errors
+    reconnect with jittered exponential backoff.
+    """
+
+    def __init__(
+        self,
+        token: Optional[str] = None,
+        api_url: Optional[str] = None,
+        poll_timeout_sec: Optional[float] = None,
+        offset_path: Optional[str] = None,
+    ) -> None:
+        self._token = token
+        self._api_url = api_url
+        self._poll_timeout_sec = poll_timeout_sec
+        self._offset_path = offset_path
+        self._task: Optional[asyncio.Task] = None
+        self.offset: Optional[int] = None
+        self.failures = 0
+        self.processed = 0
+
+    @property
+    def offset_path(self) -> str:
+        return self._offset_path if self._offset_path is not None else get_telegram_offset_path()
+
+    def _load_offset(self) -> Optional[int]:
+        path = self.offset_path
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as handle:
+                return int(handle.read().strip())
+        except (OSError, ValueError):
+            logger.warning("ignoring unreadable Telegram offset file %s", path)
+            return None
+
+    def _save_offset(self, offset: int) -> None:
+        path = self.offset_path
+        if not path:
+            return
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as handle:
+            handle.write(str(offset))
+        os.replace(tmp_path, path)
+
+    async def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def _call(self, client: httpx.AsyncClient, method: str, **params) -> object:
+        resp = await client.post(f"/{method}", json=params)
+        try:
+            data = resp.json()
+        except ValueError:
+            resp.raise_for_status()
+            raise
+        if not data.get("ok"):
+            raise TelegramApiError(data)
+        return data.get("result")
+
+    async def run(self) -> None:
+        token = self._token or get_telegram_bot_token()
+        if not token:
+            logger.error("TELEGRAM_MODE=polling needs TELEGRAM_BOT_TOKEN, not polling")
+            return
+        api_url = (self._api_url or get_telegram_api_url()).rstrip("/")
+        poll_timeout = self._poll_timeout_sec or get_telegram_poll_timeout_sec()
+        self.offset = self._load_offset()
+        webhook_deleted = False
+        # The read timeout must outlast the server-side long poll.
+        async with httpx.AsyncClient(
+            base_url=f"{api_url}/bot{token}", timeout=httpx.Timeout(10.0, read=poll_timeout + 10)
+        ) as client:
+            logger.info("Telegram long polling started, offset=%s", self.offset)
+            while True:
+                try:
+                    if not webhook_deleted:
+                        # getUpdates answers 409 while a webhook is set.
+                        await self._call(client, "deleteWebhook")
+                        webhook_deleted = True
+                    params = {"timeout": int(poll_timeout), "allowed_updates": list(MESSAGE_KEYS)}
+                    if self.offset is not None:
+                        params["offset"] = self.offset
+                    updates = await self._call(client, "getUpdates", **params)
+                except (httpx.HTTPError, ValueError, TelegramApiError) as exc:
+                    delay = _reconnect_delay(self.failures)
+                    retry_after = getattr(exc, "retry_after", None)
+                    if retry_after:
+                        delay = max(delay, float(retry_after))
+                    self.failures += 1
+                    logger.warning(
+                        "Telegram getUpdates failed (%s), retrying in %.1fs", exc, delay
+                    )
+                    await asyncio.sleep(delay)
+                    continue
+                self.failures = 0
+                if updates:
+                    try:
+                        await self.process(updates)
+                    except Exception:
+                        # The poller must outlive any one batch.
+                        logger.exception("Telegram updates batch failed")
+
+    async def process(self, updates: list[dict]) -> None:
+        """
+        Dispatch one getUpdates batch in order, then persist the offset.
+        The offset is confirmed to Telegram by the next getUpdates even if
+        saving it fails, so that only costs replays after a restart.
+        """
+        update_ids = []
+        for update in updates:
+            update_id = update.get("update_id") if isinstance(update, dict) else None
+            if isinstance(update_id, int):
+                update_ids.append(update_id)
+            try:
+                await dispatch_update(TelegramUpdate.model_validate(update), mode="polling")
+            except AlertQueueFull as exc:
+                logger.warning("Telegram update %s dropped: %s", update_id, exc)
+            except Exception:
+                # One bad update must not stall the ones behind it.
+                logger.exception("Telegram update %s failed", update_id)
+            self.processed += 1
+        if not update_ids:
+            logger.warning("Telegram updates batch without update_id, offset unchanged")
+            return
+        self.offset = max(update_ids) + 1
+        try:
+            self._save_offset(self.offset)
+        except OSError as exc:
+            logger.warning("cannot save Telegram offset to %s: %s", self.offset_path, exc)
+
+
+telegram_poller = TelegramPoller()
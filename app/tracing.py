@@ -0,0 +1,247 @@
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+from app.config import get_tracing_exporter, get_tracing_path
+
+logger = logging.getLogger("iot-alert")
+
+# How often span() re-reads TRACING_EXPORTER/TRACING_PATH.
+CONFIG_CHECK_SEC = 1.0
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("iot_alert_span", default=None)
+
+
+def _new_id(size: int) -> str:
+    return os.urandom(size).hex()
+
+
+def trace_id_for(alert_id: str) -> str:
+    """
+    Trace ID of an alert (32 hex chars, W3C/OpenTelemetry sized).
+    Derived from the alert ID, so a request merged into a running alert
+    and the queue worker that starts it later agree without passing it.
+    """
+    return hashlib.blake2b(alert_id.encode(), digest_size=16).hexdigest()
+
+
+class Span:
+    """One timed step of an alert or IoT request."""
+
+    __slots__ = (
+        "name", "trace_id", "span_id", "parent", "attributes",
+        "start_time", "_started", "duration_sec", "error", "_token", "_exporter", "otel_span",
+    )
+
+    def __init__(
+        self,
+        exporter,
+        name: str,
+        trace_id: str,
+        parent: Optional["Span"],
+        attributes: dict,
+    ) -> None:
+        self._exporter = exporter
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = _new_id(8)
+        self.parent = parent
+        self.attributes = attributes
+        self.start_time = 0.0
+        self._started = 0.0
+        self.duration_sec = 0.0
+        self.error: Optional[str] = None
+        self._token = None
+        self.otel_span = None
+
+    def set_attribute(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def __enter__(self) -> "Span":
+        self.start_time = time.time()
+        self._started = time.perf_counter()
+        self._token = _current_span.set(self)
+        self._exporter.on_start(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.duration_sec = time.perf_counter() - self._started
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.error = exc_type.__name__
+        try:
+            self._exporter.export(self)
+        except Exception:
+            logger.exception("exporting span %s failed", self.name)
+        return False
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent is not None else None,
+            "name": self.name,
+            "start": self.start_time,
+            "duration_ms": round(self.duration_sec * 1000, 3),
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    """Shared span used while tracing is off: costs one attribute lookup."""
+
+    trace_id = None
+
+    def set_attribute(self, key: str, value) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class JsonLinesExporter:
+    """Append every finished span as one JSON line; works fully offline."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._handle = None
+
+    def on_start(self, span: Span) -> None:
+        pass
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), separators=(",", ":"), default=str) + "\n"
+        with self._lock:
+            if self._handle is None:
+                # Line buffered: a crash loses at most the span being written.
+                self._handle = open(self.path, "a", encoding="utf-8", buffering=1)
+            self._handle.write(line)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._handle is not None:
+                self._handle.close()
+                self._handle = None
+
+
+class OpenTelemetryExporter:
+    """
+    Mirror spans into OpenTelemetry (needs opentelemetry-api; the SDK and
+    its exporter are configured by the application as usual).
+    OTel assigns its own IDs; ours is kept in the "alert.trace_id" attribute.
+    """
+
+    def __init__(self) -> None:
+        from opentelemetry import trace
+
+        self._trace = trace
+        self._tracer = trace.get_tracer("iot-alert")
+
+    def on_start(self, span: Span) -> None:
+        context = None
+        if span.parent is not None and span.parent.otel_span is not None:
+            context = self._trace.set_span_in_context(span.parent.otel_span)
+        span.otel_span = self._tracer.start_span(
+            span.name, context=context, start_time=int(span.start_time * 1e9)
+        )
+
+    def export(self, span: Span) -> None:
+        otel_span = span.otel_span
+        if otel_span is None:
+            return
+        otel_span.set_attribute("alert.trace_id", span.trace_id)
+        for key, value in span.attributes.items():
+            if isinstance(value, (bool, int, float, str)):
+                otel_span.set_attribute(key, value)
+        if span.error is not None:
+            otel_span.set_status(self._trace.Status(self._trace.StatusCode.ERROR, span.error))
+        otel_span.end(end_time=int((span.start_time + span.duration_sec) * 1e9))
+        span.otel_span = None
+
+    def shutdown(self) -> None:
+        pass
+
+
+class Tracer:
+    """
+    Spans around the alert hot path: snapshot, state apply, every IoT
+    request, every blink tick and the restore. Tracing is off unless
+    TRACING_EXPORTER is "jsonl" or "otel"; off, span() returns a shared
+    no-op span, so the hooks cost next to nothing.
+    """
+
+    def __init__(self) -> None:
+        self._exporter = None
+        self._exporter_key: Optional[tuple] = None
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def _make_exporter(self, kind: str, path: str):
+        if kind == "jsonl":
+            return JsonLinesExporter(path)
+        if kind == "otel":
+            try:
+                return OpenTelemetryExporter()
+            except ImportError:
+                logger.warning("TRACING_EXPORTER=otel but opentelemetry is not installed")
+                return None
+        if kind not in ("", "none"):
+            logger.warning("unknown TRACING_EXPORTER %r, tracing is off", kind)
+        return None
+
+    def exporter(self):
+        """Current exporter (None when off); rebuilt when the config changes."""
+        now = time.monotonic()
+        if now - self._checked_at < CONFIG_CHECK_SEC:
+            return self._exporter
+        self._checked_at = now
+        key = (get_tracing_exporter(), get_tracing_path())
+        if key != self._exporter_key:
+            with self._lock:
+                if key != self._exporter_key:
+                    if self._exporter is not None:
+                        self._exporter.shutdown()
+                    self._exporter = self._make_exporter(*key)
+                    self._exporter_key = key
+        return self._exporter
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter() is not None
+
+    def span(self, name: str, trace_id: Optional[str] = None, **attributes):
+        """
+        Context manager timing one step. Nested spans become children of
+        the current one (per task/thread); `trace_id` starts a new trace.
+        """
+        exporter = self.exporter()
+        if exporter is None:
+            return NOOP_SPAN
+        parent = None if trace_id is not None else _current_span.get()
+        if trace_id is None:
+            trace_id = parent.trace_id if parent is not None else _new_id(16)
+        return Span(exporter, name, trace_id, parent, attributes)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._exporter is not None:
+                self._exporter.shutdown()
+            self._exporter = None
+            self._exporter_key = None
+            self._checked_at = float("-inf")
+
+
+tracer = Tracer()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Bulk color conversion: the scalar functions in a loop vs the batch ones
+(NumPy when installed, otherwise the pure-Python fallback), for a random
+palette and a long HSV gradient.
+
+Usage: python3 bench/bench_colors.py [--colors 10000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import timeit
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(BENCH_DIR)
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Scalar vs batch color conversion.")
+    parser.add_argument("--colors", type=int, default=10000)
+    count = parser.parse_args().colors
+
+    from app import colors
+
+    rng = random.Random(1)
+    values = [rng.randrange(0x1000000) for _ in range(count)]
+    hexes = [f"#{value:06X}" for value in values]
+    hsv = colors._rgb_int_to_hsv.__wrapped__
+
+    def scalar_hsv():
+        # Uncached, like a palette much larger than the memo cache.
+        return [{"h": h, "s": s, "v": v} for h, s, v in map(hsv, values)]
+
+    def scalar_gradient():
+        return [
+            colors.mix_colors(0xFF0000, 0x0000FF, i / (count - 1), "hsv")
+            for i in range(count)
+        ]
+
+    results = {
+        "hex -> int: scalar": lambda: [colors.hex_to_yandex_rgb(c) for c in hexes],
+        "hex -> int: batch": lambda: colors.hex_colors_to_rgb(hexes),
+        "int -> hsv: scalar": scalar_hsv,
+        "int -> hsv: batch": lambda: colors.rgb_ints_to_yandex_hsv(values),
+        "hsv gradient: scalar": scalar_gradient,
+        "hsv gradient: batch": lambda: colors.interpolate_colors(
+            0xFF0000, 0x0000FF, count, "hsv"
+        ),
+    }
+    backend = "numpy" if colors.np is not None else "pure Python"
+    print(f"{count} colors, batch backend: {backend}")
+    for name, call in results.items():
+        total = min(timeit.repeat(call, number=1, repeat=5))
+        print(f"{name:<22} {total * 1000:8.2f} ms  {total / count * 1e6:6.2f} us/color")
+
+
+if __name__ == "__main__":
+    main()
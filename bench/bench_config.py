@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Cost of config getters: re-parsing config.yaml per call vs the cached snapshot.
+
+Usage: python3 bench/bench_config.py [--calls 2000]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import timeit
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(BENCH_DIR)
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+import yaml
+
+CONFIG = {
+    "IOT_TOKEN": "bench-token",
+    "IOT_DEVICE_ID": "bench-device",
+    "IOT_HOST": "https://api.iot.yandex.net",
+    "ALERT_COLOR_HEX": "#FF0000",
+    "ALERT_COLOR_HEX_2": "#E30306",
+    "ALERT_DURATION_SEC": "10",
+    "ALERT_BLINK_INTERVAL": "0.5",
+    "TELEGRAM_BOT_TOKEN": "bench-telegram",
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Cost of a config getter, parsed vs cached.")
+    parser.add_argument("--calls", type=int, default=2000)
+    calls = parser.parse_args().calls
+    handle = tempfile.NamedTemporaryFile("w", suffix=".yaml", delete=False)
+    with handle:
+        yaml.safe_dump(CONFIG, handle)
+    for key in CONFIG:
+        os.environ.pop(key, None)
+
+    from app import config
+
+    config.DEFAULT_CONFIG_PATH = handle.name
+
+    def uncached_getter():
+        # What every getter did before: parse the YAML file on each call.
+        return float(config._load_yaml_config().get("ALERT_BLINK_INTERVAL", "0.5"))
+
+    results = {
+        "uncached getter": timeit.timeit(uncached_getter, number=calls),
+        "cached getter": timeit.timeit(config.get_alert_blink_interval_sec, number=calls),
+        "get_settings()": timeit.timeit(config.get_settings, number=calls),
+    }
+    for name, total in results.items():
+        print(f"{name:<16} {total / calls * 1e6:9.2f} us/call")
+    os.unlink(handle.name)
+
+
+if __name__ == "__main__":
+    main()
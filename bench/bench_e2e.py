@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+End-to-end alert benchmark against the local Yandex IoT stub: run_alert,
+run_alert_rainbow, GET /setup/devices and the Telegram webhook, plus
+regression checks for snapshots taken from a mid-alert inventory read
+and for alerts interrupted by the service shutdown.
+
+Per scenario it reports IoT requests per round (and 429/500 answers),
+p50/p99 latency of single IoT requests and of the scenario itself,
+achieved blink rate and restore time. IoT request and restore timings
+come from the tracing spans (jsonl exporter into a temp file). Exits
+with status 1 when an alert fails or goes unrecorded, or a lamp is not
+back in its original state, so it can guard against regressions without
+a lamp or a token.
+
+Usage: python3 bench/bench_e2e.py [--rounds 3] [--duration 2] [--latency-ms 30]
+       [--jitter-ms 20] [--error-rate 0.05] [--rate-limit 10] [--webhooks 50]
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(BENCH_DIR)
+for path in (PROJECT_ROOT, BENCH_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from stub_server import DEVICE_IDS, INITIAL_STATE, start_stub_server
+
+
+def _percentile(samples: list[float], fraction: float) -> float:
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+class SpanLog:
+    """Reads the spans appended to the tracing file since the last call."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.offset = 0
+
+    def read_new(self) -> list[dict]:
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, "r", encoding="utf-8") as handle:
+            handle.seek(self.offset)
+            lines = handle.readlines()
+            self.offset = handle.tell()
+        return [json.loads(line) for line in lines if line.endswith("\n")]
+
+
+def _lamps_restored(server) -> bool:
+    return all(server.device_state(device_id) == INITIAL_STATE for device_id in DEVICE_IDS)
+
+
+def _report(name: str, rounds: int, server, spans: list[dict], wall: list[float],
+            blink_hz: list[float], ok: bool) -> None:
+    requests = sum(server.requests.values())
+    iot_ms = [span["duration_ms"] for span in spans if span["name"] == "iot.request"]
+    restore_ms = [span["duration_ms"] for span in spans if span["name"] == "alert.restore"]
+    print(f"{name}  ({rounds} rounds{'' if ok else ', FAILED'})")
+    print(
+        f"  iot requests/round={requests / rounds:.1f} "
+        f"(GET {sum(v for k, v in server.requests.items() if k.startswith('GET')) / rounds:.1f}, "
+        f"POST {server.requests.get('POST /v1.0/devices/actions', 0) / rounds:.1f}) "
+        f"429={server.throttled} 500={server.errors}"
+    )
+    if iot_ms:
+        print(
+            f"  iot request p50={_percentile(iot_ms, 0.5):.1f}ms "
+            f"p99={_percentile(iot_ms, 0.99):.1f}ms"
+        )
+    print(
+        f"  {'scenario':<11} p50={_percentile(wall, 0.5) * 1000:.1f}ms "
+        f"p99={_percentile(wall, 0.99) * 1000:.1f}ms"
+    )
+    if blink_hz:
+        print(f"  blink achieved={sum(blink_hz) / len(blink_hz):.2f}Hz")
+    if restore_ms:
+        print(
+            f"  restore p50={_percentile(restore_ms, 0.5):.1f}ms "
+            f"p99={_percentile(restore_ms, 0.99):.1f}ms"
+        )
+
+
+def bench_alerts(args, server, span_log: SpanLog) -> bool:
+    from app.alerts import run_alert, run_alert_rainbow
+
+    all_ok = True
+    for name, run in (("run_alert", run_alert), ("run_alert_rainbow", run_alert_rainbow)):
+        server.reset_counters()
+        span_log.read_new()
+        wall, blink_hz, ok = [], [], True
+        for _ in range(args.rounds):
+            started = time.perf_counter()
+            result = run(duration_sec=args.duration)
+            wall.append(time.perf_counter() - started)
+            ok = ok and result is not None and result.status == "finished"
+            ok = ok and _lamps_restored(server)
+            if result is not None and result.blink is not None:
+                blink_hz.append(result.blink.achieved_rate_hz)
+        _report(name, args.rounds, server, span_log.read_new(), wall, blink_hz, ok)
+        all_ok = all_ok and ok
+    return all_ok
+
+
+def bench_stale_inventory(server, span_log: SpanLog) -> bool:
+    """
+    Regression check: /user/info read in the middle of an alert (lamps in
+    the alert colors, the way /setup/devices or a group resolve would)
+    must not become the next alert's snapshot. The stub is slowed down so
+    the last blink tick is cut off at the deadline and drops the cached
+    statuses, which used to send the next snapshot to that inventory.
+    """
+    import asyncio
+
+    from app.alerts import schedule_alert, schedule_alert_rainbow
+    from app.inventory import load_inventory
+    from app.iot_client_async import close_async_client
+
+    lamps = DEVICE_IDS[:2]
+
+    async def scenario() -> bool:
+        try:
+            alert, _ = await schedule_alert_rainbow(duration_sec=3, device_ids=lamps)
+            await asyncio.sleep(2)
+            await load_inventory(use_cache=False)
+            first = await alert.task
+            alert, _ = await schedule_alert(duration_sec=1, device_ids=lamps)
+            second = await alert.task
+            return first.status == second.status == "finished"
+        finally:
+            await close_async_client()
+
+    knobs = (server.latency_sec, server.jitter_sec, server.error_rate, server.rate_limit_per_sec)
+    interval = os.environ["ALERT_BLINK_INTERVAL"]
+    server.latency_sec, server.jitter_sec, server.error_rate, server.rate_limit_per_sec = (
+        0.3, 0.0, 0.0, 0.0
+    )
+    os.environ["ALERT_BLINK_INTERVAL"] = "0.4"
+    server.reset_counters()
+    span_log.read_new()
+    try:
+        started = time.perf_counter()
+        ok = asyncio.run(scenario()) and _lamps_restored(server)
+        wall = [time.perf_counter() - started]
+    finally:
+        server.latency_sec, server.jitter_sec, server.error_rate, server.rate_limit_per_sec = knobs
+        os.environ["ALERT_BLINK_INTERVAL"] = interval
+    _report("inventory read mid-alert", 1, server, span_log.read_new(), wall, [], ok)
+    return ok
+
+
+def _wait_idle(client, timeout_sec: float) -> bool:
+    deadline = time.monotonic() + timeout_sec
+    while time.monotonic() < deadline:
+        if not client.get("/alerts").json()["alerts"] and client.get(
+            "/alerts/queue"
+        ).json()["depth"] == 0:
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def bench_api(args, server, span_log: SpanLog) -> bool:
+    from fastapi.testclient import TestClient
+
+    from app.api import app
+    from app.inventory import invalidate_inventory
+    from app.iot_client import invalidate_device_state
+
+    with TestClient(app) as client:
+        ok = True
+        # The alert scenarios above already loaded the inventory: drop it
+        # before each cold round so the stub is really asked.
+        for name, cold in (("GET /setup/devices", True), ("GET /setup/devices (warm)", False)):
+            server.reset_counters()
+            span_log.read_new()
+            wall = []
+            for _ in range(args.rounds):
+                if cold:
+                    invalidate_inventory()
+                    invalidate_device_state()
+                started = time.perf_counter()
+                resp = client.get("/setup/devices")
+                wall.append(time.perf_counter() - started)
+            round_ok = resp.status_code == 200 and len(resp.json()["devices"]) == len(DEVICE_IDS)
+            _report(name, args.rounds, server, span_log.read_new(), wall, [], round_ok)
+            ok = ok and round_ok
+
+        server.reset_counters()
+        wall = []
+        for index in range(args.webhooks):
+            update = {
+                "update_id": 10_000 + index,
+                "message": {"chat": {"id": 1 + index % 3, "type": "group"}, "text": "alert"},
+            }
+            started = time.perf_counter()
+            resp = client.post("/telegram/webhook", json=update)
+            wall.append(time.perf_counter() - started)
+            ok = ok and resp.status_code == 200
+        ok = _wait_idle(client, args.duration * 4 + 30) and ok
+        recent = client.get("/alerts").json()["recent"]
+        blink_hz = [item["blink"]["achieved_rate_hz"] for item in recent if item.get("blink")]
+        ok = ok and all(item["status"] == "finished" for item in recent) and _lamps_restored(server)
+        _report(
+            f"POST /telegram/webhook x{args.webhooks}", 1, server, span_log.read_new(),
+            wall, blink_hz, ok,
+        )
+    return ok
+
+
+def bench_shutdown(server, span_log: SpanLog) -> bool:
+    """
+    Regression check: stopping the service in the middle of an alert must
+    put the lamps back and still record the alert in the history, as
+    "cancelled".
+    """
+    from fastapi.testclient import TestClient
+
+    from app.api import app
+    from app.history import alert_history
+
+    os.environ["ALERT_HISTORY_PATH"] = os.path.join(
+        tempfile.mkdtemp(prefix="bench-e2e-"), "history.db"
+    )
+    server.reset_counters()
+    span_log.read_new()
+    try:
+        with TestClient(app) as client:
+            resp = client.post("/startAlertRainbow", json={"duration_sec": 60})
+            alert_id = resp.json().get("alert_id")
+            deadline = time.monotonic() + 10
+            running = False
+            while not running and time.monotonic() < deadline:
+                running = any(
+                    alert["alert_id"] == alert_id and alert["status"] == "running"
+                    for alert in client.get("/alerts").json()["alerts"]
+                )
+                time.sleep(0.05)
+            # Leaving the block runs the lifespan shutdown.
+            started = time.perf_counter()
+        wall = [time.perf_counter() - started]
+        rows = alert_history.query(10, None, None, None, None)["items"]
+    finally:
+        os.environ["ALERT_HISTORY_PATH"] = ""
+    statuses = [row["status"] for row in rows if row["alert_id"] == alert_id]
+    ok = running and statuses == ["cancelled"] and _lamps_restored(server)
+    _report("shutdown mid-alert", 1, server, span_log.read_new(), wall, [], ok)
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="End-to-end alert benchmark (offline).")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--duration", type=int, default=2, help="alert duration, seconds")
+    parser.add_argument("--blink-interval", type=float, default=0.5)
+    parser.add_argument("--latency-ms", type=float, default=30.0)
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of 500 answers")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="stub 429 above this rps")
+    parser.add_argument("--webhooks", type=int, default=50)
+    args = parser.parse_args()
+
+    server = start_stub_server(
+        latency_sec=args.latency_ms / 1000,
+        jitter_sec=args.jitter_ms / 1000,
+        error_rate=args.error_rate,
+        rate_limit_per_sec=args.rate_limit,
+        seed=1,
+    )
+    trace_path = os.path.join(tempfile.mkdtemp(prefix="bench-e2e-"), "traces.jsonl")
+    os.environ.update({
+        "IOT_HOST": f"http://127.0.0.1:{server.server_port}",
+        "IOT_TOKEN": "bench-token",
+        "IOT_DEVICE_ID": DEVICE_IDS[0],
+        "IOT_DEVICE_IDS": ",".join(DEVICE_IDS),
+        "ALERT_DURATION_SEC": str(args.duration),
+        "ALERT_BLINK_INTERVAL": str(args.blink_interval),
+        "ALERT_HISTORY_PATH": "",
+        "TELEGRAM_OFFSET_PATH": "",
+        "TRACING_EXPORTER": "jsonl",
+        "TRACING_PATH": trace_path,
+    })
+    # Keep INFO logs of the client out of the measurements.
+    logging.getLogger("iot-alert").setLevel(logging.ERROR)
+    print(
+        f"stub latency {args.latency_ms:.0f}+{args.jitter_ms:.0f}ms, "
+        f"errors {args.error_rate:.0%}, 429 above {args.rate_limit or 'inf'} rps, "
+        f"{len(DEVICE_IDS)} lamps, alerts {args.duration}s"
+    )
+    span_log = SpanLog(trace_path)
+    ok = bench_alerts(args, server, span_log)
+    ok = bench_stale_inventory(server, span_log) and ok
+    ok = bench_api(args, server, span_log) and ok
+    ok = bench_shutdown(server, span_log) and ok
+    server.shutdown()
+    if not ok:
+        print("FAILED: an alert did not finish or was not recorded, or a lamp was not restored")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Per-request latency of IoT calls: bare requests vs the pooled client.
+
+Usage: python3 bench/bench_iot_client.py [--requests 500]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(BENCH_DIR)
+for path in (PROJECT_ROOT, BENCH_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import requests
+
+from stub_server import DEVICE_ID, start_stub_server
+
+
+def _report(name: str, samples: list[float]) -> None:
+    samples = sorted(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(
+        f"{name:<24} mean={statistics.mean(samples) * 1000:.3f}ms "
+        f"p50={statistics.median(samples) * 1000:.3f}ms p99={p99 * 1000:.3f}ms"
+    )
+
+
+def _measure(call, count: int) -> list[float]:
+    samples = []
+    for _ in range(count):
+        started = time.perf_counter()
+        call()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+async def _measure_async(call, count: int) -> list[float]:
+    samples = []
+    for _ in range(count):
+        started = time.perf_counter()
+        await call()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+async def _measure_pooled(count: int) -> None:
+    # One loop for all calls: the blocking wrappers get a fresh client each.
+    from app.iot_client_async import close_async_client, get_device_status, turn_on
+
+    try:
+        # Past the state cache: this compares requests, not cache hits.
+        _report(
+            "pooled get_device_status",
+            await _measure_async(lambda: get_device_status(use_cache=False), count),
+        )
+        _report("pooled turn_on", await _measure_async(turn_on, count))
+    finally:
+        await close_async_client()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="IoT request latency, bare vs pooled (offline).")
+    parser.add_argument("--requests", type=int, default=500)
+    count = parser.parse_args().requests
+    server = start_stub_server()
+    host = f"http://127.0.0.1:{server.server_port}"
+    os.environ["IOT_HOST"] = host
+    os.environ["IOT_TOKEN"] = "bench-token"
+    os.environ["IOT_DEVICE_ID"] = DEVICE_ID
+    # Measure the client, not the rate limiter.
+    os.environ["IOT_RATE_LIMIT_PER_SEC"] = "0"
+    os.environ["IOT_DEVICE_RATE_LIMIT_PER_SEC"] = "0"
+
+    from app.iot_client import _headers
+
+    url = f"{host}/v1.0/devices/{DEVICE_ID}"
+
+    def bare_get():
+        resp = requests.get(url, headers=_headers(), timeout=5)
+        resp.raise_for_status()
+        resp.json()
+
+    # Keep INFO logs of the client out of the measurements.
+    logging.getLogger("iot-alert").setLevel(logging.WARNING)
+
+    _report("bare requests.get", _measure(bare_get, count))
+    asyncio.run(_measure_pooled(count))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
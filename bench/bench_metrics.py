@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Recording overhead of the in-process metrics vs a no-op call, and the
+cost of rendering /metrics.
+
+Usage: python3 bench/bench_metrics.py [--calls 200000]
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(BENCH_DIR)
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Metrics recording and rendering cost.")
+    parser.add_argument("--calls", type=int, default=200000)
+    calls = parser.parse_args().calls
+
+    from app.metrics import MetricsRegistry, record_iot_request
+
+    registry = MetricsRegistry()
+    counter = registry.counter("bench_total", "bench")
+    labelled = registry.counter("bench_labelled_total", "bench", ("endpoint", "method", "status"))
+    histogram = registry.histogram("bench_seconds", "bench", ("endpoint", "method"))
+    child = labelled.labels("/v1.0/devices/actions", "POST", "200")
+
+    def noop():
+        pass
+
+    results = {
+        "no-op call": timeit.timeit(noop, number=calls),
+        "counter.inc()": timeit.timeit(counter.inc, number=calls),
+        "labels().inc()": timeit.timeit(
+            lambda: labelled.labels("/v1.0/devices/actions", "POST", "200").inc(),
+            number=calls,
+        ),
+        "cached child.inc()": timeit.timeit(child.inc, number=calls),
+        "histogram.observe()": timeit.timeit(
+            lambda: histogram.labels("/v1.0/devices/actions", "POST").observe(0.042),
+            number=calls,
+        ),
+        "record_iot_request()": timeit.timeit(
+            lambda: record_iot_request("POST", "/v1.0/devices/actions", 200, 0.042),
+            number=calls,
+        ),
+    }
+    for name, total in results.items():
+        print(f"{name:<22} {total / calls * 1e9:9.0f} ns/call")
+
+    from app.metrics import registry as app_registry
+
+    renders = 1000
+    total = timeit.timeit(app_registry.render, number=renders)
+    print(f"{'render /metrics':<22} {total / renders * 1e6:9.1f} us/call")
+
+
+if __name__ == "__main__":
+    main()
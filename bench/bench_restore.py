@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Alert start and restore: one request per capability (with the old fixed
+sleeps) vs one minimal multi-capability request from apply_device_states().
+
+Usage: python3 bench/bench_restore.py [--rounds 20] [--latency-ms 50]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(BENCH_DIR)
+for path in (PROJECT_ROOT, BENCH_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from stub_server import DEVICE_IDS, start_stub_server
+
+
+def _report(name: str, samples: list[float], requests_count: int, rounds: int) -> None:
+    print(
+        f"{name:<28} mean={statistics.mean(samples) * 1000:.1f}ms "
+        f"p50={statistics.median(samples) * 1000:.1f}ms "
+        f"requests/round={requests_count / rounds:.1f}"
+    )
+
+
+async def _measure(server, call, rounds: int) -> tuple[list[float], int]:
+    samples = []
+    before = server.action_requests
+    for _ in range(rounds):
+        started = time.perf_counter()
+        await call()
+        samples.append(time.perf_counter() - started)
+    return samples, server.action_requests - before
+
+
+async def run(server, rounds: int) -> None:
+    from app.iot_client import (
+        DeviceSnapshot,
+        brightness_action,
+        color_action,
+        color_state_action,
+        on_off_action,
+    )
+    from app.iot_client_async import apply_device_states, close_async_client, send_device_actions
+    from app.alerts import _alert_state
+
+    rgb_value = 0xFF0000
+    # Worst case: lamps were off, so every capability has to change.
+    snapshots = {
+        device_id: DeviceSnapshot(
+            available=True,
+            was_on=False,
+            color_state={"instance": "hsv", "value": {"h": 0, "s": 0, "v": 100}},
+            color_model="hsv",
+            brightness=70,
+        )
+        for device_id in DEVICE_IDS
+    }
+
+    async def start_per_capability():
+        await send_device_actions({d: [on_off_action(True)] for d in snapshots})
+        await send_device_actions({d: [color_action(rgb_value, "hsv")] for d in snapshots})
+
+    async def start_combined():
+        targets = {d: _alert_state(s, rgb_value) for d, s in snapshots.items()}
+        await apply_device_states(targets, snapshots)
+
+    async def restore_per_capability():
+        await send_device_actions(
+            {d: [color_state_action(s.color_state)] for d, s in snapshots.items()}
+        )
+        await asyncio.sleep(0.3)
+        await send_device_actions(
+            {d: [brightness_action(s.brightness)] for d, s in snapshots.items()}
+        )
+        await asyncio.sleep(0.2)
+        await send_device_actions({d: [on_off_action(False)] for d in snapshots})
+
+    async def restore_combined():
+        current = {
+            d: DeviceSnapshot(True, True, None, s.color_model, s.brightness)
+            for d, s in snapshots.items()
+        }
+        await apply_device_states(snapshots, current)
+
+    for name, call in (
+        ("start: per capability", start_per_capability),
+        ("start: apply_device_states", start_combined),
+        ("restore: per capability", restore_per_capability),
+        ("restore: apply_device_states", restore_combined),
+    ):
+        samples, requests_count = await _measure(server, call, rounds)
+        _report(name, samples, requests_count, rounds)
+    await close_async_client()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Alert start/restore request patterns (offline).")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    args = parser.parse_args()
+    rounds, latency_ms = args.rounds, args.latency_ms
+    server = start_stub_server(latency_sec=latency_ms / 1000)
+    os.environ["IOT_HOST"] = f"http://127.0.0.1:{server.server_port}"
+    os.environ["IOT_TOKEN"] = "bench-token"
+    os.environ["IOT_DEVICE_ID"] = DEVICE_IDS[0]
+    # Measure the request pattern, not the rate limiter.
+    os.environ["IOT_RATE_LIMIT_PER_SEC"] = "0"
+    os.environ["IOT_DEVICE_RATE_LIMIT_PER_SEC"] = "0"
+
+    # Keep INFO logs of the client out of the measurements.
+    logging.getLogger("iot-alert").setLevel(logging.WARNING)
+    print(f"stub latency {latency_ms:.0f}ms, {len(DEVICE_IDS)} lamps, {rounds} rounds")
+    asyncio.run(run(server, rounds))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
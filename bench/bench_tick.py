@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+CPU and allocation cost of one blink tick, without the network: the
+color conversion with and without the cache, building the
+/devices/actions request from colors on every tick vs picking the one
+prepared once per alert, and the whole send_device_actions() path with
+either (httpx mock transport, the state cache, events and logging
+included).
+
+Usage: python3 bench/bench_tick.py [--ticks 5000] [--lamps 3]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(BENCH_DIR)
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+COLORS = ("#FF0000", "#E3C803")
+
+
+def _measure(name: str, tick, ticks: int) -> None:
+    """Run tick(i) `ticks` times; report CPU per tick and peak bytes allocated by one tick."""
+    for i in range(100):
+        tick(i)
+    started = time.process_time()
+    for i in range(ticks):
+        tick(i)
+    cpu_us = (time.process_time() - started) / ticks * 1e6
+
+    samples = min(ticks, 200)
+    tracemalloc.start()
+    peak_total = 0
+    for i in range(samples):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        tick(i)
+        peak_total += tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    print(f"{name:<34} {cpu_us:8.1f} us/tick {peak_total / samples / 1024:8.1f} KiB peak/tick")
+
+
+def _response(device_ids: list[str]) -> dict:
+    return {
+        "status": "ok",
+        "devices": [
+            {
+                "id": device_id,
+                "capabilities": [{
+                    "type": "devices.capabilities.color_setting",
+                    "state": {"instance": "hsv", "action_result": {"status": "DONE"}},
+                }],
+            }
+            for device_id in device_ids
+        ],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Cost of one blink tick (offline).")
+    parser.add_argument("--ticks", type=int, default=5000)
+    parser.add_argument("--lamps", type=int, default=3)
+    args = parser.parse_args()
+    ticks, lamps = args.ticks, args.lamps
+    os.environ.update({
+        "IOT_HOST": "http://iot.bench",
+        "IOT_TOKEN": "bench-token",
+        "IOT_RATE_LIMIT_PER_SEC": "0",
+        "IOT_DEVICE_RATE_LIMIT_PER_SEC": "0",
+    })
+
+    import httpx
+
+    from app.colors import _rgb_int_to_hsv, hex_to_yandex_rgb, rgb_int_to_yandex_hsv
+    from app.iot_client import DeviceSnapshot, color_action, prepare_actions
+    from app.iot_client_async import AsyncIotClient, _async_clients, send_device_actions
+    from app.patterns import blink, compile_pattern
+
+    # The service logs at INFO; keep the formatting cost, drop the output.
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, logging.StreamHandler):
+            handler.setStream(open(os.devnull, "w"))
+
+    device_ids = [f"lamp-{i}" for i in range(lamps)]
+    snapshots = {
+        device_id: DeviceSnapshot(True, True, None, "hsv" if i % 2 else "rgb", 70)
+        for i, device_id in enumerate(device_ids)
+    }
+    compiled = compile_pattern(blink(list(COLORS)), snapshots)
+
+    def rebuild_actions(i: int) -> dict:
+        rgb_value = hex_to_yandex_rgb(COLORS[i % 2])
+        return {
+            device_id: [color_action(rgb_value, snapshot.color_model)]
+            for device_id, snapshot in snapshots.items()
+        }
+
+    rgb_values = [hex_to_yandex_rgb(color) for color in COLORS]
+    print(f"{lamps} lamps, {ticks} ticks")
+    _measure(
+        "convert color: colorsys", lambda i: _rgb_int_to_hsv.__wrapped__(rgb_values[i % 2]), ticks
+    )
+    _measure("convert color: cached", lambda i: rgb_int_to_yandex_hsv(rgb_values[i % 2]), ticks)
+    _measure(
+        "build request: rebuild per tick", lambda i: prepare_actions(rebuild_actions(i)), ticks
+    )
+    _measure("build request: compiled", lambda i: compiled.frames[i % 2], ticks)
+
+    response = _response(device_ids)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    client = AsyncIotClient()
+    client.client = httpx.AsyncClient(
+        transport=httpx.MockTransport(lambda request: httpx.Response(200, json=response))
+    )
+    _async_clients[loop] = client
+
+    def send_rebuilt(i: int) -> None:
+        loop.run_until_complete(send_device_actions(rebuild_actions(i)))
+
+    def send_compiled(i: int) -> None:
+        loop.run_until_complete(send_device_actions(compiled.frames[i % 2]))
+
+    _measure("send_device_actions: rebuilt", send_rebuilt, ticks // 5)
+    _measure("send_device_actions: compiled", send_compiled, ticks // 5)
+    loop.run_until_complete(client.aclose())
+    loop.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Load test of POST /telegram/webhook: fires synthetic Telegram updates
+(realistic group messages, edits, channel posts, service updates and
+redeliveries) at the endpoint with fixed concurrency and reports
+sustained requests/s and latency percentiles.
+
+By default the app runs in-process (httpx ASGI transport, lamps on the
+local IoT stub), which measures the handler itself; --url targets a
+running server instead.
+
+Usage: python3 bench/bench_webhook.py [--updates 5000] [--concurrency 32]
+       [--chats 50] [--url http://127.0.0.1:8000]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(BENCH_DIR)
+for path in (PROJECT_ROOT, BENCH_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import httpx
+
+from stub_server import DEVICE_IDS, start_stub_server
+
+
+def _percentile(samples: list[float], fraction: float) -> float:
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def make_updates(count: int, chats: int, seed: int = 1) -> list[bytes]:
+    """Pre-encoded update bodies, so the client side costs next to nothing."""
+    rng = random.Random(seed)
+    bodies = []
+    update_id = 500_000_000
+    for index in range(count):
+        if index and rng.random() < 0.05:
+            # Telegram redelivers an update it did not get a quick answer for.
+            bodies.append(bodies[-1])
+            continue
+        update_id += 1
+        chat_id = -1_000_000_000 - rng.randrange(chats)
+        message = {
+            "message_id": index,
+            "from": {
+                "id": 10_000 + rng.randrange(1000),
+                "is_bot": False,
+                "first_name": "User",
+                "username": f"user{rng.randrange(1000)}",
+                "language_code": "ru",
+            },
+            "chat": {"id": chat_id, "title": "Alerts", "type": "supergroup"},
+            "date": 1_760_000_000 + index,
+            "text": "Тревога! " * rng.randint(1, 20),
+            "entities": [{"offset": 0, "length": 7, "type": "bold"}],
+        }
+        roll = rng.random()
+        if roll < 0.8:
+            update = {"update_id": update_id, "message": message}
+        elif roll < 0.9:
+            update = {"update_id": update_id, "edited_message": {**message, "edit_date": 1}}
+        elif roll < 0.95:
+            message["chat"] = {"id": chat_id, "title": "News", "type": "channel"}
+            update = {"update_id": update_id, "channel_post": message}
+        else:
+            update = {
+                "update_id": update_id,
+                "my_chat_member": {"chat": message["chat"], "date": message["date"]},
+            }
+        bodies.append(json.dumps(update, ensure_ascii=False).encode("utf-8"))
+    return bodies
+
+
+async def fire(client: httpx.AsyncClient, bodies: list[bytes], concurrency: int) -> tuple:
+    latencies: list[float] = []
+    statuses: dict[int, int] = {}
+    position = 0
+
+    async def worker() -> None:
+        nonlocal position
+        while position < len(bodies):
+            body = bodies[position]
+            position += 1
+            started = time.perf_counter()
+            resp = await client.post(
+                "/telegram/webhook", content=body, headers={"Content-Type": "application/json"}
+            )
+            latencies.append(time.perf_counter() - started)
+            statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, statuses, time.perf_counter() - started
+
+
+async def run(args) -> None:
+    bodies = make_updates(args.updates, args.chats)
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=30) as client:
+            latencies, statuses, elapsed = await fire(client, bodies, args.concurrency)
+    else:
+        from app.alert_queue import alert_queue
+        from app.api import app, lifespan
+
+        async with lifespan(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(
+                transport=transport, base_url="http://bench", timeout=30
+            ) as client:
+                # Warm-up: first request pays for imports and the inventory.
+                await fire(client, make_updates(50, args.chats, seed=2), 4)
+                latencies, statuses, elapsed = await fire(client, bodies, args.concurrency)
+            print(f"alert queue: {alert_queue.snapshot()['enqueued']} alerts enqueued")
+
+    print(
+        f"{len(bodies)} updates, concurrency {args.concurrency}: "
+        f"{len(bodies) / elapsed:.0f} req/s, statuses {statuses}"
+    )
+    print(
+        f"latency p50={_percentile(latencies, 0.5) * 1000:.2f}ms "
+        f"p95={_percentile(latencies, 0.95) * 1000:.2f}ms "
+        f"p99={_percentile(latencies, 0.99) * 1000:.2f}ms "
+        f"max={max(latencies) * 1000:.2f}ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test of /telegram/webhook.")
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--url", help="running server; default is in-process")
+    args = parser.parse_args()
+
+    if not args.url:
+        server = start_stub_server()
+        os.environ.update({
+            "IOT_HOST": f"http://127.0.0.1:{server.server_port}",
+            "IOT_TOKEN": "bench-token",
+            "IOT_DEVICE_ID": DEVICE_IDS[0],
+            "IOT_DEVICE_IDS": ",".join(DEVICE_IDS),
+            "ALERT_DURATION_SEC": "1",
+            "ALERT_HISTORY_PATH": "",
+            "TELEGRAM_MODE": "webhook",
+        })
+        logging.getLogger("iot-alert").setLevel(logging.ERROR)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
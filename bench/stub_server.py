@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Yandex IoT API used by the benchmarks.
+
+Serves /v1.0/user/info, /v1.0/devices/{id} and /v1.0/devices/actions
+for a few stateful lamps (actions really change what the next status
+read returns), with configurable latency, jitter, error rate and a
+429 rate limit, so alert flows can be measured without a real lamp.
+
+Usage: python3 bench/stub_server.py [--port 8081] [--latency-ms 50]
+       [--jitter-ms 20] [--error-rate 0.05] [--rate-limit 10]
+"""
+
+import argparse
+import copy
+import json
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+DEVICE_ID = "stub-lamp"
+DEVICE_IDS = [DEVICE_ID, "stub-lamp-2", "stub-lamp-3"]
+GROUP_ID = "stub-group"
+ROOM_ID = "stub-room"
+HOUSEHOLD_ID = "stub-household"
+
+INITIAL_STATE = {
+    "on": True,
+    "color": {"instance": "hsv", "value": {"h": 0, "s": 0, "v": 100}},
+    "brightness": 70,
+}
+
+
+def _device_status(device_id: str, state: Optional[dict] = None) -> dict:
+    state = state or INITIAL_STATE
+    return {
+        "status": "ok",
+        "id": device_id,
+        "name": f"Stub lamp {device_id}",
+        "type": "devices.types.light",
+        "room": ROOM_ID,
+        "household_id": HOUSEHOLD_ID,
+        "groups": [GROUP_ID],
+        "state": "online",
+        "capabilities": [
+            {
+                "type": "devices.capabilities.on_off",
+                "state": {"instance": "on", "value": state["on"]},
+            },
+            {
+                "type": "devices.capabilities.color_setting",
+                "parameters": {"color_model": "hsv"},
+                "state": state["color"],
+            },
+            {
+                "type": "devices.capabilities.range",
+                "parameters": {"instance": "brightness"},
+                "state": {"instance": "brightness", "value": state["brightness"]},
+            },
+        ],
+    }
+
+
+def _endpoint(method: str, path: str) -> str:
+    if path.startswith("/v1.0/devices/") and path != "/v1.0/devices/actions":
+        path = "/v1.0/devices/{id}"
+    return f"{method} {path}"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; avoid Nagle + delayed ACK stalls.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, data: dict, headers: Optional[dict] = None) -> None:
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _reply(self, data: dict) -> None:
+        self._send(200, data)
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _admit(self) -> bool:
+        """Simulate latency, throttling and failures; False if already answered."""
+        server = self.server
+        server.record(_endpoint(self.command, self.path))
+        delay = server.latency_sec
+        if server.jitter_sec:
+            delay += server.random.uniform(0, server.jitter_sec)
+        if delay:
+            time.sleep(delay)
+        retry_after = server.throttle()
+        if retry_after is not None:
+            server.count("throttled")
+            self._send(
+                429,
+                {"status": "error", "message": "Too Many Requests"},
+                {"Retry-After": f"{retry_after:.0f}"},
+            )
+            return False
+        if server.error_rate and server.random.random() < server.error_rate:
+            server.count("errors")
+            self._send(500, {"status": "error", "message": "stub failure"})
+            return False
+        return True
+
+    def do_GET(self):
+        if not self._admit():
+            return
+        server = self.server
+        if self.path == "/v1.0/user/info":
+            self._reply({
+                "status": "ok",
+                "rooms": [{"id": ROOM_ID, "name": "Stub room", "devices": DEVICE_IDS}],
+                "groups": [{"id": GROUP_ID, "name": "Stub lamps", "devices": DEVICE_IDS}],
+                "households": [{"id": HOUSEHOLD_ID, "name": "Stub home"}],
+                "devices": [
+                    _device_status(device_id, server.device_state(device_id))
+                    for device_id in DEVICE_IDS
+                ],
+            })
+        elif self.path.startswith("/v1.0/devices/"):
+            device_id = self.path.rsplit("/", 1)[-1]
+            self._reply(_device_status(device_id, server.device_state(device_id)))
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        # Read the body first so a refused request keeps the connection usable.
+        body = self._read_body()
+        if not self._admit():
+            return
+        self.server.count("action_requests")
+        payload = json.loads(body or b"{}")
+        devices = []
+        for device in payload.get("devices", []):
+            actions = device.get("actions", [])
+            self.server.apply_actions(device.get("id"), actions)
+            devices.append({
+                "id": device.get("id"),
+                "capabilities": [
+                    {
+                        "type": action.get("type"),
+                        "state": {
+                            "instance": (action.get("state") or {}).get("instance"),
+                            "action_result": {"status": "DONE"},
+                        },
+                    }
+                    for action in actions
+                ],
+            })
+        self._reply({"status": "ok", "devices": devices})
+
+
+class StubServer(ThreadingHTTPServer):
+    """
+    The stub with its knobs and counters. `requests` counts requests per
+    "METHOD /path" (device IDs collapsed), including refused ones;
+    `throttled` and `errors` count 429 and 500 answers.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address,
+        latency_sec: float = 0.0,
+        jitter_sec: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limit_per_sec: float = 0.0,
+        retry_after_sec: float = 1.0,
+        seed: Optional[int] = None,
+    ) -> None:
+        super().__init__(address, StubHandler)
+        self.latency_sec = latency_sec
+        self.jitter_sec = jitter_sec
+        self.error_rate = error_rate
+        self.rate_limit_per_sec = rate_limit_per_sec
+        self.retry_after_sec = retry_after_sec
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._recent: deque[float] = deque()
+        self._devices = {device_id: copy.deepcopy(INITIAL_STATE) for device_id in DEVICE_IDS}
+        self.requests: Counter = Counter()
+        self.action_requests = 0
+        self.throttled = 0
+        self.errors = 0
+
+    def handle_error(self, request, client_address) -> None:
+        # Clients cancel requests at alert deadlines; that is not a stub bug.
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+    def record(self, endpoint: str) -> None:
+        with self._lock:
+            self.requests[endpoint] += 1
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def reset_counters(self) -> None:
+        with self._lock:
+            self.requests.clear()
+            self.action_requests = self.throttled = self.errors = 0
+
+    def throttle(self) -> Optional[float]:
+        """Sliding one-second window; Retry-After seconds when over the limit."""
+        if self.rate_limit_per_sec <= 0:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            while self._recent and now - self._recent[0] >= 1.0:
+                self._recent.popleft()
+            if len(self._recent) >= self.rate_limit_per_sec:
+                return self.retry_after_sec
+            self._recent.append(now)
+        return None
+
+    def device_state(self, device_id: str) -> dict:
+        with self._lock:
+            state = self._devices.get(device_id) or INITIAL_STATE
+            return copy.deepcopy(state)
+
+    def set_device_state(self, device_id: str, **state) -> None:
+        with self._lock:
+            self._devices.setdefault(device_id, copy.deepcopy(INITIAL_STATE)).update(state)
+
+    def apply_actions(self, device_id: str, actions: list[dict]) -> None:
+        with self._lock:
+            state = self._devices.setdefault(device_id, copy.deepcopy(INITIAL_STATE))
+            for action in actions:
+                kind = action.get("type")
+                action_state = action.get("state") or {}
+                if kind == "devices.capabilities.on_off":
+                    state["on"] = bool(action_state.get("value"))
+                elif kind == "devices.capabilities.color_setting":
+                    state["color"] = {
+                        "instance": action_state.get("instance"),
+                        "value": action_state.get("value"),
+                    }
+                elif kind == "devices.capabilities.range":
+                    value = action_state.get("value", 0)
+                    if action_state.get("relative"):
+                        value += state["brightness"]
+                    state["brightness"] = max(1, min(100, value))
+
+
+def start_stub_server(
+    latency_sec: float = 0.0,
+    port: int = 0,
+    jitter_sec: float = 0.0,
+    error_rate: float = 0.0,
+    rate_limit_per_sec: float = 0.0,
+    retry_after_sec: float = 1.0,
+    seed: Optional[int] = None,
+) -> StubServer:
+    """
+    Start the stub in a daemon thread and return the server.
+    server.action_requests counts POST /devices/actions calls that got
+    through; server.requests counts every request per endpoint.
+    """
+    server = StubServer(
+        ("127.0.0.1", port),
+        latency_sec=latency_sec,
+        jitter_sec=jitter_sec,
+        error_rate=error_rate,
+        rate_limit_per_sec=rate_limit_per_sec,
+        retry_after_sec=retry_after_sec,
+        seed=seed,
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of 500 answers")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="requests/s before 429")
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    args = parser.parse_args()
+    srv = start_stub_server(
+        latency_sec=args.latency_ms / 1000,
+        port=args.port,
+        jitter_sec=args.jitter_ms / 1000,
+        error_rate=args.error_rate,
+        rate_limit_per_sec=args.rate_limit,
+        retry_after_sec=args.retry_after,
+    )
+    print(f"Yandex IoT stub on http://127.0.0.1:{srv.server_port}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        srv.shutdown()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Telegram Bot API: getUpdates long polling and
+deleteWebhook, enough to drive TelegramPoller without a real bot.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+CHAT_ID = 1001
+
+
+class TelegramStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, data: dict, status: int = 200) -> None:
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _params(self) -> dict:
+        url = urlsplit(self.path)
+        params = dict(parse_qsl(url.query))
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            params.update(json.loads(self.rfile.read(length) or b"{}"))
+        return params
+
+    def _handle(self) -> None:
+        server = self.server
+        params = self._params()
+        method = urlsplit(self.path).path.rsplit("/", 1)[-1]
+        if not urlsplit(self.path).path.startswith(f"/bot{server.token}/"):
+            self._reply({"ok": False, "error_code": 401, "description": "Unauthorized"}, 401)
+            return
+        if server.fail_next > 0:
+            server.fail_next -= 1
+            self._reply(
+                {"ok": False, "error_code": 502, "description": "Bad Gateway (stub)"}, 502
+            )
+            return
+        if method == "deleteWebhook":
+            server.webhook_deletes += 1
+            self._reply({"ok": True, "result": True})
+        elif method == "getUpdates":
+            server.get_updates_calls += 1
+            self._reply({"ok": True, "result": server.wait_updates(params)})
+        else:
+            self._reply({"ok": False, "error_code": 404, "description": "Not Found"}, 404)
+
+    do_GET = _handle
+    do_POST = _handle
+
+
+class TelegramStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, token: str) -> None:
+        super().__init__(address, TelegramStubHandler)
+        self.token = token
+        self.fail_next = 0
+        self.get_updates_calls = 0
+        self.webhook_deletes = 0
+        self._updates: list[dict] = []
+        self._next_update_id = 1
+        self._changed = threading.Condition()
+
+    def push_update(self, update: dict) -> int:
+        """Queue a raw update; update_id is assigned unless given."""
+        with self._changed:
+            update.setdefault("update_id", self._next_update_id)
+            self._next_update_id = max(self._next_update_id, update["update_id"]) + 1
+            self._updates.append(update)
+            self._changed.notify_all()
+        return update["update_id"]
+
+    def push_message(self, chat_type: str = "private", text: str = "alert") -> int:
+        return self.push_update({
+            "message": {
+                "message_id": self._next_update_id,
+                "date": int(time.time()),
+                "chat": {"id": CHAT_ID, "type": chat_type},
+                "text": text,
+            }
+        })
+
+    def pending(self) -> int:
+        with self._changed:
+            return len(self._updates)
+
+    def wait_updates(self, params: dict) -> list[dict]:
+        """Like Telegram: confirm everything below offset, then long-poll."""
+        offset = int(params.get("offset") or 0)
+        timeout = float(params.get("timeout") or 0)
+        limit = int(params.get("limit") or 100)
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+            while not self._updates:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._changed.wait(remaining)
+            return list(self._updates[:limit])
+
+
+def start_telegram_stub(token: str = "stub-token", port: int = 0) -> TelegramStubServer:
+    """Start the stub in a daemon thread; point TELEGRAM_API_URL at it."""
+    server = TelegramStubServer(("127.0.0.1", port), token)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    srv = start_telegram_stub(port=8082)
+    print(f"Telegram Bot API stub on http://127.0.0.1:{srv.server_port} (token stub-token)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        srv.shutdown()
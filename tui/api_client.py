@@ -2,9 +2,10 @@
 
 from __future__ import annotations
 
+import json
 import os
 from dataclasses import dataclass
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Iterator, Optional
 
 import requests
 
@@ -24,9 +25,9 @@ class AlertApiClient:
         response.raise_for_status()
         return response.json() if response.content else {}
 
-    def _get(self, path: str) -> Dict[str, Any]:
+    def _get(self, path: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         url = f"{self.base_url}{path}"
-        response = requests.get(url, timeout=self.timeout_sec)
+        response = requests.get(url, params=params, timeout=self.timeout_sec)
         response.raise_for_status()
         return response.json() if response.content else {}
 
@@ -41,6 +42,40 @@ class AlertApiClient:
             {"color_hex": color_hex, "color_hex_2": color_hex_2, "duration_sec": duration_sec},
         )
 
+    def stop_alert(self, alert_id: str) -> Dict[str, Any]:
+        return self._post(f"/stopAlert/{alert_id}", {})
+
+    def list_alerts(self) -> Dict[str, Any]:
+        return self._get("/alerts")
+
+    def alert_history(
+        self,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        device_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        params = {"limit": limit, "cursor": cursor, "device_id": device_id}
+        return self._get(
+            "/alerts/history", {key: value for key, value in params.items() if value is not None}
+        )
+
+    def iter_events(self, types: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Follow GET /events; yields {"type": ..., "data": {...}} per event."""
+        url = f"{self.base_url}/events"
+        params = {"types": types} if types else None
+        # No read timeout: the stream is idle between events (pings only).
+        with requests.get(
+            url, params=params, stream=True, timeout=(self.timeout_sec, None)
+        ) as response:
+            response.raise_for_status()
+            event_type = None
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith("event:"):
+                    event_type = line[6:].strip()
+                elif line.startswith("data:") and event_type:
+                    yield {"type": event_type, "data": json.loads(line[5:])}
+                    event_type = None
+
     def save_credentials(
         self,
         yandex_token: str,
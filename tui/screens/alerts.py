@@ -5,8 +5,21 @@ from textual.containers import Container, Horizontal, Vertical
 from textual.screen import Screen
 from textual.widgets import Button, Footer, Header, Input, Static
 
+from app.colors import hex_colors_to_rgb, interpolate_colors
 from tui.widgets import HintBar, SectionTitle
 
+PREVIEW_WIDTH = 32
+
+
+def preview_markup(color_1: str, color_2: str) -> str:
+    """Strip of colors from color_1 to color_2 (through HSV) as Rich markup."""
+    try:
+        start, end = hex_colors_to_rgb([color_1, color_2])
+    except ValueError:
+        return "Invalid color"
+    strip = interpolate_colors(start, end, PREVIEW_WIDTH, space="hsv")
+    return "".join(f"[on #{value:06x}] [/]" for value in strip)
+
 
 class AlertsScreen(Screen):
     """Configure and trigger alert scenarios."""
@@ -41,6 +54,18 @@ class AlertsScreen(Screen):
                 yield Static("Preview canvas", classes="card", id="preview")
         yield Footer()
 
+    def on_mount(self) -> None:
+        self._update_preview()
+
+    def on_input_changed(self, event: Input.Changed) -> None:
+        if event.input.id in ("color-1", "color-2"):
+            self._update_preview()
+
+    def _update_preview(self) -> None:
+        color_1 = self.query_one("#color-1", Input).value
+        color_2 = self.query_one("#color-2", Input).value
+        self.query_one("#preview", Static).update(preview_markup(color_1, color_2))
+
     def action_back(self) -> None:
         self.app.pop_screen()
 
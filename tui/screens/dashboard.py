@@ -1,10 +1,14 @@
 """Dashboard screen sketch for the TUI."""
 
+from datetime import datetime
+
+import requests
 from textual.app import ComposeResult
 from textual.containers import Container, Horizontal, Vertical
 from textual.screen import Screen
 from textual.widgets import Button, DataTable, Footer, Header, Static
 
+from tui.api_client import AlertApiClient
 from tui.widgets import HintBar, SectionTitle
 
 
@@ -39,15 +43,24 @@ class DashboardScreen(Screen):
     def on_mount(self) -> None:
         table = self.query_one("#events", DataTable)
         table.add_columns("Time", "Event")
-        table.add_rows(
-            [
-                ("12:30", "Rainbow alert started"),
-                ("12:25", "Alert finished"),
-                ("12:20", "Device online"),
-            ]
-        )
+        table.add_rows(self._recent_events())
         table.cursor_type = "row"
 
+    @staticmethod
+    def _recent_events() -> list[tuple[str, str]]:
+        try:
+            page = AlertApiClient().alert_history(limit=20)
+        except requests.RequestException:
+            return [("--:--", "Alert history unavailable")]
+        rows = [
+            (
+                datetime.fromtimestamp(item["started_at"]).strftime("%H:%M"),
+                f"{item['kind'].capitalize()} alert {item['status']} ({item['source']})",
+            )
+            for item in page.get("items", [])
+        ]
+        return rows or [("--:--", "No alerts yet")]
+
     def action_start_alert(self) -> None:
         self.app.push_screen("alerts")
 
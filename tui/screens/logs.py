@@ -1,10 +1,14 @@
 """Logs screen sketch for the TUI."""
 
+from datetime import datetime
+
+import requests
 from textual.app import ComposeResult
 from textual.containers import Vertical
 from textual.screen import Screen
 from textual.widgets import Footer, Header, Log
 
+from tui.api_client import AlertApiClient
 from tui.widgets import HintBar, SectionTitle
 
 
@@ -27,7 +31,23 @@ class LogsScreen(Screen):
     def on_mount(self) -> None:
         log = self.query_one("#event-log", Log)
         log.write_line("[system] TUI started")
-        log.write_line("[api] Waiting for next request")
+        self.run_worker(self._follow_events, thread=True, exclusive=True)
+
+    def _follow_events(self) -> None:
+        """Stream /events into the log (runs in a worker thread)."""
+        log = self.query_one("#event-log", Log)
+        try:
+            for event in AlertApiClient().iter_events():
+                data = event["data"]
+                time_str = datetime.fromtimestamp(data.get("ts", 0)).strftime("%H:%M:%S")
+                subject = (
+                    data.get("alert_id") or data.get("device_id") or data.get("device_ids") or ""
+                )
+                status = data.get("status") or ""
+                line = f"{time_str} [{event['type']}] {subject} {status}".rstrip()
+                self.app.call_from_thread(log.write_line, line)
+        except requests.RequestException as exc:
+            self.app.call_from_thread(log.write_line, f"[system] event stream unavailable: {exc}")
 
     def action_back(self) -> None:
         self.app.pop_screen()